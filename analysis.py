@@ -1,38 +1,104 @@
 import argparse
 import os
 from pathlib import Path
-from typing import Sequence
-import matplotlib.pyplot as plt
+from typing import NamedTuple, Sequence
+import numpy as np
 import pandas as pd
-import matplotlib
-# 设置matplotlib支持中文显示
-plt.rcParams['font.sans-serif'] = ['Arial Unicode MS', 'SimHei', 'Microsoft YaHei', 'PingFang SC', 'STHeiti']  # 优先使用这些字体
-plt.rcParams['axes.unicode_minus'] = False  # 解决负号显示问题
+from plots import (
+    PLOT_FORMATS,
+    minor_subcategories_job,
+    render_plots,
+    spending_trend_job,
+    subcategory_pie_job,
+)
+from profiling import add_profile_arguments, peak_rss_mb, profiled, span
+from rollup import build_rollup, ensure_rollup, merge_rollups
+from storage import iter_table, read_table, table_path
+from trends import Trends, compute_trends, expense_merchants, trends_for_period
+
+
+# 分析用到的列；其余列（状态、备注、交易主键等）不读入内存
+ANALYSIS_COLUMNS = [
+    "Date",
+    "Time",
+    "in/out",
+    "Amount",
+    "Category",
+    "sub_category",
+    "Product_Description",
+    "Payment_Method",
+    "Counterparty",
+]
+PERIOD_FREQUENCIES = {"month": "M", "quarter": "Q", "year": "Y"}
+PERIOD_NAMES = {"month": "按月", "quarter": "按季度", "year": "按年"}
+
+
+def load_transactions(
+    file_path: Path, filters: list[tuple[str, str, object]] | None = None
+) -> pd.DataFrame:
+    """Load the columns analysis needs from the labeled transactions table.
+
+    Text columns that repeat (categories, descriptions, times) are held as
+    categoricals; ``filters`` are passed on to ``read_table``.
+    """
+    with span("analysis.load") as step:
+        df = compact_transactions(read_table(file_path, filters=filters, columns=ANALYSIS_COLUMNS))
+        step.rows_out = len(df)
+    return df
+
+
+def compact_transactions(df: pd.DataFrame) -> pd.DataFrame:
+    for column in ["Time", "Product_Description", "Counterparty"]:
+        if column in df.columns:
+            df[column] = df[column].astype("category")
+    return df
+
+
+def _labels(values: pd.Series, fill: str) -> pd.Categorical:
+    """``fillna(fill)`` and strip, computed once per distinct value instead of per row."""
+    codes, uniques = pd.factorize(values)
+    labels = pd.Index(np.append(np.asarray(uniques, dtype=object), fill)).astype(str).str.strip()
+    categories = labels.unique().sort_values()
+    return pd.Categorical.from_codes(categories.get_indexer(labels)[codes], categories=categories)
+
 
-def load_transactions(file_path: Path) -> pd.DataFrame:
-    """Load the raw CSV transactions into a DataFrame."""
-    return pd.read_csv(file_path)
+def parse_times(times: pd.Series) -> pd.Series:
+    """``to_timedelta(times, errors="coerce").fillna(0)`` evaluated per distinct value.
+
+    A day has at most 86,400 distinct ``HH:MM:SS`` strings, so parsing the
+    uniques and mapping them back is far cheaper than parsing every row.
+    """
+    codes, uniques = pd.factorize(times)
+    parsed = pd.to_timedelta(np.asarray(uniques, dtype=object), errors="coerce")
+    parsed = np.append(parsed.fillna(pd.Timedelta(0)).to_numpy(), np.timedelta64(0, "ns"))
+    return pd.Series(parsed[codes], index=times.index)
 
 
 def clean_transactions(df: pd.DataFrame) -> pd.DataFrame:
-    """Normalize datetime, amount, and flow descriptors."""
-    cleaned = df.copy()
-    cleaned["datetime"] = pd.to_datetime(
-        cleaned["Date"].fillna("") + " " + cleaned["Time"].fillna(""),
-        errors="coerce",
-    )
-    cleaned["Amount"] = pd.to_numeric(cleaned["Amount"], errors="coerce").fillna(0.0)
+    """Normalize datetime, amount, and flow descriptors.
+
+    Untouched columns are shared with ``df`` rather than copied.
+    """
+    # Date/Amount/in/out arrive typed from read_table; only Time is still text.
     flow_map = {1: "expense", 0: "transfer", -1: "income"}
-    cleaned["flow"] = cleaned["in/out"].map(flow_map).fillna("unknown")
-    cleaned["Category"] = cleaned["Category"].fillna("uncategorized").astype(str).str.strip()
-    cleaned["sub_category"] = (
-        cleaned["sub_category"].fillna("uncategorized").astype(str).str.strip()
-    )
+    with span("analysis.clean", len(df)) as step:
+        columns = {column: df[column] for column in df.columns}
+        columns["datetime"] = df["Date"] + parse_times(df["Time"])
+        columns["Amount"] = df["Amount"].astype(float).fillna(0.0)
+        # 分组键只转换一次为分类类型，后续筛选与分组都在整数编码上进行
+        columns["flow"] = df["in/out"].astype(float).map(flow_map).fillna("unknown").astype("category")
+        columns["Category"] = _labels(df["Category"], "uncategorized")
+        columns["sub_category"] = _labels(df["sub_category"], "uncategorized")
+        cleaned = pd.DataFrame(columns, copy=False)
+        step.rows_out = len(cleaned)
     return cleaned
 
 
 def parse_period(period: Sequence[str] | None) -> tuple[pd.Timestamp | None, pd.Timestamp | None]:
-    """Return normalized start and end timestamps when a period is supplied."""
+    """Return normalized start and end timestamps when a period is supplied.
+
+    An END given as a plain date covers that whole day.
+    """
     if not period:
         return None, None
     start = pd.to_datetime(period[0], errors="coerce")
@@ -41,6 +107,8 @@ def parse_period(period: Sequence[str] | None) -> tuple[pd.Timestamp | None, pd.
         raise ValueError("Both START and END must be valid dates when using --period.")
     if start > end:
         raise ValueError("Start date must not be later than end date.")
+    if end == end.normalize():
+        end = end + pd.Timedelta(days=1) - pd.Timedelta(nanoseconds=1)
     return start, end
 
 
@@ -57,128 +125,147 @@ def filter_transactions_by_period(
     return df[mask].copy()
 
 
-def summarize_cash_flow(df: pd.DataFrame) -> tuple[float, float, float]:
-    expenses = df[df["flow"] == "expense"]["Amount"].sum()
-    income = df[df["flow"] == "income"]["Amount"].sum()
-    return income, expenses, income - expenses
-
-
-def spending_by_category_sub_category(df: pd.DataFrame) -> tuple[pd.Series, pd.Series]:
-    expenses = df[df["flow"] == "expense"]
-    by_cat = (
-        expenses.groupby("Category", dropna=False)["Amount"]
-        .sum()
-        .sort_values(ascending=False)
-    )
-    by_sub = (
-        expenses.groupby("sub_category", dropna=False)["Amount"]
-        .sum()
-        .sort_values(ascending=False)
+class Summary(NamedTuple):
+    income: float
+    expenses: float
+    net: float
+    by_category: pd.Series
+    by_sub_category: pd.Series
+    daily: pd.Series
+    top_expenses: pd.DataFrame
+    investment_total: float
+    investment_by_sub: pd.Series
+    trends: Trends | None = None
+
+
+def _ranked(amounts: pd.DataFrame, column: str) -> pd.Series:
+    """Sum rollup rows by ``column`` and rank them like ``groupby(column).sum().sort_values``."""
+    totals = amounts.groupby(column, observed=True)["amount_sum"].sum().rename("Amount")
+    totals.index = totals.index.astype(object)
+    return totals.sort_index().sort_values(ascending=False)
+
+
+def select_top_expenses(df: pd.DataFrame, top_n: int = 10) -> pd.DataFrame:
+    """Largest expense rows by partial selection; ties keep their original order."""
+    is_expense = (df["flow"] == "expense").to_numpy()
+    expense_amounts = pd.Series(df["Amount"].to_numpy()[is_expense])
+    return df.iloc[np.flatnonzero(is_expense)[expense_amounts.nlargest(top_n).index]]
+
+
+def summary_from_rollup(rollup: pd.DataFrame, top_expenses: pd.DataFrame) -> Summary:
+    """Roll a daily rollup (see ``rollup.build_rollup``) up into the report summary.
+
+    Cash flow, category and sub-category rankings, the daily series and
+    investment totals only need the pre-aggregated sums; the top expenses
+    are detail rows and are passed in.
+    """
+    expense = rollup[rollup["flow"] == "expense"]
+    income = float(rollup.loc[rollup["flow"] == "income", "amount_sum"].sum())
+    expenses = float(expense["amount_sum"].sum())
+
+    daily = expense.groupby("date")["amount_sum"].sum().sort_index().rename("Amount")
+    daily.index = pd.Index(daily.index.date, name="date")
+
+    # 只对类别取值做小写比较，再按编码映射回各行；编码 -1（缺失）落在追加的 False 上
+    category = rollup["Category"].astype("category").cat
+    is_investment = np.append(category.categories.str.lower() == "investment", False)
+    investment = rollup[is_investment[category.codes]]
+
+    return Summary(
+        income=income,
+        expenses=expenses,
+        net=income - expenses,
+        by_category=_ranked(expense, "Category"),
+        by_sub_category=_ranked(expense, "sub_category"),
+        daily=daily,
+        top_expenses=top_expenses,
+        investment_total=float(investment["amount_sum"].sum()),
+        investment_by_sub=_ranked(investment, "sub_category"),
     )
-    return by_cat, by_sub
-
-
-def daily_spending_summary(df: pd.DataFrame) -> pd.Series:
-    expenses = df[df["flow"] == "expense"].copy()
-    expenses["date"] = expenses["datetime"].dt.date
-    return expenses.groupby("date")["Amount"].sum().sort_index()
 
 
-def top_expenses(df: pd.DataFrame, top_n: int = 10) -> pd.DataFrame:
-    expense = df[df["flow"] == "expense"]
-    return expense.sort_values("Amount", ascending=False).head(top_n)
-
+def summarize(df: pd.DataFrame, top_n: int = 10) -> Summary:
+    """Compute every report summary from one grouped pass over ``df``.
+
+    Amounts are aggregated once into a daily rollup and every breakdown is
+    derived from that much smaller table; the largest expenses are picked
+    by partial selection rather than a full sort.
+    """
+    return summary_from_rollup(build_rollup(df), select_top_expenses(df, top_n))
+
+
+def stream_summary(
+    input_file: Path,
+    start: pd.Timestamp | None,
+    end: pd.Timestamp | None,
+    chunk_rows: int,
+    top_n: int = 10,
+) -> Summary:
+    """Summarize a table too large for memory by folding it in chunks.
+
+    Each chunk is cleaned, reduced to a daily rollup and merged into the
+    running rollup, and its largest expenses compete with the running top N;
+    memory is bounded by the chunk size and the number of distinct rollup
+    keys rather than by the number of rows.
+    """
+    filters = None
+    if start is not None:
+        filters = [("Date", ">=", start.normalize()), ("Date", "<=", end.normalize())]
+    rollup = None
+    top = None
+    with span("analysis.stream") as step:
+        chunks = rows = 0
+        for chunk in iter_table(input_file, chunk_rows, filters=filters, columns=ANALYSIS_COLUMNS):
+            cleaned = filter_transactions_by_period(
+                clean_transactions(compact_transactions(chunk)), start, end
+            )
+            part = build_rollup(cleaned)
+            rollup = part if rollup is None else merge_rollups([rollup, part])
+            candidates = select_top_expenses(cleaned, top_n)
+            # 先放已有的候选行，金额相同时保持文件中的先后顺序
+            top = candidates if top is None else select_top_expenses(pd.concat([top, candidates]), top_n)
+            chunks += 1
+            rows += len(chunk)
+        step.rows_in = rows
+        step.rows_out = 0 if rollup is None else len(rollup)
+        step.metrics["chunks"] = chunks
+    if rollup is None:
+        empty = clean_transactions(load_transactions(input_file, filters=filters).iloc[:0])
+        return summarize(empty, top_n)
+    # 分块模式不保留原始行，趋势只由本次读取范围的汇总表得出，不含商户异常
+    with span("analysis.trends", len(rollup)):
+        trends = compute_trends(rollup)
+    return summary_from_rollup(rollup, top)._replace(trends=trends)
+
+
+def rollup_period(
+    rollup: pd.DataFrame, start: pd.Timestamp | None, end: pd.Timestamp | None
+) -> pd.DataFrame:
+    if start is None or end is None:
+        return rollup
+    dates = rollup["date"]
+    return rollup[dates.notna() & (dates >= start.normalize()) & (dates <= end.normalize())]
 
-def investment_inflows(df: pd.DataFrame) -> tuple[float, pd.Series]:
-    investment = df[df["Category"].str.lower() == "investment"]
-    total = investment["Amount"].sum()
-    by_sub = (
-        investment.groupby("sub_category", dropna=False)["Amount"]
-        .sum()
-        .sort_values(ascending=False)
-    )
-    return total, by_sub
-
-
-def plot_expenses_by_subcategory(
-    by_sub: pd.Series, output_dir: Path, base_name: str, min_percentage: float = 2.0
-) -> tuple[Path | None, pd.Series]:
-    positive = by_sub[by_sub > 0]
-    total = positive.sum()
-    if positive.empty or total == 0:
-        return None, positive
-    percentages = positive / total * 100
-    keep_large = percentages >= min_percentage
-    filtered = positive[keep_large].copy()
-    others_sum = positive[~keep_large].sum()
-    if others_sum > 0:
-        filtered["Other (<2%)"] = others_sum
-    if filtered.empty:
-        return None, positive
-    output_dir.mkdir(parents=True, exist_ok=True)
-    fig, ax = plt.subplots(figsize=(6, 6))
-    ax.pie(
-        filtered,
-        labels=filtered.index,
-        autopct="%1.1f%%",
-        startangle=140,
-        textprops={"fontsize": 8},
-    )
-    ax.set_title("Expenses by Sub-category")
-    path = output_dir / f"{base_name}_expenses_by_sub_category.png"
-    fig.savefig(path, bbox_inches="tight")
-    plt.close(fig)
-    return path, positive
 
+def top_expense_threshold(rollup: pd.DataFrame, top_n: int = 10) -> float | None:
+    """Lower bound on the amount of every top-N expense, from per-group maxima.
 
-def plot_minor_subcategories(
-    by_sub: pd.Series, total: float, output_dir: Path, base_name: str, min_percentage: float = 2.0
-) -> Path | None:
-    if total == 0:
+    The N largest group maxima are N distinct rows, so no top-N expense can
+    be smaller than the N-th of them. None when the bound would not prune.
+    """
+    maxima = rollup.loc[rollup["flow"] == "expense", "amount_max"]
+    if len(maxima) < top_n:
         return None
-    percentages = by_sub / total * 100
-    minor = by_sub[percentages < min_percentage]
-    if minor.empty:
-        return None
-    minor_total = minor.sum()
-    output_dir.mkdir(parents=True, exist_ok=True)
-    fig, ax = plt.subplots(figsize=(6, 6))
-
-    def autopct(pct: float) -> str:
-        relative = pct * minor_total / total
-        return f"{relative:.1f}%"
-
-    ax.pie(
-        minor,
-        labels=minor.index,
-        autopct=autopct,
-        startangle=140,
-        textprops={"fontsize": 8},
-    )
-    ax.set_title("Minor Sub-categories (<2% of total spending)")
-    path = output_dir / f"{base_name}_minor_subcategory_comparison.png"
-    fig.savefig(path, bbox_inches="tight")
-    plt.close(fig)
-    return path
+    threshold = float(maxima.nlargest(top_n).iloc[-1])
+    # 金额缺失的行在清洗后记为 0，阈值不为正时不能用来过滤
+    return threshold if threshold > 0 else None
 
 
-def plot_spending_trend(
-    daily: pd.Series, output_dir: Path, base_name: str
-) -> Path | None:
-    if daily.empty:
-        return None
-    output_dir.mkdir(parents=True, exist_ok=True)
-    fig, ax = plt.subplots(figsize=(10, 4))
-    ax.plot(daily.index, daily.values, marker="o")
-    ax.set_title("Daily Expense Trend")
-    ax.set_xlabel("Date")
-    ax.set_ylabel("Spent (CNY)")
-    ax.grid(True, linestyle="--", alpha=0.4)
-    fig.autofmt_xdate()
-    path = output_dir / f"{base_name}_spending_time_series.png"
-    fig.savefig(path, bbox_inches="tight")
-    plt.close(fig)
-    return path
+def covers_whole_days(start: pd.Timestamp | None, end: pd.Timestamp | None) -> bool:
+    """True when the period can be answered from daily rollups."""
+    if start is None or end is None:
+        return True
+    return start == start.normalize() and end == end.normalize() + pd.Timedelta(days=1) - pd.Timedelta(nanoseconds=1)
 
 
 def plot_relative_link(plot_path: Path | None, markdown_dir: Path) -> str | None:
@@ -201,6 +288,7 @@ def build_summary_md(
     minor_plot: Path | None,
     trend_plot: Path | None,
     markdown_dir: Path,
+    trends: Trends | None = None,
 ) -> str:
     lines = ["# 分析摘要", ""]
     lines.append(f"- 总收入：{income:,.2f} CNY")
@@ -247,6 +335,9 @@ def build_summary_md(
         lines.append(f"![日度支出趋势]({trend_link})")
         lines.append("")
 
+    if trends is not None:
+        lines.extend(build_trends_md(trends))
+
     if not top_expenses_df.empty:
         lines.append("## 主要支出明细")
         for i, row in enumerate(top_expenses_df.itertuples(index=False), 1):
@@ -264,6 +355,67 @@ def build_summary_md(
     return "\n".join(lines)
 
 
+def format_delta(delta: float, pct: float) -> str:
+    if pd.isna(delta):
+        return "—"
+    text = f"{delta:+,.2f}"
+    return text if pd.isna(pct) else f"{text}（{pct:+.1%}）"
+
+
+def build_trends_md(trends: Trends, top_n: int = 5, top_sub: int = 10) -> list[str]:
+    """Markdown lines for rolling means, sub-category deltas of the last month and flagged anomalies."""
+    if trends.daily.empty:
+        return []
+    lines = ["## 趋势与异常", ""]
+    last_day = trends.daily.index[-1]
+    latest = trends.daily.iloc[-1]
+    lines.append(
+        f"- 近 7 日日均支出：{latest['mean_7d']:,.2f} CNY；近 30 日日均支出：{latest['mean_30d']:,.2f} CNY"
+        f"（截至 {last_day:%Y-%m-%d}）"
+    )
+    lines.append("")
+
+    if not trends.monthly.empty:
+        month = trends.monthly.index.get_level_values("month").max()
+        current = trends.monthly.xs(month, level="month")
+        current = current[(current["amount"] > 0) | (current["previous"] > 0)]
+        current = current.sort_values("amount", ascending=False, kind="stable").head(top_sub)
+        lines.append(f"### {month} 子类环比与同比")
+        lines.append("")
+        lines.append("| 子类 | 本月支出 | 环比 | 同比 |")
+        lines.append("| --- | ---: | ---: | ---: |")
+        for sub, row in current.iterrows():
+            lines.append(
+                f"| {sub} | {row['amount']:,.2f} | {format_delta(row['mom_delta'], row['mom_pct'])} "
+                f"| {format_delta(row['yoy_delta'], row['yoy_pct'])} |"
+            )
+        lines.append("")
+
+    anomalies = trends.daily[trends.daily["anomaly"]]
+    if not anomalies.empty:
+        anomalies = anomalies.sort_values(["robust_z", "zscore"], ascending=False, kind="stable").head(top_n)
+        lines.append("### 异常支出日")
+        lines.append("")
+        for day, row in anomalies.iterrows():
+            zscore = "—" if pd.isna(row["zscore"]) else f"{row['zscore']:.1f}"
+            lines.append(
+                f"- {day:%Y-%m-%d}：支出 {row['amount']:,.2f} CNY（30 日均值 {row['mean_30d']:,.2f}，"
+                f"z = {zscore}，稳健 z = {row['robust_z']:.1f}）"
+            )
+        lines.append("")
+
+    if trends.merchants is not None and not trends.merchants.empty:
+        lines.append("### 商户异常交易")
+        lines.append("")
+        for row in trends.merchants.head(top_n).itertuples(index=False):
+            lines.append(
+                f"- {row.merchant}：{row.amount:,.2f} CNY，{row.date:%Y-%m-%d}"
+                f"（该商户中位数 {row.median:,.2f}，共 {row.transactions} 笔，稳健 z = {row.robust_z:.1f}）"
+            )
+        lines.append("")
+    return lines
+
+
 def build_basename(start: pd.Timestamp | None, end: pd.Timestamp | None) -> str:
     if start is None or end is None:
         return "analysis"
@@ -272,14 +424,284 @@ def build_basename(start: pd.Timestamp | None, end: pd.Timestamp | None) -> str:
     return f"analysis_{start_str}_{end_str}"
 
 
-def main() -> None:
+def analyze_trends(cleaned: pd.DataFrame, rollup: pd.DataFrame | None = None) -> Trends:
+    """Trends of the whole cleaned history; pass its ``build_rollup`` when already computed."""
+    with span("analysis.trends", len(cleaned)):
+        return compute_trends(build_rollup(cleaned) if rollup is None else rollup, expense_merchants(cleaned))
+
+
+def load_merchant_rows(input_file: Path) -> pd.DataFrame:
+    """The expense rows ``merchant_anomalies`` needs, read without the other analysis columns."""
+    df = read_table(input_file, filters=[("in/out", "==", 1)], columns=["Date", "in/out", "Counterparty", "Amount"])
+    return pd.DataFrame({
+        "date": df["Date"],
+        "merchant": df["Counterparty"].astype("category"),
+        "amount": df["Amount"].astype(float).fillna(0.0),
+    })
+
+
+def run_analysis(
+    cleaned: pd.DataFrame,
+    start: pd.Timestamp | None,
+    end: pd.Timestamp | None,
+    plots_dir: Path,
+    summary_dir: Path = Path("Analysis/markdown"),
+    plots: bool = True,
+    plot_format: str = "png",
+    plot_workers: int | None = None,
+) -> Path:
+    """Compute summaries and plots for a cleaned frame and write the markdown report.
+
+    Trends are computed over all of ``cleaned`` and then cut to the period,
+    so month-over-month deltas and anomaly baselines reach back before START.
+    """
+    with span("analysis.summarize", len(cleaned)) as step:
+        scoped = filter_transactions_by_period(cleaned, start, end)
+        rollup = build_rollup(cleaned)
+        if start is None or end is None:
+            # 不限区间时汇总表与趋势共用同一次分组
+            summary = summary_from_rollup(rollup, select_top_expenses(scoped))
+        else:
+            summary = summarize(scoped)
+        step.rows_out = len(scoped)
+    trends = trends_for_period(analyze_trends(cleaned, rollup), start, end)
+    summary = summary._replace(trends=trends)
+    return write_report(
+        summary, start, end, plots_dir, summary_dir, plots, plot_format, plot_workers
+    )
+
+
+def run_rollup_analysis(
+    input_file: Path,
+    start: pd.Timestamp | None,
+    end: pd.Timestamp | None,
+    plots_dir: Path,
+    summary_dir: Path = Path("Analysis/markdown"),
+    plots: bool = True,
+    plot_format: str = "png",
+    plot_workers: int | None = None,
+) -> Path:
+    """Answer the report from the persisted daily rollup of ``input_file``.
+
+    The rollup is refreshed only when the table changed since it was last
+    built; raw rows are otherwise read just for the period's top expenses
+    and, for the merchant anomalies, the amount and merchant of expenses.
+    The whole rollup is read because trends look back before the period.
+    """
+    loaded = {}
+
+    def load_cleaned() -> pd.DataFrame:
+        loaded["cleaned"] = clean_transactions(load_transactions(input_file))
+        return loaded["cleaned"]
+
+    date_range = (start.normalize(), end.normalize()) if start is not None else None
+    with span("analysis.rollup") as step:
+        history = ensure_rollup(input_file, load_cleaned)
+        rollup = rollup_period(history, start, end)
+        step.rows_out = len(rollup)
+        step.metrics["rebuilt"] = "cleaned" in loaded
+    if "cleaned" in loaded:
+        detail = loaded["cleaned"]
+    else:
+        filters = []
+        if date_range is not None:
+            filters += [("Date", ">=", date_range[0]), ("Date", "<=", date_range[1])]
+        threshold = top_expense_threshold(rollup)
+        if threshold is not None:
+            filters.append(("Amount", ">=", threshold))
+        detail = clean_transactions(load_transactions(input_file, filters=filters))
+    with span("analysis.summarize", len(rollup)):
+        top = select_top_expenses(filter_transactions_by_period(detail, start, end))
+        summary = summary_from_rollup(rollup, top)
+    with span("analysis.trends", len(history)):
+        merchants = expense_merchants(detail) if "cleaned" in loaded else load_merchant_rows(input_file)
+        trends = compute_trends(history, merchants)
+    summary = summary._replace(trends=trends_for_period(trends, start, end))
+    return write_report(
+        summary, start, end, plots_dir, summary_dir, plots, plot_format, plot_workers
+    )
+
+
+def prepare_report(
+    summary: Summary,
+    start: pd.Timestamp | None,
+    end: pd.Timestamp | None,
+    plots_dir: Path,
+    summary_dir: Path = Path("Analysis/markdown"),
+    plots: bool = True,
+    plot_format: str = "png",
+) -> tuple[Path, str, list]:
+    """Build the markdown for a summary and the chart jobs it links to.
+
+    Nothing is drawn here: the returned jobs are rendered by
+    ``plots.render_plots`` so several reports can share one process pool.
+    """
+    base_name = build_basename(start, end)
+    cat_job = minor_job = trend_job = None
+    if plots:
+        cat_job, positive_sub = subcategory_pie_job(
+            summary.by_sub_category, plots_dir, base_name, plot_format
+        )
+        minor_job = minor_subcategories_job(
+            positive_sub, positive_sub.sum(), plots_dir, base_name, plot_format
+        )
+        trend_job = spending_trend_job(summary.daily, plots_dir, base_name, plot_format)
+    jobs = [job for job in (cat_job, minor_job, trend_job) if job is not None]
+
+    summary_text = build_summary_md(
+        summary.income,
+        summary.expenses,
+        summary.net,
+        summary.by_category,
+        summary.daily,
+        summary.investment_total,
+        summary.investment_by_sub,
+        summary.top_expenses,
+        cat_job.path if cat_job else None,
+        minor_job.path if minor_job else None,
+        trend_job.path if trend_job else None,
+        summary_dir,
+        summary.trends,
+    )
+    return summary_dir / f"{base_name}.md", summary_text, jobs
+
+
+def render_report_plots(jobs: list, plot_workers: int | None = None) -> None:
+    if not jobs:
+        return
+    with span("analysis.plots", len(jobs)) as step:
+        rendered, reused = render_plots(jobs, plot_workers)
+        step.metrics.update(rendered=rendered, reused=reused)
+    print(f"Charts: {rendered} rendered, {reused} unchanged and reused.")
+
+
+def save_report(summary_path: Path, summary_text: str) -> Path:
+    summary_path.parent.mkdir(parents=True, exist_ok=True)
+    summary_path.write_text(summary_text, encoding="utf-8")
+    print(f"\nSummary written to `{summary_path}`")
+    return summary_path
+
+
+def write_report(
+    summary: Summary,
+    start: pd.Timestamp | None,
+    end: pd.Timestamp | None,
+    plots_dir: Path,
+    summary_dir: Path = Path("Analysis/markdown"),
+    plots: bool = True,
+    plot_format: str = "png",
+    plot_workers: int | None = None,
+) -> Path:
+    """Render the charts for a summary and write its markdown report.
+
+    With ``plots=False`` only the markdown summary is written and matplotlib
+    is never imported. Charts whose data is unchanged since the last run are
+    not redrawn.
+    """
+    summary_path, summary_text, jobs = prepare_report(
+        summary, start, end, plots_dir, summary_dir, plots, plot_format
+    )
+    render_report_plots(jobs, plot_workers)
+    return save_report(summary_path, summary_text)
+
+
+def period_bounds(
+    datetimes: pd.Series,
+    every: str,
+    start: pd.Timestamp | None = None,
+    end: pd.Timestamp | None = None,
+) -> list[tuple[pd.Timestamp, pd.Timestamp]]:
+    """Calendar periods covering the data (clipped to START/END when given)."""
+    first = datetimes.min() if start is None else start
+    last = datetimes.max() if end is None else end
+    if pd.isna(first) or pd.isna(last):
+        return []
+    bounds = []
+    for period in pd.period_range(first, last, freq=PERIOD_FREQUENCIES[every]):
+        period_start, period_end = period.start_time, period.end_time
+        if start is not None:
+            period_start = max(period_start, start)
+        if end is not None:
+            period_end = min(period_end, end)
+        bounds.append((period_start, period_end))
+    return bounds
+
+
+def build_index_md(every: str, reports: list[tuple[str, Summary, Path]], markdown_dir: Path) -> str:
+    lines = [f"# 分期分析索引（{PERIOD_NAMES[every]}）", ""]
+    lines.append("| 区间 | 总收入 | 总支出 | 净收入 | 报告 |")
+    lines.append("| --- | ---: | ---: | ---: | --- |")
+    for label, summary, path in reports:
+        link = plot_relative_link(path, markdown_dir)
+        lines.append(
+            f"| {label} | {summary.income:,.2f} | {summary.expenses:,.2f} | {summary.net:,.2f} "
+            f"| [{path.name}]({link}) |"
+        )
+    return "\n".join(lines)
+
+
+def run_batch_analysis(
+    cleaned: pd.DataFrame,
+    every: str,
+    plots_dir: Path,
+    summary_dir: Path = Path("Analysis/markdown"),
+    plots: bool = True,
+    start: pd.Timestamp | None = None,
+    end: pd.Timestamp | None = None,
+    plot_format: str = "png",
+    plot_workers: int | None = None,
+) -> Path:
+    """Write one report per month/quarter/year from a single loaded frame, plus an index page.
+
+    Rows are ordered by ``datetime`` once and each period is located by
+    binary search, so the total cost stays close to one full-history run.
+    Within a period rows keep their original order, which makes every report
+    identical to a separate ``--period`` run over the same dates. The charts
+    of all periods are rendered together on one process pool, and the trends
+    are computed once over the whole history and cut to each period.
+    """
+    times = cleaned["datetime"].to_numpy()
+    order = np.argsort(times, kind="stable")
+    # NaT 排在最后，不属于任何区间
+    sorted_times = times[order]
+    reports = []
+    pending = []
+    jobs = []
+    trends = analyze_trends(cleaned)
+    with span("analysis.summarize", len(cleaned)) as step:
+        for period_start, period_end in period_bounds(cleaned["datetime"], every, start, end):
+            lo = np.searchsorted(sorted_times, period_start.to_datetime64(), side="left")
+            hi = np.searchsorted(sorted_times, period_end.to_datetime64(), side="right")
+            scoped = cleaned.iloc[np.sort(order[lo:hi])]
+            summary = summarize(scoped)._replace(trends=trends_for_period(trends, period_start, period_end))
+            path, text, period_jobs = prepare_report(
+                summary, period_start, period_end, plots_dir, summary_dir, plots, plot_format
+            )
+            pending.append((path, text))
+            jobs.extend(period_jobs)
+            label = f"{period_start:%Y-%m-%d} ~ {period_end:%Y-%m-%d}"
+            reports.append((label, summary, path))
+        step.metrics["periods"] = len(reports)
+
+    render_report_plots(jobs, plot_workers)
+    for path, text in pending:
+        save_report(path, text)
+
+    summary_dir.mkdir(parents=True, exist_ok=True)
+    index_path = summary_dir / f"index_{every}.md"
+    index_path.write_text(build_index_md(every, reports, summary_dir), encoding="utf-8")
+    print(f"\nIndex of {len(reports)} reports written to `{index_path}`")
+    return index_path
+
+
+def main(argv: Sequence[str] | None = None) -> None:
     parser = argparse.ArgumentParser(description="Analyze personal finance transactions.")
     parser.add_argument(
         "input_file",
         nargs="?",
         type=Path,
-        default=Path("Data/cleaned_labeled.csv"),
-        help="Path to the cleaned transactions CSV.",
+        default=table_path("Data/cleaned_labeled"),
+        help="Path to the labeled transactions table (Parquet, Feather or CSV).",
     )
     parser.add_argument(
         "--plots-dir",
@@ -293,45 +715,68 @@ def main() -> None:
         metavar=("START", "END"),
         help="Optional inclusive date range (YYYY-MM-DD) to limit the analysis.",
     )
-    args = parser.parse_args()
-
-    df = load_transactions(args.input_file)
-    cleaned = clean_transactions(df)
-    start, end = parse_period(args.period)
-    scoped = filter_transactions_by_period(cleaned, start, end)
-
-    income, expenses, net = summarize_cash_flow(scoped)
-    by_cat, by_sub = spending_by_category_sub_category(scoped)
-    daily = daily_spending_summary(scoped)
-    top_exp_df = top_expenses(scoped)
-    investment_total, investment_by_sub = investment_inflows(scoped)
-
-    base_name = build_basename(start, end)
-    cat_plot, positive_sub = plot_expenses_by_subcategory(by_sub, args.plots_dir, base_name)
-    positive_total = positive_sub.sum()
-    minor_plot = plot_minor_subcategories(positive_sub, positive_total, args.plots_dir, base_name)
-    trend_plot = plot_spending_trend(daily, args.plots_dir, base_name)
-
-    summary_dir = Path("Analysis/markdown")
-    summary_dir.mkdir(parents=True, exist_ok=True)
-    summary_text = build_summary_md(
-        income,
-        expenses,
-        net,
-        by_cat,
-        daily,
-        investment_total,
-        investment_by_sub,
-        top_exp_df,
-        cat_plot,
-        minor_plot,
-        trend_plot,
-        summary_dir,
+    parser.add_argument(
+        "--no-plots",
+        action="store_true",
+        help="Write only the markdown summary without rendering charts.",
     )
-    summary_path = summary_dir / f"{base_name}.md"
-    summary_path.write_text(summary_text, encoding="utf-8")
-    print(f"\nSummary written to `{summary_path}`")
+    parser.add_argument(
+        "--every",
+        choices=list(PERIOD_FREQUENCIES),
+        help="Write one report per month, quarter or year (within --period if given) and an index page.",
+    )
+    parser.add_argument(
+        "--plot-format",
+        choices=PLOT_FORMATS,
+        default="png",
+        help="Chart file format; svg is cheaper to produce and smaller (default: png).",
+    )
+    parser.add_argument(
+        "--plot-workers",
+        type=int,
+        default=None,
+        help="Processes used to render charts (default: all CPU cores; 1 renders in-process).",
+    )
+    parser.add_argument(
+        "--chunk-rows",
+        type=int,
+        default=None,
+        help="Stream the table in chunks of this many rows with bounded memory (no --every).",
+    )
+    parser.add_argument(
+        "--no-rollup",
+        action="store_true",
+        help="Aggregate the raw rows instead of the persisted daily rollup.",
+    )
+    add_profile_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.chunk_rows and args.every:
+        parser.error("--chunk-rows cannot be combined with --every")
 
+    start, end = parse_period(args.period)
+    report_options = {
+        "plots": not args.no_plots,
+        "plot_format": args.plot_format,
+        "plot_workers": args.plot_workers,
+    }
+    with profiled(args, "analysis"):
+        if args.every:
+            cleaned = clean_transactions(load_transactions(args.input_file))
+            run_batch_analysis(
+                cleaned, args.every, args.plots_dir, start=start, end=end, **report_options
+            )
+        elif args.chunk_rows:
+            summary = stream_summary(args.input_file, start, end, args.chunk_rows)
+            write_report(summary, start, end, args.plots_dir, **report_options)
+        elif not args.no_rollup and covers_whole_days(start, end):
+            run_rollup_analysis(args.input_file, start, end, args.plots_dir, **report_options)
+        else:
+            df = load_transactions(args.input_file)
+            cleaned = clean_transactions(df)
+            run_analysis(cleaned, start, end, args.plots_dir, **report_options)
+    peak = peak_rss_mb()
+    if peak is not None:
+        print(f"Peak memory: {peak:,.1f} MB")
 
 if __name__ == "__main__":
     main()
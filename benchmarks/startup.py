@@ -0,0 +1,87 @@
+"""Startup-time benchmark for the ``pf`` CLI.
+
+Each case runs ``pf <args>`` in a fresh interpreter several times, reports the
+median wall time over a bare interpreter start, and fails when that overhead
+exceeds the case's budget or the case imports a module it must not load. Run it from the repository root::
+
+    python benchmarks/startup.py
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+HEAVY = ["pandas", "numpy", "pyarrow", "matplotlib", "seaborn", "httpx", "tqdm", "requests"]
+
+# (参数, 禁止导入的模块, 相对于空解释器启动的额外耗时预算，毫秒)
+CASES = [
+    (["--help"], HEAVY, 50),
+    (["update", "--help"], ["matplotlib", "seaborn", "httpx", "tqdm", "requests"], 1500),
+    (["clean", "--help"], ["matplotlib", "seaborn", "httpx", "tqdm", "requests"], 1500),
+    (["label", "--help"], ["matplotlib", "seaborn", "httpx", "tqdm", "requests"], 1500),
+    (["report", "--help"], ["matplotlib", "seaborn", "httpx", "tqdm", "requests"], 1500),
+]
+
+PROBE = """
+import json, sys
+args, forbidden = json.loads(sys.argv[1]), json.loads(sys.argv[2])
+sys.argv = ["pf", *args]
+if args:
+    try:
+        import pf
+        pf.main(args)
+    except SystemExit:
+        pass
+print("\\n" + json.dumps(sorted(name for name in forbidden if name in sys.modules)))
+"""
+
+
+def run_case(args: list[str], forbidden: list[str], repeat: int) -> tuple[float, list[str]]:
+    timings = []
+    loaded: list[str] = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-c", PROBE, json.dumps(args), json.dumps(forbidden)],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        timings.append((time.perf_counter() - started) * 1000)
+        loaded = json.loads(result.stdout.strip().splitlines()[-1])
+    return statistics.median(timings), loaded
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Guard pf startup time against import regressions.")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per case (default: 5).")
+    parser.add_argument(
+        "--scale", type=float, default=1.0, help="Multiply every time budget, e.g. on slow machines."
+    )
+    args = parser.parse_args()
+
+    baseline, _ = run_case([], [], args.repeat)
+    print(f"Interpreter start: {baseline:.1f} ms (median of {args.repeat})")
+    print(f"{'command':<24}{'overhead ms':>12}{'budget ms':>10}  result")
+    failed = False
+    for case_args, forbidden, budget in CASES:
+        median, loaded = run_case(case_args, forbidden, args.repeat)
+        overhead = median - baseline
+        budget *= args.scale
+        problems = []
+        if overhead > budget:
+            problems.append("over budget")
+        if loaded:
+            problems.append("imported " + ", ".join(loaded))
+        failed |= bool(problems)
+        print(f"{'pf ' + ' '.join(case_args):<24}{overhead:>12.1f}{budget:>10.0f}  {'; '.join(problems) or 'ok'}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""End-to-end benchmark on synthetic statements.
+
+Generates statements with ``synth.py`` in a scratch directory, then times each
+pipeline stage on them: statement parsing and merging (``update``), cleaning,
+labeling against the local mock DeepSeek endpoint, and the analysis summaries.
+Results are written as JSON together with the commit they were measured on;
+pass an earlier result as ``--baseline`` to flag stages that got slower::
+
+    python benchmarks/suite.py --rows 200000 --output benchmarks/results/new.json
+    python benchmarks/suite.py --rows 200000 --baseline benchmarks/results/old.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import pandas as pd  # noqa: E402
+
+import synth  # noqa: E402
+
+
+def timed(repeat: int, func: Callable[[], Any]) -> tuple[float, Any]:
+    """Best wall time in seconds over ``repeat`` calls, and the last result."""
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(
+    rows: int, workdir: Path, repeat: int = 3, label_rows: int = 2000, workers: int | None = 1, seed: int = 0
+) -> dict[str, dict[str, float]]:
+    """Run every stage from ``workdir`` and return {stage: {"seconds", "rows", "rows_per_s"}}."""
+    import analysis
+    import clean
+    import label
+    import mock_deepseek
+    import update
+    from storage import write_table
+
+    results: dict[str, dict[str, float]] = {}
+
+    def record(stage: str, seconds: float, n: int, **extra: float) -> None:
+        results[stage] = {"seconds": round(seconds, 4), "rows": n, "rows_per_s": round(n / seconds, 1), **extra}
+        print(f"{stage:<28}{seconds:>10.3f} s{n:>12,} rows{n / seconds:>14,.0f} rows/s")
+
+    started = time.perf_counter()
+    synth.generate_statements(workdir, rows, seed=seed)
+    print(f"Generated {rows:,} transactions in {time.perf_counter() - started:.1f} s under {workdir}")
+    os.chdir(workdir)
+
+    seconds, alipay = timed(repeat, lambda: update.process_alipay(max_workers=workers, export=False))
+    record("update.process_alipay", seconds, len(alipay))
+    seconds, wechat = timed(repeat, lambda: update.process_wechat(max_workers=workers, export=False))
+    record("update.process_wechat", seconds, len(wechat))
+    seconds, updated = timed(repeat, lambda: update.concat_and_sort(frames=[alipay, wechat]))
+    record("update.concat_and_sort", seconds, len(updated))
+
+    raw = synth.add_detail_rows(updated, seed=seed)
+    seconds, cleaned = timed(
+        repeat, lambda: clean.clean_and_merge(update.UPDATED_PATH, clean.OUTPUT_PATH, df=raw.copy())
+    )
+    record("clean.clean_and_merge", seconds, len(raw))
+
+    # 标注只取一部分行：耗时主要取决于请求数与模拟延迟，而非数据规模
+    options = mock_deepseek.MockOptions(latency=0.01, jitter=0.0)
+    server = mock_deepseek.serve(0, options)
+    label.DEEPSEEK_API_URL = f"http://127.0.0.1:{server.server_port}/v1/chat/completions"
+    sample = cleaned.head(label_rows).copy()
+    try:
+        def run_label() -> pd.DataFrame:
+            for path in (label.LABELED_PATH, Path(label.LABEL_JOURNAL_PATH)):
+                Path(path).unlink(missing_ok=True)
+            return label.label_frame(sample, use_cache=False, use_classifier=False)
+
+        seconds, _ = timed(1, run_label)
+    finally:
+        server.shutdown()
+    record("label.label_frame", seconds, len(sample), requests=options.counts["ok"])
+
+    # 分析阶段使用全部行，子类别取生成器中商户对应的标签
+    labeled = cleaned.copy()
+    labeled["sub_category"] = labeled["Counterparty"].map(synth.label_lookup()).fillna("")
+    write_table(labeled, label.LABELED_PATH)
+    seconds, transactions = timed(
+        repeat, lambda: analysis.clean_transactions(analysis.load_transactions(label.LABELED_PATH))
+    )
+    record("analysis.load", seconds, len(transactions))
+    seconds, _ = timed(repeat, lambda: analysis.summarize(transactions))
+    record("analysis.summarize", seconds, len(transactions))
+    seconds, _ = timed(
+        repeat, lambda: analysis.stream_summary(label.LABELED_PATH, None, None, chunk_rows=100_000)
+    )
+    record("analysis.stream_summary", seconds, len(transactions))
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Stages whose time per row grew by more than ``tolerance`` (a ratio) over the baseline."""
+    print(f"{'stage':<28}{'baseline rows/s':>16}{'now rows/s':>12}{'slowdown':>10}")
+    slower = []
+    for stage, entry in results.items():
+        old = baseline.get("results", {}).get(stage)
+        if old is None:
+            continue
+        # 按吞吐量比较，行数不同（如 --label-rows）的结果也可以对照
+        ratio = old["rows_per_s"] / entry["rows_per_s"]
+        flag = "  slower" if ratio > tolerance else ""
+        print(f"{stage:<28}{old['rows_per_s']:>16,.0f}{entry['rows_per_s']:>12,.0f}{ratio:>10.2f}{flag}")
+        if ratio > tolerance:
+            slower.append(stage)
+    return slower
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark every pipeline stage on synthetic statements.")
+    parser.add_argument("--rows", type=int, default=100_000, help="Synthetic transactions (default: 100000).")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per stage; the fastest is kept (default: 3).")
+    parser.add_argument("--label-rows", type=int, default=2000, help="Rows sent to the mock API (default: 2000).")
+    parser.add_argument("--workers", type=int, default=1, help="Processes used to parse statements (default: 1).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", type=Path, help="Scratch directory to use and keep (default: a temp dir).")
+    parser.add_argument("--output", type=Path, help="Write the results as JSON to this file.")
+    parser.add_argument("--baseline", type=Path, help="Earlier JSON result to compare against.")
+    parser.add_argument(
+        "--tolerance", type=float, default=1.25, help="Slowdown ratio that counts as a regression (default: 1.25)."
+    )
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or Path(tempfile.mkdtemp(prefix="pf-bench-"))
+    if args.workdir and (args.workdir / "Data").exists():
+        # 避免读到上次运行留下的账单与缓存
+        shutil.rmtree(args.workdir / "Data")
+    output = args.output.resolve() if args.output else None
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8")) if args.baseline else None
+    try:
+        results = run_suite(args.rows, workdir, args.repeat, args.label_rows, args.workers, args.seed)
+    finally:
+        os.chdir(ROOT)
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "commit": git_commit(),
+        "created": pd.Timestamp.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "rows": args.rows,
+        "repeat": args.repeat,
+        "seed": args.seed,
+        "results": results,
+    }
+    if output:
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"Results written to {output}")
+    if baseline:
+        if baseline.get("rows") != args.rows:
+            print(f"Warning: baseline measured {baseline.get('rows')} rows, this run {args.rows}.")
+        slower = compare(results, baseline, args.tolerance)
+        sys.exit(1 if slower else 0)
+
+
+if __name__ == "__main__":
+    main()
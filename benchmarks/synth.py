@@ -0,0 +1,219 @@
+"""Synthetic Alipay and WeChat statement generator.
+
+Writes statement CSVs in the layout of the real exports (Alipay: gb18030 with
+24 preamble lines; WeChat: UTF-8 with 16 preamble lines and ``¥`` amounts) so
+the pipeline can be exercised and benchmarked without private data::
+
+    python benchmarks/synth.py --rows 1000000 --out /tmp/pf-synth
+
+The statements go to ``<out>/Data/Alipay`` and ``<out>/Data/Wechat``; run the
+pipeline from ``<out>``. Output depends only on ``--rows``, ``--seed`` and
+``--start``.
+"""
+import argparse
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from label import LABELS  # noqa: E402
+
+ALIPAY_HEADER_LINES = 24
+WECHAT_HEADER_LINES = 16
+# 支付宝约占六成流水
+ALIPAY_SHARE = 0.6
+# 每个账单文件的行数上限，对应按月/季度分批导出的账单
+ROWS_PER_FILE = 50_000
+
+# (支付宝交易分类, 微信交易类型, 收/支, 子类别, 金额对数均值, 权重)
+MERCHANT_KINDS = [
+    ("餐饮美食", "商户消费", "支出", "餐饮食品", 3.3, 30),
+    ("日用百货", "商户消费", "支出", "购物消费", 4.0, 14),
+    ("超市购物", "商户消费", "支出", "家庭生活", 4.3, 8),
+    ("交通出行", "商户消费", "支出", "交通出行", 2.8, 12),
+    ("文化休闲", "商户消费", "支出", "社交娱乐", 4.2, 4),
+    ("数码电器", "商户消费", "支出", "购物消费", 6.5, 1),
+    ("医疗健康", "商户消费", "支出", "医疗健康", 4.8, 2),
+    ("住房物业", "商户消费", "支出", "住房租金", 7.8, 1),
+    ("充值缴费", "商户消费", "支出", "通讯服务", 4.0, 3),
+    ("教育培训", "商户消费", "支出", "教育学习", 6.0, 1),
+    ("酒店旅游", "商户消费", "支出", "旅行旅游", 6.2, 1),
+    ("转账红包", "转账", "支出", "转账汇款", 5.0, 6),
+    ("转账红包", "微信红包", "支出", "人情往来", 3.5, 5),
+    ("投资理财", "转账", "不计收支", "投资理财", 7.0, 3),
+    ("收入", "转账", "收入", "收入", 8.5, 2),
+    ("退款", "退款", "收入", "退款", 4.0, 2),
+    ("信用借还", "零钱提现", "不计收支", "转账汇款", 6.0, 2),
+]
+MERCHANTS_PER_KIND = 40
+PAYMENT_METHODS = {
+    "alipay": ["余额宝", "花呗", "招商银行储蓄卡(1234)", "账户余额"],
+    "wechat": ["零钱", "招商银行储蓄卡(1234)", "零钱通"],
+}
+# 带有对应无时间明细行的交易比例（见 add_detail_rows）
+DETAIL_FRACTION = 0.02
+
+
+def preamble(platform: str, lines: int, start: pd.Timestamp, end: pd.Timestamp) -> list[str]:
+    """Export metadata lines written above the column header."""
+    name = "支付宝" if platform == "alipay" else "微信支付"
+    head = [
+        "------------------------------------------------------------------------------------",
+        f"{name}交易明细（合成数据）",
+        "导出信息：",
+        "姓名：测试用户",
+        f"起始时间：[{start:%Y-%m-%d %H:%M:%S}] 终止时间：[{end:%Y-%m-%d %H:%M:%S}]",
+        f"导出时间：[{end:%Y-%m-%d %H:%M:%S}]",
+    ]
+    filler = ["" for _ in range(lines - len(head) - 1)]
+    return head + filler + [f"----------------------{name}明细列表----------------------"]
+
+
+def merchant_catalogue() -> pd.DataFrame:
+    """One row per synthetic merchant with its categories, label and typical amount."""
+    rows = []
+    for ali_cat, wx_cat, inout, label, log_mean, weight in MERCHANT_KINDS:
+        assert label in LABELS, label
+        for m in range(MERCHANTS_PER_KIND):
+            rows.append({
+                "counterparty": f"{label}商户{m:03d}",
+                "product": f"{ali_cat}-商品{m % 7}",
+                "alipay_category": ali_cat,
+                "wechat_category": wx_cat,
+                "inout": inout,
+                "sub_category": label,
+                "log_mean": log_mean,
+                "weight": weight / MERCHANTS_PER_KIND,
+            })
+    return pd.DataFrame(rows)
+
+
+def generate_transactions(
+    rows: int, platform: str, start: pd.Timestamp, days: int, rng: np.random.Generator
+) -> pd.DataFrame:
+    """Draw ``rows`` transactions for one platform, sorted by time, in the export's columns."""
+    catalogue = merchant_catalogue()
+    weights = catalogue["weight"].to_numpy()
+    picks = catalogue.iloc[rng.choice(len(catalogue), size=rows, p=weights / weights.sum())]
+    seconds = np.sort(rng.integers(0, days * 86400, size=rows))
+    times = start + pd.to_timedelta(seconds, unit="s")
+    amounts = np.round(np.exp(rng.normal(picks["log_mean"].to_numpy(), 0.6)), 2).clip(0.01)
+    stamp = times.strftime("%Y%m%d").to_numpy()
+    serial = np.char.zfill(np.arange(rows).astype(str), 10)
+    methods = np.array(PAYMENT_METHODS[platform])[rng.integers(0, len(PAYMENT_METHODS[platform]), size=rows)]
+    time_text = times.strftime("%Y-%m-%d %H:%M:%S")
+    if platform == "alipay":
+        return pd.DataFrame({
+            "交易时间": time_text,
+            "交易分类": picks["alipay_category"].to_numpy(),
+            "交易对方": picks["counterparty"].to_numpy(),
+            "对方账号": "/",
+            "商品说明": picks["product"].to_numpy(),
+            "收/支": picks["inout"].to_numpy(),
+            "金额": amounts,
+            "收/付款方式": methods,
+            "交易状态": "交易成功",
+            "交易订单号": np.char.add(np.char.add(stamp.astype(str), "2200"), serial),
+            "商家订单号": np.char.add("M", serial),
+            "备注": "",
+        })
+    inout = np.where(picks["inout"].to_numpy() == "不计收支", "/", picks["inout"].to_numpy())
+    return pd.DataFrame({
+        "交易时间": time_text,
+        "交易类型": picks["wechat_category"].to_numpy(),
+        "交易对方": picks["counterparty"].to_numpy(),
+        "商品": picks["product"].to_numpy(),
+        "收/支": inout,
+        "金额(元)": np.char.add("¥", np.char.mod("%.2f", amounts)),
+        "支付方式": methods,
+        "当前状态": "支付成功",
+        "交易单号": np.char.add(np.char.add("4200", stamp.astype(str)), serial),
+        "商户单号": "/",
+        "备注": "/",
+    })
+
+
+def write_statement(df: pd.DataFrame, path: Path, platform: str) -> None:
+    start, end = pd.Timestamp(df["交易时间"].iloc[0]), pd.Timestamp(df["交易时间"].iloc[-1])
+    if platform == "alipay":
+        lines, encoding, trailing = ALIPAY_HEADER_LINES, "gb18030", ","
+    else:
+        lines, encoding, trailing = WECHAT_HEADER_LINES, "utf-8", ""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", encoding=encoding, newline="") as f:
+        f.write("\n".join(preamble(platform, lines, start, end)) + "\n")
+        f.write(",".join(df.columns) + trailing + "\n")
+        # 支付宝导出每行末尾多一个逗号，读入后成为 "Unnamed: 12" 列
+        body = df.to_csv(index=False, header=False, lineterminator=trailing + "\n", float_format="%.2f")
+        f.write(body)
+
+
+def generate_statements(
+    out_dir: str | Path, rows: int, seed: int = 0, start: str = "2020-01-01", days: int = 5 * 365
+) -> dict[str, list[Path]]:
+    """Write ``rows`` synthetic transactions as Alipay and WeChat statement files under ``out_dir``."""
+    rng = np.random.default_rng(seed)
+    out_dir = Path(out_dir)
+    alipay_rows = int(rows * ALIPAY_SHARE)
+    written: dict[str, list[Path]] = {}
+    for platform, count, folder in (
+        ("alipay", alipay_rows, "Data/Alipay"),
+        ("wechat", rows - alipay_rows, "Data/Wechat"),
+    ):
+        df = generate_transactions(count, platform, pd.Timestamp(start), days, rng)
+        files = max(1, -(-count // ROWS_PER_FILE))
+        written[platform] = []
+        for i, part in enumerate(np.array_split(np.arange(count), files), 1):
+            if not len(part):
+                continue
+            path = out_dir / folder / f"{platform}_{i:03d}.csv"
+            write_statement(df.iloc[part], path, platform)
+            written[platform].append(path)
+    return written
+
+
+def add_detail_rows(df: pd.DataFrame, fraction: float = DETAIL_FRACTION, seed: int = 0) -> pd.DataFrame:
+    """Append the timeless detail rows that ``clean.merge_detail_rows`` pairs up.
+
+    Statement exports never carry them (a missing time also loses the date),
+    they come from hand-made merge files: one row per picked transaction with
+    the same Date and Amount, no Time, and a finer Category and description.
+    """
+    rng = np.random.default_rng(seed)
+    picked = df[df["Time"].notna()].sample(frac=fraction, random_state=rng)
+    details = pd.DataFrame({
+        "Date": picked["Date"].to_numpy(),
+        "Time": np.nan,
+        "Category": "日用百货",
+        "in/out": picked["in/out"].to_numpy(),
+        "Amount": picked["Amount"].to_numpy(),
+        "Product_Description": "明细-" + picked["Product_Description"].astype(str).to_numpy(),
+    })
+    return pd.concat([df, details], ignore_index=True)
+
+
+def label_lookup() -> dict[str, str]:
+    """Counterparty → sub_category, i.e. what a perfect labeler would answer."""
+    catalogue = merchant_catalogue()
+    return dict(zip(catalogue["counterparty"], catalogue["sub_category"]))
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Write synthetic Alipay/WeChat statements.")
+    parser.add_argument("--rows", type=int, default=10_000, help="Total transactions (default: 10000).")
+    parser.add_argument("--out", type=Path, default=Path("."), help="Directory that receives Data/.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--start", default="2020-01-01", help="First day of the statements.")
+    parser.add_argument("--days", type=int, default=5 * 365, help="Number of days covered.")
+    args = parser.parse_args(argv)
+    written = generate_statements(args.out, args.rows, args.seed, args.start, args.days)
+    for platform, paths in written.items():
+        print(f"{platform}: {len(paths)} file(s) under {paths[0].parent}")
+
+
+if __name__ == "__main__":
+    main()
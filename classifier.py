@@ -0,0 +1,194 @@
+import argparse
+import heapq
+import math
+import time
+from collections import Counter, defaultdict
+from operator import itemgetter
+from pathlib import Path
+from typing import Sequence
+
+import numpy as np
+import pandas as pd
+
+from label_cache import merchant_keys, normalize_column
+from profiling import add_profile_arguments, profiled
+from storage import read_table, table_path
+
+FEATURE_COLUMNS = ["Counterparty", "Product_Description", "Category"]
+# 置信度不低于该阈值的行由本地分类器直接标注，其余行交给 DeepSeek
+CONFIDENCE_THRESHOLD = 0.8
+
+
+def row_features(df: pd.DataFrame, ngram_range: tuple[int, int] = (2, 3)) -> list[list[str]]:
+    """Character n-grams per field, prefixed with the field so fields stay distinct."""
+    fields = [normalize_column(df[col]).tolist() for col in FEATURE_COLUMNS]
+    direction = df["in/out"].astype(object).where(df["in/out"].notna(), "").astype(str).tolist()
+    low, high = ngram_range
+    features = []
+    for values, flow in zip(zip(*fields), direction):
+        grams = [f"io:{flow}"]
+        for field_id, text in enumerate(values):
+            padded = f" {text} "
+            for n in range(low, high + 1):
+                grams.extend(f"{field_id}:{padded[i:i + n]}" for i in range(len(padded) - n + 1))
+        features.append(grams)
+    return features
+
+
+class NearestNeighbourClassifier:
+    """Char-n-gram TF-IDF k-nearest-neighbour classifier for ``sub_category``.
+
+    Identical training documents are collapsed into one entry carrying their
+    label counts, and an inverted index from n-gram to documents answers
+    cosine-similarity queries without scanning the whole history. N-grams
+    present in more than ``max_df`` of the documents carry almost no signal
+    and are left out of the index.
+    """
+
+    def __init__(self, k: int = 5, max_df: float = 0.3, ngram_range: tuple[int, int] = (2, 3)) -> None:
+        self.k = k
+        self.max_df = max_df
+        self.ngram_range = ngram_range
+        self.idf: dict[str, float] = {}
+        self.postings: dict[str, list[tuple[int, float]]] = {}
+        self.doc_labels: list[Counter] = []
+
+    def _weights(self, grams: list[str]) -> dict[str, float]:
+        counts = Counter(grams)
+        weights = {g: (1 + math.log(c)) * self.idf[g] for g, c in counts.items() if g in self.idf}
+        norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+        return {g: w / norm for g, w in weights.items()}
+
+    def fit(self, df: pd.DataFrame, labels: pd.Series) -> "NearestNeighbourClassifier":
+        docs: dict[tuple[str, ...], Counter] = defaultdict(Counter)
+        for grams, label in zip(row_features(df, self.ngram_range), labels):
+            docs[tuple(grams)][label] += 1
+        n_docs = len(docs)
+        doc_freq = Counter(g for grams in docs for g in set(grams))
+        self.idf = {
+            g: math.log((n_docs + 1) / (freq + 1)) + 1
+            for g, freq in doc_freq.items()
+            if freq <= max(1, self.max_df * n_docs)
+        }
+        self.postings = defaultdict(list)
+        self.doc_labels = []
+        for doc_id, (grams, label_counts) in enumerate(docs.items()):
+            self.doc_labels.append(label_counts)
+            for g, w in self._weights(list(grams)).items():
+                self.postings[g].append((doc_id, w))
+        return self
+
+    def predict(self, df: pd.DataFrame) -> tuple[pd.Series, pd.Series]:
+        """Return the predicted label and a confidence in [0, 1] for each row.
+
+        Confidence is the similarity of the nearest neighbour times the share
+        of the top-k similarity mass that votes for the predicted label.
+        """
+        labels, confidences = [], []
+        for grams in row_features(df, self.ngram_range):
+            scores: dict[int, float] = defaultdict(float)
+            for g, w in self._weights(grams).items():
+                for doc_id, doc_w in self.postings.get(g, ()):
+                    scores[doc_id] += w * doc_w
+            if not scores:
+                labels.append("")
+                confidences.append(0.0)
+                continue
+            # 只取前 k 个邻居，不必对全部候选排序
+            top = heapq.nlargest(self.k, scores.items(), key=itemgetter(1))
+            votes: dict[str, float] = defaultdict(float)
+            for doc_id, sim in top:
+                label_counts = self.doc_labels[doc_id]
+                total = sum(label_counts.values())
+                for label, count in label_counts.items():
+                    votes[label] += sim * count / total
+            best = max(votes, key=votes.get)
+            labels.append(best)
+            confidences.append(min(1.0, top[0][1]) * votes[best] / sum(votes.values()))
+        return pd.Series(labels, index=df.index), pd.Series(confidences, index=df.index)
+
+
+def labeled_rows(df: pd.DataFrame) -> pd.DataFrame:
+    return df[df["sub_category"].notna() & (df["sub_category"] != "")]
+
+
+def train_classifier(df: pd.DataFrame, min_rows: int = 50) -> NearestNeighbourClassifier | None:
+    """Train on the labeled rows of ``df``; None when there is too little history."""
+    train = labeled_rows(df)
+    if len(train) < min_rows:
+        return None
+    return NearestNeighbourClassifier().fit(train, train["sub_category"])
+
+
+def evaluate(
+    df: pd.DataFrame, test_size: float = 0.2, threshold: float = CONFIDENCE_THRESHOLD, seed: int = 0
+) -> dict:
+    """Hold out a share of merchants and score the classifier on their rows.
+
+    The split is by merchant key: exact repeats are already answered by the
+    label cache, so the classifier is only useful on merchants it has not
+    seen verbatim.
+    """
+    rows = labeled_rows(df)
+    keys = merchant_keys(rows)
+    unique_keys = keys.unique()
+    rng = np.random.default_rng(seed)
+    test_keys = set(rng.choice(unique_keys, size=max(1, int(len(unique_keys) * test_size)), replace=False))
+    is_test = keys.isin(test_keys)
+    train, test = rows[~is_test], rows[is_test]
+
+    started = time.perf_counter()
+    model = NearestNeighbourClassifier().fit(train, train["sub_category"])
+    build_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    predicted, confidence = model.predict(test)
+    predict_seconds = time.perf_counter() - started
+
+    confident = confidence >= threshold
+    correct = predicted == test["sub_category"]
+    return {
+        "train_rows": len(train),
+        "test_rows": len(test),
+        "threshold": threshold,
+        "accuracy_all": float(correct.mean()) if len(test) else 0.0,
+        "accuracy_confident": float(correct[confident].mean()) if confident.any() else 0.0,
+        "api_calls_saved": float(confident.mean()) if len(test) else 0.0,
+        "build_seconds": build_seconds,
+        "predict_ms_per_row": predict_seconds * 1000 / max(len(test), 1),
+    }
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Local sub_category pre-classifier.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    evaluate_parser = subparsers.add_parser(
+        "evaluate", help="Report accuracy and API calls saved on held-out labeled rows."
+    )
+    evaluate_parser.add_argument(
+        "input_file",
+        nargs="?",
+        type=Path,
+        default=table_path("Data/cleaned_labeled"),
+        help="Path to the labeled transactions table.",
+    )
+    evaluate_parser.add_argument("--test-size", type=float, default=0.2)
+    evaluate_parser.add_argument("--threshold", type=float, default=CONFIDENCE_THRESHOLD)
+    evaluate_parser.add_argument("--seed", type=int, default=0)
+    add_profile_arguments(evaluate_parser)
+    args = parser.parse_args(argv)
+
+    with profiled(args, "classifier"):
+        df = read_table(args.input_file, categories=False)
+        result = evaluate(df, args.test_size, args.threshold, args.seed)
+    print(f"Train rows: {result['train_rows']}, held-out rows: {result['test_rows']}")
+    print(f"Accuracy (all held-out rows): {result['accuracy_all']:.1%}")
+    print(f"Accuracy (confidence >= {result['threshold']}): {result['accuracy_confident']:.1%}")
+    print(f"API calls saved: {result['api_calls_saved']:.1%}")
+    print(
+        f"Index build: {result['build_seconds']:.2f}s, "
+        f"inference: {result['predict_ms_per_row']:.2f} ms/row"
+    )
+
+
+if __name__ == "__main__":
+    main()
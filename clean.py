@@ -1,11 +1,19 @@
 import pandas as pd
+import argparse
+import json
 import re
 from pathlib import Path
+from profiling import add_profile_arguments, profiled, span
+from merchant_rules import MERCHANT_RULES_PATH, load_merchant_rules
+from reconcile import collapse_matches
+from storage import apply_schema, read_table, table_path, write_table
 
 # ================= 配置参数 =================
 # MERGE_PATH = 'Data/hand_made/merge.csv'
-UPDATE_PATH = 'Data/update/updated.csv'
-OUTPUT_PATH = 'Data/update/cleaned.csv'
+UPDATE_PATH = table_path('Data/update/updated')
+OUTPUT_PATH = table_path('Data/update/cleaned')
+# 自定义类别规则，存在时覆盖下方默认的 REGEX_MAP
+CATEGORY_RULES_PATH = 'Data/category_rules.json'
 
 # 预编译正则表达式
 REGEX_MAP = [
@@ -35,83 +43,126 @@ REGEX_MAP = [
 ]
 
 
-def map_category(cat):
+def load_category_rules(rules_path=CATEGORY_RULES_PATH):
+    """读取类别规则文件，格式为 [["正则", "类别"], ...]，按顺序先匹配先生效
+
+    文件不存在时返回默认的 REGEX_MAP。
+    """
+    path = Path(rules_path)
+    if not path.exists():
+        return REGEX_MAP
+    with path.open(encoding='utf-8') as f:
+        rules = json.load(f)
+    return [(re.compile(pattern), value) for pattern, value in rules]
+
+
+def map_category(cat, rules=REGEX_MAP):
     """根据正则表达式映射类别"""
     if not isinstance(cat, str):
         return cat  # 如果不是字符串（如 NaN），直接返回
-    for pattern, value in REGEX_MAP:
+    for pattern, value in rules:
         if pattern.search(cat):
             return value
     return cat
 
 
-# def clean_and_merge(merge_path, update_path, output_path):
-def clean_and_merge(update_path, output_path):
-    """主处理流程，合并、清洗、重命名、导出"""
-    try:
-        # df = pd.read_csv(merge_path)
-        df = pd.read_csv(update_path)
-    except Exception as e:
-        print(f"读取文件失败: {e}")
-        return
+def map_categories(series, rules=REGEX_MAP):
+    """对整列映射类别：每个不同取值只匹配一次，再通过查找表回填整列"""
+    lookup = {cat: map_category(cat, rules) for cat in series.dropna().unique()}
+    return series.map(lookup)
 
-    # 合并数据
-    # df = pd.concat([df, df_update], ignore_index=True)
-    # cols = list(df_update.columns) + [col for col in df.columns if col not in df_update.columns]
-    # df = df[cols]
-    df.sort_values(by=['Date', 'Time', 'Amount'], inplace=True)
-    try:
-        df['Date'] = pd.to_datetime(df['Date'])
-        df['in/out'] = pd.to_numeric(df['in/out'], errors='coerce').astype('Int64')
-        df['Amount'] = pd.to_numeric(df['Amount'], errors='coerce').astype('Float64')
+
+def merge_detail_rows(df):
+    """将无时间的明细行按 (Date, Amount) 并入有时间的交易行，并删除无时间行
+
+    以哈希连接代替逐行扫描：有时间行取明细行的 Category，Note 取明细行的
+    Product_Description；同一键对应多条明细时以最后一条为准。
+    """
+    timeless = df['Time'].isna()
+    keyed = df['Date'].notna() & df['Amount'].notna()
+    df_nan = df.loc[timeless & keyed, ['Date', 'Amount', 'Category', 'Product_Description']]
+    # 先按键去重，胜出的明细行不依赖连接结果的行序
+    df_nan = df_nan.drop_duplicates(['Date', 'Amount'], keep='last')
+    df_notna = df.loc[~timeless & keyed, ['Date', 'Amount']]
+    df_merged = df_notna.reset_index().merge(df_nan, on=['Date', 'Amount'])
+    df.loc[df_merged['index'], 'Category'] = df_merged['Category'].values
+    df.loc[df_merged['index'], 'Note'] = df_merged['Product_Description'].values
+    df.drop(df[timeless].index, inplace=True)
+    return df
+
+
+def clean_frame(df):
+    """清洗已读入的数据：合并跨平台重复记录与明细、替换无效字符、类别重命名、按商户规则标注，返回新的 DataFrame"""
+    # 按 schema 还原 Date、in/out、Amount 的类型；类别列需要逐值改写，保持为普通字符串列
+    with span('clean.schema', len(df)):
+        df = apply_schema(df, categories=False)
+    with span('clean.sort', len(df)):
+        df.sort_values(by=['Date', 'Time', 'Amount'], inplace=True)
         df['Category'] = df['Category'].str.lower()
-    except Exception as e:
-        print(f"数据类型转换失败: {e}")
-        return
+
+    # 两个平台重复记录的交易只保留一条，平台间转账记为不计收支
+    with span('clean.collapse_matches', len(df)) as step:
+        df = collapse_matches(df)
+        step.rows_out = len(df)
 
     # 合并明细
-    condition1 = df['Time'].isna() & df.apply(
-        lambda row: (
-            ((df['Date'] == row['Date']) &
-             (df['Amount'] == row['Amount']) &
-             df['Time'].notna()).any()
-        ) if pd.isna(row['Time']) else False,
-        axis=1
-    )
-    condition2 = df['Time'].notna() & df.apply(
-        lambda row: (
-            ((df['Date'] == row['Date']) &
-             (df['Amount'] == row['Amount']) &
-             df['Time'].isna()).any()
-        ) if pd.notna(row['Time']) else False,
-        axis=1
-    )
-    mask = condition1 | condition2
-    df_pair = df.loc[mask].copy()
-    df_nan = df_pair[df_pair['Time'].isna()]
-    df_notna = df_pair[df_pair['Time'].notna()]
-    df_merged = df_notna.reset_index().merge(
-        df_nan[['Date', 'Amount', 'Category', 'Product_Description']],
-        on=['Date', 'Amount'],
-        suffixes=('', '_from_nan')
-    )
-    df.loc[df_merged['index'], 'Category'] = df_merged['Category_from_nan'].values
-    df.loc[df_merged['index'], 'Note'] = df_merged['Product_Description_from_nan'].values
-    df.loc[mask].sort_values(['Date','Amount'],inplace=False,ascending=False)
-    df.drop(df[df['Time'].isna()].index, inplace=True)
+    with span('clean.merge_detail_rows', len(df)) as step:
+        df = merge_detail_rows(df)
+        step.rows_out = len(df)
 
     # 替换无效字符
-    df.replace(['/', 'NaN'], '', inplace=True)
+    with span('clean.replace', len(df)):
+        df.replace(['/', 'NaN'], '', inplace=True)
     # 类别重命名
-    df['Category'] = df['Category'].apply(map_category)
+    with span('clean.map_categories', len(df)) as step:
+        df['Category'] = map_categories(df['Category'], load_category_rules())
+        step.metrics['distinct'] = int(df['Category'].nunique())
+    # 商户关键词规则直接确定 sub_category，命中的行在标注阶段不再调用本地分类器或 API
+    rules = load_merchant_rules(MERCHANT_RULES_PATH)
+    if rules is not None:
+        with span('clean.merchant_rules', len(df)) as step:
+            matched = rules.apply(df)
+            step.rows_out = int(matched.sum())
+            step.metrics['rules'] = len(rules)
+    return df
+
+
+# def clean_and_merge(merge_path, update_path, output_path):
+def clean_and_merge(update_path, output_path, df=None):
+    """主处理流程，合并、清洗、重命名、导出；传入 df 时跳过读取 update_path"""
+    if df is None:
+        try:
+            # df = pd.read_csv(merge_path)
+            with span('clean.read') as step:
+                df = read_table(update_path, categories=False)
+                step.rows_out = len(df)
+        except Exception as e:
+            print(f"读取文件失败: {e}")
+            return None
+
+    # 合并数据
+    # df = pd.concat([df, df_update], ignore_index=True)
+    # cols = list(df_update.columns) + [col for col in df.columns if col not in df_update.columns]
+    # df = df[cols]
+    df = clean_frame(df)
 
     try:
-        df.to_csv(output_path, index=False)
+        with span('clean.write', len(df)):
+            write_table(df, output_path)
         print(f"清洗后数据已保存到: {output_path}")
     except Exception as e:
         print(f"保存文件失败: {e}")
+    return df
 
 
-if __name__ == "__main__":
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Clean the merged statements into cleaned.parquet.")
+    add_profile_arguments(parser)
+    args = parser.parse_args(argv)
     # clean_and_merge(MERGE_PATH, UPDATE_PATH, OUTPUT_PATH)
-    clean_and_merge(UPDATE_PATH, OUTPUT_PATH)
+    with profiled(args, 'clean'):
+        clean_and_merge(UPDATE_PATH, OUTPUT_PATH)
+
+
+if __name__ == "__main__":
+    main()
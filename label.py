@@ -1,88 +1,468 @@
 import pandas as pd
-import requests
+import argparse
+import asyncio
 import os
-import concurrent.futures
-from tqdm import tqdm
+import json
+import threading
+import time
+from classifier import CONFIDENCE_THRESHOLD, train_classifier
+from label_cache import LabelCache, instruction_version, merchant_keys
+from label_journal import LABEL_JOURNAL_PATH, LabelJournal, replay_journal
+from merchant_rules import RULE_COLUMN
+from profiling import add_profile_arguments, latency_histogram, profiled, span
+from storage import KEY_COLUMN, apply_schema, ensure_keys, read_table, table_exists, table_path, write_table
 
 DEEPSEEK_API_KEY = os.getenv('DEEPSEEK_API_KEY')
+# 可指向本地模拟服务（见 mock_deepseek.py）进行测试
+DEEPSEEK_API_URL = os.getenv('DEEPSEEK_API_URL', 'https://api.deepseek.com/v1/chat/completions')
+CLEANED_PATH = table_path('Data/update/cleaned')
+LABELED_PATH = table_path('Data/cleaned_labeled')
+# 并发请求数上限，实际并发会根据延迟与限流响应自适应调整
+MAX_CONCURRENCY = 250
+# 每分钟请求数 / token 数预算，None 表示不限制
+REQUESTS_PER_MINUTE = None
+TOKENS_PER_MINUTE = None
+# 每个请求打包的流水条数，1 表示逐行请求
+BATCH_SIZE = 20
+# 单行请求的回答不是合法标签时最多请求的次数
+ROW_ATTEMPTS = 2
+# 标注结果攒够这么多个商户键后才写入缓存并提交一次 SQLite 事务
+CACHE_FLUSH_SIZE = 200
 
-def deepseek_label(prompt, api_key):
-    url = "https://api.deepseek.com/v1/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-    data = {
-        "model": "deepseek-chat",
-        "messages": [
-            {"role": "user", "content": prompt}
-        ],
-        "temperature": 0
-    }
-    response = requests.post(url, headers=headers, json=data, timeout=30)
-    response.raise_for_status()
-    return response.json()['choices'][0]['message']['content'].strip()
+class UsageStats:
+    """线程安全地累计 API 请求数与 token 用量，用于比较不同批大小的开销"""
 
-def row_to_prompt(row):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.labeled_rows = 0
+        self.retries = 0
+        self.latencies = []
+
+    def record(self, usage, latency=None):
+        with self.lock:
+            self.requests += 1
+            self.prompt_tokens += usage.get('prompt_tokens', 0)
+            self.completion_tokens += usage.get('completion_tokens', 0)
+            if latency is not None:
+                self.latencies.append(latency)
+
+    def add_retry(self):
+        with self.lock:
+            self.retries += 1
+
+    def add_labeled(self, n):
+        with self.lock:
+            self.labeled_rows += n
+
+    def report(self):
+        tokens = self.prompt_tokens + self.completion_tokens
+        rows = max(self.labeled_rows, 1)
+        return (
+            f"API usage: {self.requests} requests ({self.retries} retries), {tokens} tokens "
+            f"for {self.labeled_rows} labeled rows "
+            f"({self.requests / rows:.3f} requests/row, {tokens / rows:.1f} tokens/row)"
+        )
+
+    def metrics(self, seconds):
+        """用于 --profile 追踪的请求延迟分布、重试次数与吞吐量"""
+        tokens = self.prompt_tokens + self.completion_tokens
+        seconds = max(seconds, 1e-9)
+        return {
+            'requests': self.requests,
+            'retries': self.retries,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'tokens_per_s': round(tokens / seconds, 1),
+            'labels_per_s': round(self.labeled_rows / seconds, 2),
+            'latency': latency_histogram(self.latencies),
+        }
+
+
+LABELS = [
+    '购物消费', '餐饮食品', '社交娱乐', '教育学习', '通讯服务', '投资理财', '慈善捐赠', '住房租金', '人情往来', '转账汇款',
+    '保险服务', '医疗健康', '交通出行', '数字服务', '旅行旅游', '个人护理', '家庭生活', '收入', '退款'
+]
+LABEL_INSTRUCTION = (
+    "请为这条流水分配一个详细类别，从以下标签中选择："
+    f"{LABELS}"
+    "只返回分类结果，每行一个"
+)
+BATCH_INSTRUCTION = (
+    "请为以下每条流水分配一个详细类别，从以下标签中选择："
+    f"{LABELS}\n"
+    '以 JSON 对象返回，格式为 {"labels": [{"id": 编号, "label": "标签"}, ...]}，'
+    "每条流水对应一个元素，不要返回其他内容。\n"
+)
+
+def row_description(row):
     return (
         f"日期：{row['Date']}，时间：{row['Time']}，类别：{row['Category']}，收支：{row['in/out']}，"
         f"金额：{row['Amount']}，描述：{row['Product_Description']}，状态：{row['Status']}，备注：{row['Note']}，"
-        f"对方：{row['Counterparty']}，对方账号：{row['Counterparty_Account']}，支付方式：{row['Payment_Method']}。\n"
-        "请为这条流水分配一个详细类别，从以下标签中选择："
-        "['购物消费', '餐饮食品', '社交娱乐', '教育学习', '通讯服务', '投资理财', '慈善捐赠', '住房租金', '人情往来', '转账汇款', '保险服务', '医疗健康', '交通出行', '数字服务', '旅行旅游', '个人护理', '家庭生活', '收入', '退款']" \
-        "只返回分类结果，每行一个"
+        f"对方：{row['Counterparty']}，对方账号：{row['Counterparty_Account']}，支付方式：{row['Payment_Method']}。"
     )
 
-# 0. 读取数据
-df = pd.read_csv('Data/update/cleaned.csv')
-df_labeled = pd.read_csv('Data/cleaned_labeled.csv')
-df_labeled = df_labeled.drop_duplicates(subset=['Date', 'Time'])
+def row_to_prompt(row):
+    return row_description(row) + "\n" + LABEL_INSTRUCTION
 
-# 合并 Date 和 Time 以及 sub_category
-labeled_subset = (
-    df_labeled[['Date', 'Time', 'sub_category']]
-    .rename(columns={'sub_category': 'sub_category_labeled'})
-    .drop_duplicates(subset=['Date', 'Time'])
-)
-df = df.merge(labeled_subset, on=['Date', 'Time'], how='left')
+def batch_prompt(df, indices):
+    """把多行流水打包为一个请求，编号从 1 开始"""
+    lines = [f"{i}. {row_description(df.loc[idx])}" for i, idx in enumerate(indices, 1)]
+    return BATCH_INSTRUCTION + "\n".join(lines)
 
+def parse_batch_labels(content, indices):
+    """解析批量返回的 JSON，校验每个编号都有且仅有合法标签，否则抛出 ValueError"""
+    items = json.loads(content)
+    if isinstance(items, dict):
+        items = items.get('labels')
+    if not isinstance(items, list):
+        raise ValueError("response has no labels array")
+    labels = {}
+    for item in items:
+        if not isinstance(item, dict):
+            raise ValueError(f"malformed item: {item!r}")
+        row_id, label = item.get('id'), item.get('label')
+        if isinstance(row_id, str) and row_id.isdigit():
+            row_id = int(row_id)
+        if not isinstance(row_id, int) or not 1 <= row_id <= len(indices):
+            raise ValueError(f"unknown row id: {row_id!r}")
+        if label not in LABELS:
+            raise ValueError(f"label not in allowed set: {label!r}")
+        labels[indices[row_id - 1]] = label
+    if len(labels) != len(indices):
+        raise ValueError(f"expected {len(indices)} labels, got {len(labels)}")
+    return labels
 
-if 'sub_category' not in df.columns:
-    df['sub_category'] = ''
+def parse_row_label(content):
+    """解析单行请求返回的标签：去掉首尾空白、引号与句号后须为合法标签，否则抛出 ValueError"""
+    label = content.strip().strip('"\'“”‘’`。.').strip()
+    if label not in LABELS:
+        raise ValueError(f"label not in allowed set: {content!r}")
+    return label
 
-df['sub_category'] = df['sub_category_labeled'].combine_first(df['sub_category'])
-df.drop(columns=['sub_category_labeled'], inplace=True)
+def merge_labeled(df, df_labeled):
+    """把已标注数据中的 sub_category 按交易主键 Txn_ID 合并到待标注数据，未标注的行为空字符串
 
-mask = df['sub_category'] == ''
-indices_to_process = df[mask].index.tolist()
+    df 需已带有 Txn_ID（见 storage.ensure_keys）。没有主键的旧标注数据（升级前写出的文件或日志）
+    退回按 (Date, Time) 匹配，只用于主键未命中的行。
+    清洗阶段由商户规则确定的标签（Label_Rule 非空）优先于已有标注，修改规则后对历史数据同样生效。
+    """
+    if 'sub_category' not in df.columns:
+        df['sub_category'] = ''
+    if KEY_COLUMN in df_labeled.columns:
+        keyed = df_labeled[KEY_COLUMN].notna()
+        # 主键查找走哈希索引，同一主键以最后一条为准
+        labels = (
+            df_labeled.loc[keyed, [KEY_COLUMN, 'sub_category']]
+            .drop_duplicates(subset=[KEY_COLUMN], keep='last')
+            .set_index(KEY_COLUMN)['sub_category']
+        )
+        legacy = df_labeled.loc[~keyed]
+    else:
+        labels = pd.Series(dtype=object)
+        legacy = df_labeled
+    found = df[KEY_COLUMN].map(labels).astype(object)
+    if not legacy.empty:
+        by_time = (
+            legacy[['Date', 'Time', 'sub_category']]
+            .drop_duplicates(subset=['Date', 'Time'])
+            .set_index(['Date', 'Time'])['sub_category']
+        )
+        unmatched = found.isna()
+        times = pd.MultiIndex.from_frame(df.loc[unmatched, ['Date', 'Time']])
+        found[unmatched] = by_time.reindex(times).to_numpy()
+    if RULE_COLUMN in df.columns:
+        found = found.mask(df[RULE_COLUMN].notna())
+    df['sub_category'] = found.combine_first(df['sub_category'])
+    return df
 
-def process_row(idx):
-    prompt = row_to_prompt(df.loc[idx])
-    try:
-        label = deepseek_label(prompt, DEEPSEEK_API_KEY)
-        return idx, label, None
-    except Exception as e:
-        return idx, None, e
 
-# 使用线程池并发处理，最大并发数设置为10（可根据API限制调整）
-max_workers = 250
-with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-    futures = {executor.submit(process_row, idx): idx for idx in indices_to_process}
+def load_labeled(labeled_path=LABELED_PATH):
+    """读取已标注数据；首次运行文件不存在时返回空表"""
+    if not table_exists(labeled_path):
+        return pd.DataFrame({
+            KEY_COLUMN: pd.Series(dtype=object),
+            'Date': pd.Series(dtype='datetime64[ns]'),
+            'Time': pd.Series(dtype=object),
+            'sub_category': pd.Series(dtype=object),
+        })
+    return read_table(labeled_path, categories=False)
 
-    for i, future in enumerate(tqdm(concurrent.futures.as_completed(futures), total=len(futures))):
-        idx = futures[future]
+
+async def process_row(client, df, idx):
+    """单行请求；回答不是合法标签时重新请求，始终不合法则该行保持未标注并返回错误"""
+    error = None
+    for _ in range(ROW_ATTEMPTS):
         try:
-            result_idx, label, error = future.result()
-            if error:
-                print(f"Error at {result_idx}: {error}")
-            else:
-                df.at[result_idx, 'sub_category'] = label
-                # 每处理100条数据保存一次进度
-                if i % 100 == 0:
-                    df.to_csv('Data/cleaned_labeled.csv', index=False)
+            return {idx: parse_row_label(await client.chat(row_to_prompt(df.loc[idx])))}, None
+        except ValueError as e:
+            error = e
         except Exception as e:
-            print(f"Unexpected error processing {idx}: {e}")
+            return {}, e
+    return {}, error
+
+
+async def process_batch(client, df, indices):
+    """一次请求标注多行；返回格式异常的批次对半拆分后重试，直到单行"""
+    if len(indices) == 1:
+        return await process_row(client, df, indices[0])
+    try:
+        content = await client.chat(batch_prompt(df, indices), json_output=True)
+        return parse_batch_labels(content, indices), None
+    except ValueError:
+        mid = len(indices) // 2
+        (left, left_error), (right, right_error) = await asyncio.gather(
+            process_batch(client, df, indices[:mid]),
+            process_batch(client, df, indices[mid:]),
+        )
+        return {**left, **right}, left_error or right_error
+    except Exception as e:
+        return {}, e
+
+
+async def run_batches(df, batches, client_options, on_result):
+    """通过异步客户端并发标注所有批次，每完成一批调用 on_result(batch, labels, error)"""
+    # httpx 与 tqdm 只在真正调用 API 时导入，保持 `pf label --help` 等命令启动迅速
+    from tqdm import tqdm
+    from label_client import LabelClient
+
+    async with LabelClient(**client_options) as client:
+
+        async def run(batch):
+            labels, error = await process_batch(client, df, batch)
+            return batch, labels, error
+
+        tasks = [asyncio.create_task(run(batch)) for batch in batches]
+        for i, task in enumerate(tqdm(asyncio.as_completed(tasks), total=len(tasks))):
+            batch, labels, error = await task
+            on_result(i, batch, labels, error)
+
+
+def apply_cached_labels(df, cache, keys):
+    """用商户级缓存填充未标注的行，返回仍需调用 API 的 {商户键: 行索引} 分组"""
+    # 只读不写：已有的 sub_category 可能来自本地分类器或商户规则，不能当作 DeepSeek 的答案写入缓存
+    labeled = df['sub_category'].notna() & (df['sub_category'] != '')
+    pending = keys[~labeled]
+    cached = pending.map(cache.get_many(pending.tolist())).dropna()
+    df.loc[cached.index, 'sub_category'] = cached
+    pending = pending.drop(cached.index)
+    return pending.groupby(pending, sort=False).groups
+
+
+def apply_classifier(df, indices, classifier, threshold, rows_for):
+    """用本地分类器标注置信度达到阈值的代表行，返回仍需调用 API 的代表行"""
+    if classifier is None or not indices:
+        return indices
+    predicted, confidence = classifier.predict(df.loc[indices])
+    confident = confidence.index[confidence >= threshold]
+    rows_labeled = 0
+    for idx in confident:
+        rows = rows_for(idx)
+        df.loc[rows, 'sub_category'] = predicted[idx]
+        rows_labeled += len(rows)
+    print(f"Classifier: labeled {rows_labeled} rows ({len(confident)}/{len(indices)} requests saved).")
+    confident = set(confident)
+    return [idx for idx in indices if idx not in confident]
+
+
+def label_transactions(
+    df, output_path=LABELED_PATH, api_key=DEEPSEEK_API_KEY, cache=None,
+    batch_size=BATCH_SIZE, client_options=None, journal_path=LABEL_JOURNAL_PATH,
+    classifier=None, classifier_threshold=CONFIDENCE_THRESHOLD
+):
+    """为 sub_category 为空的行调用 DeepSeek 标注，写出并返回标注后的数据
+
+    传入 cache 时先用商户级缓存解析，同一商户键的行只请求一次 API，结果回填到所有同键行。
+    batch_size 大于 1 时每个请求打包多行并要求返回 JSON。client_options 传给 LabelClient，
+    用于调整并发上限、每分钟请求/token 预算与重试次数。
+    每个标签到达时追加写入 journal_path，全部完成后一次性写出数据集并清空日志；
+    output_path 为 None 时不写出也不清空日志，由调用方写出完整数据集后再清空（见 watch.py）。
+    传入 classifier 时，置信度不低于 classifier_threshold 的行由本地分类器直接标注，不调用 API，
+    其结果也不写入缓存，以免把猜测当作 DeepSeek 的答案保存下来。
+    """
+    with span('label.cache', len(df)) as step:
+        if cache is not None:
+            keys = merchant_keys(df)
+            groups = apply_cached_labels(df, cache, keys)
+            indices_to_process = [indices[0] for indices in groups.values()]
+
+            def rows_for(idx):
+                return groups[keys[idx]]
+        else:
+            mask = df['sub_category'].isna() | (df['sub_category'] == '')
+            indices_to_process = df[mask].index.tolist()
+
+            def rows_for(idx):
+                return [idx]
+        step.rows_out = len(indices_to_process)
+    with span('label.classifier', len(indices_to_process)) as step:
+        indices_to_process = apply_classifier(
+            df, indices_to_process, classifier, classifier_threshold, rows_for
+        )
+        step.rows_out = len(indices_to_process)
+    batch_size = max(batch_size, 1)
+    batches = [
+        indices_to_process[start:start + batch_size]
+        for start in range(0, len(indices_to_process), batch_size)
+    ]
+    stats = UsageStats()
+    options = {
+        'api_key': api_key,
+        'url': DEEPSEEK_API_URL,
+        'max_concurrency': MAX_CONCURRENCY,
+        'requests_per_minute': REQUESTS_PER_MINUTE,
+        'tokens_per_minute': TOKENS_PER_MINUTE,
+        **(client_options or {}),
+        'stats': stats,
+    }
+
+    journal = LabelJournal(journal_path)
+    # on_result 运行在事件循环线程上，逐条提交 SQLite 会拖慢请求调度；先缓冲，攒够一批再提交
+    pending_cache = {}
+
+    def flush_cache():
+        if cache is not None and pending_cache:
+            cache.put_many(pending_cache)
+            pending_cache.clear()
+
+    def on_result(i, batch, labels, error):
+        if error:
+            print(f"Error at {batch}: {error}")
+        for result_idx, label in labels.items():
+            rows = rows_for(result_idx)
+            if cache is not None:
+                pending_cache[keys[result_idx]] = label
+            df.loc[rows, 'sub_category'] = label
+            journal.append(df.loc[rows, KEY_COLUMN], label)
+        stats.add_labeled(len(labels))
+        if len(pending_cache) >= CACHE_FLUSH_SIZE:
+            flush_cache()
+
+    try:
+        with span('label.api', len(indices_to_process)) as step:
+            started = time.perf_counter()
+            try:
+                # 全部由缓存或分类器标注时不创建客户端，也不导入 httpx
+                if batches:
+                    asyncio.run(run_batches(df, batches, options, on_result))
+            finally:
+                step.rows_out = stats.labeled_rows
+                step.metrics.update(stats.metrics(time.perf_counter() - started))
+    finally:
+        # 中途出错时也写入已得到的标签
+        flush_cache()
+        journal.close()
+
+    print("Labeling completed.")
+    print(stats.report())
+    if cache is not None:
+        print(cache.report())
+    df = df.drop_duplicates(subset=[KEY_COLUMN])
+    if output_path is None:
+        return df
+    with span('label.write', len(df)):
+        write_table(df, output_path)
+    journal.clear()
+    return df
+
+
+def label_frame(
+    df, labeled_path=LABELED_PATH, use_cache=True, batch_size=BATCH_SIZE, client_options=None,
+    use_classifier=True, classifier_threshold=CONFIDENCE_THRESHOLD
+):
+    """标注流程：合并已有标注后只为新行调用 API
+
+    use_cache 控制是否使用商户级缓存；use_classifier 控制是否先用已标注历史训练的本地分类器预标注。
+    """
+    # 类别列需要逐值改写，保持为普通字符串列
+    with span('label.merge_labeled', len(df)) as step:
+        df = ensure_keys(apply_schema(df, categories=False))
+        df = merge_labeled(df, load_labeled(labeled_path))
+        # 回放上次中断前已写入日志的标签，避免重复调用 API
+        df = merge_labeled(df, replay_journal(LABEL_JOURNAL_PATH))
+        step.rows_out = len(df)
+    with span('label.train_classifier', len(df)):
+        classifier = train_classifier(df) if use_classifier else None
+    options = {
+        'batch_size': batch_size,
+        'client_options': client_options,
+        'classifier': classifier,
+        'classifier_threshold': classifier_threshold,
+    }
+    if not use_cache:
+        return label_transactions(df, labeled_path, **options)
+    cache = LabelCache(version=instruction_version(LABEL_INSTRUCTION))
+    try:
+        return label_transactions(df, labeled_path, cache=cache, **options)
+    finally:
+        cache.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Label transactions with DeepSeek.")
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Do not resolve or store labels in the merchant-level label cache.",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=BATCH_SIZE,
+        help=f"Transactions per API request; 1 sends one plain prompt per row (default: {BATCH_SIZE}).",
+    )
+    parser.add_argument(
+        "--max-concurrency",
+        type=int,
+        default=MAX_CONCURRENCY,
+        help=f"Upper bound on in-flight requests (default: {MAX_CONCURRENCY}).",
+    )
+    parser.add_argument(
+        "--rpm",
+        type=float,
+        default=REQUESTS_PER_MINUTE,
+        help="Requests-per-minute budget (default: unlimited).",
+    )
+    parser.add_argument(
+        "--tpm",
+        type=float,
+        default=TOKENS_PER_MINUTE,
+        help="Tokens-per-minute budget (default: unlimited).",
+    )
+    parser.add_argument(
+        "--no-classifier",
+        action="store_true",
+        help="Send every unlabeled row to the API instead of pre-labeling confident rows locally.",
+    )
+    parser.add_argument(
+        "--classifier-threshold",
+        type=float,
+        default=CONFIDENCE_THRESHOLD,
+        help=f"Minimum local classifier confidence to skip the API (default: {CONFIDENCE_THRESHOLD}).",
+    )
+    add_profile_arguments(parser)
+    args = parser.parse_args(argv)
+    client_options = {
+        'max_concurrency': args.max_concurrency,
+        'requests_per_minute': args.rpm,
+        'tokens_per_minute': args.tpm,
+    }
+    with profiled(args, 'label'):
+        # 0. 读取数据
+        with span('label.read') as step:
+            df = read_table(CLEANED_PATH, categories=False)
+            step.rows_out = len(df)
+        label_frame(
+            df,
+            use_cache=not args.no_cache,
+            batch_size=args.batch_size,
+            client_options=client_options,
+            use_classifier=not args.no_classifier,
+            classifier_threshold=args.classifier_threshold,
+        )
+
 
-print("Labeling completed.")
-df.to_csv('Data/cleaned_labeled.csv', index=False)
-pd.read_csv('Data/cleaned_labeled.csv').drop_duplicates().to_csv('Data/cleaned_labeled.csv', index=False)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+import hashlib
+import sqlite3
+from pathlib import Path
+
+import pandas as pd
+
+LABEL_CACHE_PATH = Path("Data/cache/labels.sqlite")
+# 指纹字段：同一商户、同一描述、同一类别和收支方向的流水视为同一类
+KEY_COLUMNS = ["Counterparty", "Product_Description", "Category", "in/out"]
+
+
+def normalize_column(values: pd.Series) -> pd.Series:
+    """Lowercase, NFKC-normalize and collapse whitespace; mask long digit runs."""
+    text = values.astype(object).where(values.notna(), "").astype(str)
+    return (
+        text.str.normalize("NFKC")
+        .str.lower()
+        .str.replace(r"\d{4,}", "#", regex=True)
+        .str.replace(r"\s+", " ", regex=True)
+        .str.strip()
+    )
+
+
+def merchant_keys(df: pd.DataFrame) -> pd.Series:
+    """Return the normalized (Counterparty, Product_Description, Category, in/out) key per row."""
+    parts = [normalize_column(df[col]) for col in KEY_COLUMNS]
+    keys = parts[0]
+    for part in parts[1:]:
+        keys = keys + "\x1f" + part
+    return keys
+
+
+class LabelCache:
+    """SQLite-backed map from merchant key to sub_category.
+
+    The cache remembers the version of the label instruction it was filled
+    with and empties itself when that version changes, so editing the label
+    set in ``row_to_prompt`` invalidates every cached answer.
+    """
+
+    def __init__(self, path: Path = LABEL_CACHE_PATH, version: str = "") -> None:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS labels (key TEXT PRIMARY KEY, label TEXT NOT NULL)")
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        if row is None or row[0] != version:
+            self.conn.execute("DELETE FROM labels")
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (version,))
+        self.conn.commit()
+        self.hits = 0
+        self.lookups = 0
+
+    def get_many(self, keys: list[str]) -> dict[str, str]:
+        """Look up distinct keys; every key counts as one lookup for the hit rate."""
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        for start in range(0, len(unique), 500):
+            chunk = unique[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            found.update(
+                self.conn.execute(
+                    f"SELECT key, label FROM labels WHERE key IN ({placeholders})", chunk
+                ).fetchall()
+            )
+        self.lookups += len(unique)
+        self.hits += len(found)
+        return found
+
+    def put_many(self, items: dict[str, str]) -> None:
+        self.conn.executemany("INSERT OR REPLACE INTO labels VALUES (?, ?)", items.items())
+        self.conn.commit()
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM labels").fetchone()[0]
+
+    def report(self) -> str:
+        rate = self.hits / self.lookups * 100 if self.lookups else 0.0
+        return (
+            f"Label cache: {self.hits}/{self.lookups} merchant keys hit ({rate:.1f}%), "
+            f"{len(self)} entries"
+        )
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+def instruction_version(instruction: str) -> str:
+    return hashlib.sha256(instruction.encode("utf-8")).hexdigest()
@@ -0,0 +1,186 @@
+import asyncio
+import random
+import time
+
+import httpx
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class RateBudget:
+    """Token bucket that refills ``per_minute`` units evenly over a minute.
+
+    Used for both the requests-per-minute and the tokens-per-minute budget.
+    A budget of ``None`` or 0 never blocks.
+    """
+
+    def __init__(self, per_minute: float | None) -> None:
+        self.capacity = per_minute or 0
+        self.available = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.available = min(
+            self.capacity, self.available + (now - self.updated) * self.capacity / 60
+        )
+        self.updated = now
+
+    async def acquire(self, amount: float = 1) -> None:
+        if not self.capacity:
+            return
+        amount = min(amount, self.capacity)
+        async with self.lock:
+            while True:
+                self._refill()
+                if self.available >= amount:
+                    self.available -= amount
+                    return
+                await asyncio.sleep((amount - self.available) * 60 / self.capacity)
+
+    def adjust(self, delta: float) -> None:
+        """Charge (or refund) the difference between estimated and actual usage."""
+        if self.capacity:
+            self.available -= delta
+
+
+class AdaptiveConcurrency:
+    """AIMD limit on in-flight requests.
+
+    The limit grows by roughly one slot per window of fast successful requests,
+    shrinks by 10% when latency exceeds the target and halves on rate limiting.
+    """
+
+    def __init__(self, initial: int, maximum: int, target_latency: float) -> None:
+        self.limit = float(max(1, min(initial, maximum)))
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.in_flight = 0
+        self.condition = asyncio.Condition()
+
+    async def __aenter__(self) -> "AdaptiveConcurrency":
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        async with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def on_success(self, latency: float) -> None:
+        if latency <= self.target_latency:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        else:
+            self.limit = max(1.0, self.limit * 0.9)
+
+    def on_throttle(self) -> None:
+        self.limit = max(1.0, self.limit / 2)
+
+
+class LabelClient:
+    """Async DeepSeek chat client with a pooled connection, retries and budgets.
+
+    Requests are retried on 429/5xx and transport errors with full-jitter
+    exponential backoff (honouring ``Retry-After``), in-flight concurrency
+    adapts to observed latency and throttling, and every request waits for
+    its share of the requests/tokens-per-minute budgets. ``stats`` only needs
+    ``record(usage, latency)`` and ``add_retry()``.
+    """
+
+    def __init__(
+        self,
+        api_key: str | None,
+        url: str,
+        max_concurrency: int = 250,
+        initial_concurrency: int = 16,
+        target_latency: float = 10.0,
+        requests_per_minute: float | None = None,
+        tokens_per_minute: float | None = None,
+        max_retries: int = 5,
+        backoff_base: float = 0.5,
+        backoff_cap: float = 30.0,
+        timeout: float = 60.0,
+        stats=None,
+    ) -> None:
+        self.api_key = api_key
+        self.url = url
+        self.max_concurrency = max_concurrency
+        self.concurrency = AdaptiveConcurrency(initial_concurrency, max_concurrency, target_latency)
+        self.request_budget = RateBudget(requests_per_minute)
+        self.token_budget = RateBudget(tokens_per_minute)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.timeout = timeout
+        self.stats = stats
+        self.client: httpx.AsyncClient | None = None
+
+    async def __aenter__(self) -> "LabelClient":
+        self.client = httpx.AsyncClient(
+            headers={
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": "application/json",
+            },
+            limits=httpx.Limits(
+                max_connections=self.max_concurrency,
+                max_keepalive_connections=self.max_concurrency,
+            ),
+            timeout=self.timeout,
+        )
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.client.aclose()
+
+    def backoff(self, attempt: int, retry_after: str | None = None) -> float:
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+        if retry_after:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        return delay
+
+    async def chat(self, prompt: str, json_output: bool = False) -> str:
+        data = {
+            "model": "deepseek-chat",
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": 0,
+        }
+        if json_output:
+            data["response_format"] = {"type": "json_object"}
+        # 粗略估算：中文约每字一个 token，响应按请求的四分之一预留
+        estimated_tokens = len(prompt) * 5 // 4
+        for attempt in range(self.max_retries + 1):
+            await self.request_budget.acquire()
+            await self.token_budget.acquire(estimated_tokens)
+            async with self.concurrency:
+                started = time.monotonic()
+                try:
+                    response = await self.client.post(self.url, json=data)
+                except httpx.TransportError:
+                    if attempt == self.max_retries:
+                        raise
+                    response = None
+                latency = time.monotonic() - started
+            if response is not None and response.status_code not in RETRY_STATUSES:
+                response.raise_for_status()
+                self.concurrency.on_success(latency)
+                body = response.json()
+                usage = body.get("usage", {})
+                self.token_budget.adjust(usage.get("total_tokens", estimated_tokens) - estimated_tokens)
+                if self.stats is not None:
+                    self.stats.record(usage, latency)
+                return body["choices"][0]["message"]["content"].strip()
+            if response is not None and response.status_code == 429:
+                self.concurrency.on_throttle()
+            if attempt == self.max_retries:
+                response.raise_for_status()
+            if self.stats is not None:
+                self.stats.add_retry()
+            retry_after = response.headers.get("Retry-After") if response is not None else None
+            await asyncio.sleep(self.backoff(attempt, retry_after))
+        raise RuntimeError("unreachable")
@@ -0,0 +1,75 @@
+import json
+import os
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from storage import KEY_COLUMN
+
+LABEL_JOURNAL_PATH = Path("Data/cache/label_journal.jsonl")
+
+
+class LabelJournal:
+    """Append-only JSONL log of labels as they arrive from the API.
+
+    Each line records one labeled row as ``{"Txn_ID", "sub_category"}``.
+    Lines are flushed immediately and fsynced in batches (every
+    ``fsync_every`` records or ``fsync_interval`` seconds), so a crash loses
+    at most one batch while a normal run never rewrites the dataset.
+    """
+
+    def __init__(self, path: Path = LABEL_JOURNAL_PATH, fsync_every: int = 100, fsync_interval: float = 1.0) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = self.path.open("a", encoding="utf-8")
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.pending = 0
+        self.synced_at = time.monotonic()
+
+    def append(self, keys: pd.Series, label: str) -> None:
+        """Record ``label`` for every transaction key in ``keys``."""
+        for key in keys:
+            record = {KEY_COLUMN: key, "sub_category": label}
+            self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+        self.pending += len(keys)
+        if self.pending >= self.fsync_every or time.monotonic() - self.synced_at >= self.fsync_interval:
+            self.sync()
+
+    def sync(self) -> None:
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.pending = 0
+        self.synced_at = time.monotonic()
+
+    def close(self) -> None:
+        if not self.file.closed:
+            self.sync()
+            self.file.close()
+
+    def clear(self) -> None:
+        """Drop the journal once its labels are compacted into the dataset."""
+        self.close()
+        self.path.unlink(missing_ok=True)
+
+
+def replay_journal(path: Path = LABEL_JOURNAL_PATH) -> pd.DataFrame:
+    """Read the journal back as (Txn_ID, Date, Time, sub_category); later entries win.
+
+    A truncated last line from an interrupted write is ignored. Journals
+    written before transactions had keys carry Date/Time instead of Txn_ID.
+    """
+    records = []
+    path = Path(path)
+    if path.exists():
+        with path.open(encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+    journal = pd.DataFrame(records, columns=[KEY_COLUMN, "Date", "Time", "sub_category"])
+    journal["Date"] = pd.to_datetime(journal["Date"], errors="coerce")
+    return journal.drop_duplicates(subset=[KEY_COLUMN, "Date", "Time"], keep="last")
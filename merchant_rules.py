@@ -0,0 +1,143 @@
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# 用户可编辑的商户规则：[[关键词, 子类], ...] 或 [[关键词, 子类, 字段], ...]，按顺序先匹配者生效
+MERCHANT_RULES_PATH = "Data/merchant_rules.json"
+RULE_FIELDS = ["Counterparty", "Product_Description"]
+# 记录命中规则的列，格式为 "字段:关键词"；未命中的行为空
+RULE_COLUMN = "Label_Rule"
+NO_MATCH = np.iinfo(np.int64).max
+
+
+class KeywordAutomaton:
+    """Aho–Corasick automaton that finds the first-listed keyword occurring in a text.
+
+    The keywords share one trie; failure links let a single left-to-right
+    pass over the text report every keyword ending at each position, so the
+    cost per text is its length, not the number of keywords. Each state keeps
+    the lowest keyword index among the keywords it (or its failure chain)
+    completes, so a search only has to track a running minimum.
+    """
+
+    def __init__(self, keywords: list[str]) -> None:
+        self.goto: list[dict[str, int]] = [{}]
+        self.fail = [0]
+        self.first = [NO_MATCH]
+        for index, keyword in enumerate(keywords):
+            state = 0
+            for char in keyword:
+                nxt = self.goto[state].get(char)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[state][char] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.first.append(NO_MATCH)
+                state = nxt
+            self.first[state] = min(self.first[state], index)
+        # 按层次遍历补全失败链接，浅层状态先于深层状态完成
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for char, nxt in self.goto[state].items():
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[nxt] = self.goto[fallback].get(char, 0)
+                self.first[nxt] = min(self.first[nxt], self.first[self.fail[nxt]])
+                queue.append(nxt)
+
+    def search(self, text: str) -> int:
+        """Index of the first-listed keyword found in ``text``, or ``NO_MATCH``."""
+        goto, fail, first = self.goto, self.fail, self.first
+        state, best = 0, NO_MATCH
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if first[state] < best:
+                best = first[state]
+        return best
+
+    def search_column(self, values: pd.Series) -> np.ndarray:
+        """``search`` every row, scanning each distinct value once."""
+        codes, uniques = pd.factorize(values)
+        found = np.fromiter(
+            (self.search(str(value).lower()) for value in uniques), dtype=np.int64, count=len(uniques)
+        )
+        # 缺失值的编码为 -1，对应末尾追加的 NO_MATCH
+        return np.append(found, NO_MATCH)[codes]
+
+
+class MerchantRules:
+    """Keyword → sub_category rules compiled to one automaton per field."""
+
+    def __init__(self, rules: list[tuple[str, str, str | None]]) -> None:
+        self.rules = [(keyword.lower(), label, field) for keyword, label, field in rules if keyword]
+        self.automata = {}
+        for field in RULE_FIELDS:
+            indices = [i for i, (_, _, only) in enumerate(self.rules) if only in (None, field)]
+            if indices:
+                automaton = KeywordAutomaton([self.rules[i][0] for i in indices])
+                self.automata[field] = (automaton, np.append(np.array(indices, dtype=np.int64), NO_MATCH))
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def apply(self, df: pd.DataFrame) -> pd.Series:
+        """Fill ``sub_category`` and ``Label_Rule`` of the rows a rule matches (in place).
+
+        Every field is scanned once; when several rules match a row the one
+        listed first in the file wins, whichever field it matched. Rows no
+        rule matches keep their ``sub_category`` (empty when there was none).
+        Returns the mask of matched rows.
+        """
+        if "sub_category" not in df.columns:
+            df["sub_category"] = ""
+        rule_names = np.full(len(df), None, dtype=object)
+        matched = np.zeros(len(df), dtype=bool)
+        if self.automata:
+            fields = [field for field in self.automata if field in df.columns]
+            hits = np.full((len(fields), len(df)), NO_MATCH, dtype=np.int64)
+            for i, field in enumerate(fields):
+                automaton, to_rule = self.automata[field]
+                local = automaton.search_column(df[field])
+                # 字段内的关键词编号换算为规则文件中的编号
+                hits[i] = to_rule[np.minimum(local, len(to_rule) - 1)]
+            if fields:
+                winner = hits.argmin(axis=0)
+                best = hits[winner, np.arange(len(df))]
+                matched = best != NO_MATCH
+                rows = np.flatnonzero(matched)
+                labels = np.array([label for _, label, _ in self.rules], dtype=object)
+                names = np.array(
+                    [f"{field}:{keyword}" for field in fields for keyword, _, _ in self.rules], dtype=object
+                ).reshape(len(fields), len(self.rules))
+                rule_names[rows] = names[winner[rows], best[rows]]
+                df.iloc[rows, df.columns.get_loc("sub_category")] = labels[best[rows]]
+        df[RULE_COLUMN] = rule_names
+        return pd.Series(matched, index=df.index)
+
+
+def load_merchant_rules(rules_path: str | Path = MERCHANT_RULES_PATH) -> MerchantRules | None:
+    """Read the rule file; returns None when it does not exist.
+
+    Each entry is ``[keyword, sub_category]`` (matched in every field of
+    ``RULE_FIELDS``) or ``[keyword, sub_category, field]``. Keywords match
+    case-insensitively as substrings.
+    """
+    path = Path(rules_path)
+    if not path.exists():
+        return None
+    with path.open(encoding="utf-8") as f:
+        entries = json.load(f)
+    rules = []
+    for entry in entries:
+        keyword, label, *rest = entry
+        field = rest[0] if rest else None
+        if field is not None and field not in RULE_FIELDS:
+            raise ValueError(f"unknown field in merchant rule {entry!r}; expected one of {RULE_FIELDS}")
+        rules.append((str(keyword), str(label), field))
+    return MerchantRules(rules)
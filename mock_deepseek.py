@@ -0,0 +1,175 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from label import LABELS
+
+ROW_PATTERN = re.compile(r"^(\d+)\. ", re.MULTILINE)
+
+
+class MockOptions:
+    """Behaviour of the mock endpoint: latency, throttling and failure injection."""
+
+    def __init__(
+        self,
+        latency: float = 0.2,
+        jitter: float = 0.1,
+        max_in_flight: int | None = None,
+        requests_per_minute: int | None = None,
+        error_rate: float = 0.0,
+        malformed_rate: float = 0.0,
+        retry_after: float = 1.0,
+    ) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self.max_in_flight = max_in_flight
+        self.requests_per_minute = requests_per_minute
+        self.error_rate = error_rate
+        self.malformed_rate = malformed_rate
+        self.retry_after = retry_after
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.recent = deque()
+        self.counts = {"ok": 0, "throttled": 0, "errors": 0}
+
+
+def pick_label(text: str) -> str:
+    return LABELS[sum(text.encode("utf-8")) % len(LABELS)]
+
+
+def completion(prompt: str, json_output: bool, malformed: bool) -> str:
+    if not json_output:
+        return pick_label(prompt)
+    if malformed:
+        return '{"labels": [ {"id": 1, "label": "未知"'
+    lines = prompt.splitlines()
+    labels = [
+        {"id": int(match.group(1)), "label": pick_label(line)}
+        for line in lines
+        if (match := ROW_PATTERN.match(line))
+    ]
+    return json.dumps({"labels": labels}, ensure_ascii=False)
+
+
+def make_handler(options: MockOptions) -> type[BaseHTTPRequestHandler]:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # 头部与正文分两次写出，关闭 Nagle 避免与延迟 ACK 叠加出约 40ms 的额外延迟
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args) -> None:
+            pass
+
+        def send_json(self, status: int, body: dict, headers: dict | None = None) -> None:
+            payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def throttled(self) -> bool:
+            now = time.monotonic()
+            with options.lock:
+                while options.recent and now - options.recent[0] > 60:
+                    options.recent.popleft()
+                if options.max_in_flight and options.in_flight >= options.max_in_flight:
+                    return True
+                if options.requests_per_minute and len(options.recent) >= options.requests_per_minute:
+                    return True
+                options.recent.append(now)
+                options.in_flight += 1
+                return False
+
+        def do_POST(self) -> None:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            if self.throttled():
+                with options.lock:
+                    options.counts["throttled"] += 1
+                self.send_json(429, {"error": "rate limited"}, {"Retry-After": f"{options.retry_after:g}"})
+                return
+            try:
+                time.sleep(max(0.0, random.gauss(options.latency, options.jitter)))
+                if random.random() < options.error_rate:
+                    with options.lock:
+                        options.counts["errors"] += 1
+                    self.send_json(500, {"error": "internal error"})
+                    return
+                prompt = request["messages"][0]["content"]
+                json_output = request.get("response_format", {}).get("type") == "json_object"
+                content = completion(prompt, json_output, random.random() < options.malformed_rate)
+                with options.lock:
+                    options.counts["ok"] += 1
+                self.send_json(
+                    200,
+                    {
+                        "choices": [{"message": {"role": "assistant", "content": content}}],
+                        "usage": {
+                            "prompt_tokens": len(prompt),
+                            "completion_tokens": len(content),
+                            "total_tokens": len(prompt) + len(content),
+                        },
+                    },
+                )
+            finally:
+                with options.lock:
+                    options.in_flight -= 1
+
+    return Handler
+
+
+def serve(port: int = 0, options: MockOptions | None = None) -> ThreadingHTTPServer:
+    """Start the mock server on a background thread and return it.
+
+    The chat completions URL is ``http://127.0.0.1:{server.server_port}/v1/chat/completions``;
+    call ``server.shutdown()`` to stop it.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(options or MockOptions()))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Local mock of the DeepSeek chat completions endpoint for label.py."
+    )
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.2, help="Mean response latency in seconds.")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Std-dev of the latency in seconds.")
+    parser.add_argument("--max-in-flight", type=int, help="Answer 429 above this many concurrent requests.")
+    parser.add_argument("--rpm", type=int, help="Answer 429 above this many requests per minute.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 500.")
+    parser.add_argument(
+        "--malformed-rate", type=float, default=0.0, help="Fraction of batch answers with broken JSON."
+    )
+    parser.add_argument(
+        "--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429 answers (default: 1)."
+    )
+    args = parser.parse_args()
+    options = MockOptions(
+        latency=args.latency,
+        jitter=args.jitter,
+        max_in_flight=args.max_in_flight,
+        requests_per_minute=args.rpm,
+        error_rate=args.error_rate,
+        malformed_rate=args.malformed_rate,
+        retry_after=args.retry_after,
+    )
+    server = serve(args.port, options)
+    print(f"Mock DeepSeek listening on http://127.0.0.1:{server.server_port}/v1/chat/completions")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+import argparse
+import importlib
+import sys
+from typing import Sequence
+
+# 子命令 -> (模块, 额外参数, 帮助)。模块在子命令执行时才导入，
+# `pf --help` 不会加载 pandas、matplotlib 或 httpx。
+COMMANDS = {
+    "update": ("update", [], "Merge new Alipay/WeChat statements into the updated table."),
+    "reconcile": ("reconcile", [], "List the payments recorded by both Alipay and WeChat."),
+    "clean": ("clean", [], "Clean the merged statements."),
+    "label": ("label", [], "Label sub_category with the local classifier and DeepSeek."),
+    "classifier": ("classifier", [], "Evaluate the local sub_category classifier on held-out labeled rows."),
+    "analyze": ("analysis", [], "Write the markdown summary and render charts."),
+    "report": ("analysis", ["--no-plots"], "Write the markdown summary only, without charts."),
+    "pipeline": ("pipeline", [], "Run update, clean, label and analysis with stage caching."),
+    "serve": ("query_server", [], "Serve cached summaries and breakdowns of the labeled data over HTTP/JSON."),
+    "watch": ("watch", [], "Watch the statement folders and refresh the tables and report on new files."),
+}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="pf",
+        description="Personal finance pipeline. Run `pf <command> --help` for the options of a command.",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True, metavar="<command>")
+    for name, (_, _, help_text) in COMMANDS.items():
+        # 子命令的参数由对应模块自己的 main 解析
+        subparsers.add_parser(name, help=help_text, add_help=False)
+    return parser
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    args, rest = build_parser().parse_known_args(argv)
+    module_name, extra, _ = COMMANDS[args.command]
+    module = importlib.import_module(module_name)
+    sys.argv[0] = f"pf {args.command}"
+    module.main([*extra, *rest])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+import argparse
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Callable, Sequence
+
+import pandas as pd
+
+from profiling import add_profile_arguments, profiled, span
+from storage import read_table, table_exists
+
+CACHE_PATH = Path("Data/cache/pipeline.json")
+
+
+def frame_fingerprint(df: pd.DataFrame) -> str:
+    """Hash the column names and row contents of a DataFrame."""
+    digest = hashlib.sha256()
+    digest.update("\x1f".join(map(str, df.columns)).encode("utf-8"))
+    digest.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return digest.hexdigest()
+
+
+def stage_key(*parts: Any) -> str:
+    """Combine the upstream fingerprint and stage parameters into a cache key."""
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def file_signature(paths: Sequence[str | Path]) -> list[tuple[str, int, int]]:
+    """Return (path, size, mtime_ns) for every existing path."""
+    signature = []
+    for path in paths:
+        if os.path.exists(path):
+            stat = os.stat(path)
+            signature.append((str(path), stat.st_size, stat.st_mtime_ns))
+    return signature
+
+
+def load_cache(cache_path: Path = CACHE_PATH) -> dict:
+    if not cache_path.exists():
+        return {}
+    return json.loads(cache_path.read_text(encoding="utf-8"))
+
+
+def save_cache(cache: dict, cache_path: Path = CACHE_PATH) -> None:
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    cache_path.write_text(json.dumps(cache, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+def run_stage(
+    cache: dict,
+    name: str,
+    key: str,
+    compute: Callable[[], Any],
+    output_path: Path,
+    fingerprint: Callable[[Any], str] = frame_fingerprint,
+    complete: Callable[[Any], bool] | None = None,
+    exists: Callable[[Path], bool] = table_exists,
+) -> tuple[str, Callable[[], Any]]:
+    """Run a stage, or skip it when its key matches the previous run.
+
+    Returns the fingerprint of the stage output and a loader for the output.
+    Skipped stages load their persisted output lazily, so a chain of unchanged
+    stages never touches the data. Results for which ``complete`` returns False
+    (e.g. rows still waiting for a label) are not cached.
+    """
+    entry = cache.get(name)
+    if entry is not None and entry["key"] == key and exists(output_path):
+        print(f"[{name}] inputs unchanged, skipped.")
+        return entry["fingerprint"], lambda: read_table(output_path, categories=False)
+    with span(f"pipeline.{name}") as step:
+        result = compute()
+        if isinstance(result, pd.DataFrame):
+            step.rows_out = len(result)
+    with span(f"pipeline.{name}.fingerprint"):
+        result_fingerprint = fingerprint(result)
+    if complete is None or complete(result):
+        cache[name] = {"key": key, "fingerprint": result_fingerprint}
+    else:
+        cache.pop(name, None)
+    save_cache(cache)
+    return result_fingerprint, lambda: result
+
+
+def statement_files() -> list[str]:
+    import update
+
+    return update.list_statement_files(update.ALIPAY_DIR) + update.list_statement_files(update.WECHAT_DIR)
+
+
+def update_key() -> str:
+    import reconcile
+
+    return stage_key("update", file_signature(statement_files()), reconcile.MATCH_TOLERANCE)
+
+
+def clean_key(updated_fp: str) -> str:
+    import clean
+
+    return stage_key(
+        "clean", updated_fp, file_signature([clean.CATEGORY_RULES_PATH, clean.MERCHANT_RULES_PATH])
+    )
+
+
+def label_key(cleaned_fp: str) -> str:
+    return stage_key("label", cleaned_fp)
+
+
+def label_complete(df: pd.DataFrame) -> bool:
+    """Whether every row has a label; results still waiting for one are not cached."""
+    return not (df["sub_category"].isna() | (df["sub_category"] == "")).any()
+
+
+def run_pipeline(
+    full: bool = False,
+    max_workers: int | None = None,
+    period: Sequence[str] | None = None,
+    plots_dir: Path = Path("Analysis/plots"),
+    force: bool = False,
+) -> Path:
+    """Run update → clean → label → analysis in one process.
+
+    DataFrames are handed from stage to stage in memory; each stage is keyed on
+    the fingerprint of its input and its parameters, and is skipped when the
+    key is unchanged since the last run.
+    """
+    import update
+    import clean
+
+    cache = {} if force else load_cache()
+
+    if full:
+        cache.pop("update", None)
+
+    def run_update() -> pd.DataFrame:
+        df = update.update(full=full, max_workers=max_workers)
+        # 没有新账单时对账参数可能已经改变，在已有数据上重新对账
+        return df if df is not None else update.reconcile_updated()
+
+    updated_fp, load_updated = run_stage(
+        cache, "update", update_key(), run_update, update.UPDATED_PATH
+    )
+
+    cleaned_fp, load_cleaned = run_stage(
+        cache,
+        "clean",
+        clean_key(updated_fp),
+        lambda: clean.clean_and_merge(update.UPDATED_PATH, clean.OUTPUT_PATH, df=load_updated()),
+        clean.OUTPUT_PATH,
+    )
+
+    import label
+
+    labeled_fp, load_labeled = run_stage(
+        cache,
+        "label",
+        label_key(cleaned_fp),
+        lambda: label.label_frame(load_cleaned()),
+        label.LABELED_PATH,
+        complete=label_complete,
+    )
+
+    import analysis
+
+    start, end = analysis.parse_period(period)
+    summary_path = Path("Analysis/markdown") / f"{analysis.build_basename(start, end)}.md"
+
+    def run_analysis() -> Path:
+        cleaned = analysis.clean_transactions(load_labeled())
+        return analysis.run_analysis(cleaned, start, end, plots_dir)
+
+    run_stage(
+        cache,
+        "analysis",
+        stage_key("analysis", labeled_fp, period, str(plots_dir)),
+        run_analysis,
+        summary_path,
+        fingerprint=lambda path: hashlib.sha256(path.read_bytes()).hexdigest(),
+        exists=Path.exists,
+    )
+    return summary_path
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Run update, clean, label and analysis in a single process."
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Rebuild the merged statements from every file instead of incrementally.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of processes used to parse statement files (default: all CPU cores).",
+    )
+    parser.add_argument(
+        "--period",
+        nargs=2,
+        metavar=("START", "END"),
+        help="Optional inclusive date range (YYYY-MM-DD) to limit the analysis.",
+    )
+    parser.add_argument(
+        "--plots-dir",
+        type=Path,
+        default=Path("Analysis/plots"),
+        help="Directory to store generated visuals.",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Ignore cached stage fingerprints and run every stage.",
+    )
+    add_profile_arguments(parser)
+    args = parser.parse_args(argv)
+    with profiled(args, "pipeline"):
+        run_pipeline(
+            full=args.full,
+            max_workers=args.workers,
+            period=args.period,
+            plots_dir=args.plots_dir,
+            force=args.force,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import concurrent.futures
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import NamedTuple
+
+import pandas as pd
+
+PLOT_FORMATS = ["png", "svg"]
+PLOT_CACHE_NAME = ".plot_cache.json"
+# 绘图代码或样式变化时递增，让已缓存的图片全部重新绘制
+PLOT_STYLE_VERSION = 1
+
+
+class PlotJob(NamedTuple):
+    """One chart to render: its kind, the Series it draws and where it goes."""
+
+    kind: str
+    data: pd.Series
+    path: Path
+    total: float = 0.0
+
+
+def pyplot():
+    """Import matplotlib with the headless Agg backend on first use."""
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    # 设置matplotlib支持中文显示
+    plt.rcParams['font.sans-serif'] = ['Arial Unicode MS', 'SimHei', 'Microsoft YaHei', 'PingFang SC', 'STHeiti']  # 优先使用这些字体
+    plt.rcParams['axes.unicode_minus'] = False  # 解决负号显示问题
+    # SVG 中保留文字而不是把字形转成路径，文件更小、生成更快
+    plt.rcParams['svg.fonttype'] = 'none'
+    return plt
+
+
+def subcategory_pie_job(
+    by_sub: pd.Series, output_dir: Path, base_name: str, fmt: str = "png", min_percentage: float = 2.0
+) -> tuple[PlotJob | None, pd.Series]:
+    positive = by_sub[by_sub > 0]
+    total = positive.sum()
+    if positive.empty or total == 0:
+        return None, positive
+    percentages = positive / total * 100
+    keep_large = percentages >= min_percentage
+    filtered = positive[keep_large].copy()
+    others_sum = positive[~keep_large].sum()
+    if others_sum > 0:
+        filtered["Other (<2%)"] = others_sum
+    if filtered.empty:
+        return None, positive
+    path = output_dir / f"{base_name}_expenses_by_sub_category.{fmt}"
+    return PlotJob("subcategory_pie", filtered, path), positive
+
+
+def minor_subcategories_job(
+    by_sub: pd.Series,
+    total: float,
+    output_dir: Path,
+    base_name: str,
+    fmt: str = "png",
+    min_percentage: float = 2.0,
+) -> PlotJob | None:
+    if total == 0:
+        return None
+    percentages = by_sub / total * 100
+    minor = by_sub[percentages < min_percentage]
+    if minor.empty:
+        return None
+    path = output_dir / f"{base_name}_minor_subcategory_comparison.{fmt}"
+    return PlotJob("minor_pie", minor, path, float(total))
+
+
+def spending_trend_job(daily: pd.Series, output_dir: Path, base_name: str, fmt: str = "png") -> PlotJob | None:
+    if daily.empty:
+        return None
+    return PlotJob("trend", daily, output_dir / f"{base_name}_spending_time_series.{fmt}")
+
+
+def render_plot(job: PlotJob) -> Path:
+    """Draw and save a single chart; runs in a worker process."""
+    plt = pyplot()
+    data = job.data
+    if job.kind == "trend":
+        fig, ax = plt.subplots(figsize=(10, 4))
+        ax.plot(data.index, data.values, marker="o")
+        ax.set_title("Daily Expense Trend")
+        ax.set_xlabel("Date")
+        ax.set_ylabel("Spent (CNY)")
+        ax.grid(True, linestyle="--", alpha=0.4)
+        fig.autofmt_xdate()
+    else:
+        fig, ax = plt.subplots(figsize=(6, 6))
+        if job.kind == "minor_pie":
+            minor_total = data.sum()
+
+            def autopct(pct: float) -> str:
+                relative = pct * minor_total / job.total
+                return f"{relative:.1f}%"
+
+            title = "Minor Sub-categories (<2% of total spending)"
+        else:
+            autopct = "%1.1f%%"
+            title = "Expenses by Sub-category"
+        ax.pie(
+            data,
+            labels=data.index,
+            autopct=autopct,
+            startangle=140,
+            textprops={"fontsize": 8},
+        )
+        ax.set_title(title)
+    job.path.parent.mkdir(parents=True, exist_ok=True)
+    fig.savefig(job.path, bbox_inches="tight")
+    plt.close(fig)
+    return job.path
+
+
+def job_digest(job: PlotJob) -> str:
+    """Hash everything that determines the rendered image."""
+    digest = hashlib.sha256()
+    digest.update(f"{PLOT_STYLE_VERSION}\x1f{job.kind}\x1f{job.path.suffix}\x1f{job.total!r}".encode("utf-8"))
+    digest.update(pd.util.hash_pandas_object(job.data, index=True).values.tobytes())
+    return digest.hexdigest()
+
+
+def load_plot_cache(output_dir: Path) -> dict[str, str]:
+    cache_path = output_dir / PLOT_CACHE_NAME
+    if not cache_path.exists():
+        return {}
+    return json.loads(cache_path.read_text(encoding="utf-8"))
+
+
+def save_plot_cache(output_dir: Path, cache: dict[str, str]) -> None:
+    output_dir.mkdir(parents=True, exist_ok=True)
+    (output_dir / PLOT_CACHE_NAME).write_text(json.dumps(cache, indent=2), encoding="utf-8")
+
+
+def render_plots(jobs: list[PlotJob], max_workers: int | None = None) -> tuple[int, int]:
+    """Render charts whose content changed; return (rendered, reused).
+
+    Each output directory keeps a ``.plot_cache.json`` of file name to content
+    hash. A chart whose file already holds the same hash is left alone, one
+    whose hash matches another existing file is copied from it, and the rest
+    are drawn on a process pool (in-process when only one worker would run).
+    """
+    caches = {directory: load_plot_cache(directory) for directory in {job.path.parent for job in jobs}}
+    targets = {job.path for job in jobs}
+    # 本次会被覆盖的文件不能作为复制来源
+    existing = {
+        digest: directory / name
+        for directory, cache in caches.items()
+        for name, digest in cache.items()
+        if (directory / name).exists() and directory / name not in targets
+    }
+    to_render: dict[str, PlotJob] = {}
+    to_copy: list[tuple[str, Path]] = []
+    reused = 0
+    for job in jobs:
+        digest = job_digest(job)
+        cache = caches[job.path.parent]
+        if cache.get(job.path.name) == digest and job.path.exists():
+            existing.setdefault(digest, job.path)
+            reused += 1
+        elif digest in to_render or digest in existing:
+            to_copy.append((digest, job.path))
+        else:
+            to_render[digest] = job
+        cache[job.path.name] = digest
+
+    workers = min(max_workers or os.cpu_count() or 1, len(to_render))
+    if workers <= 1:
+        for job in to_render.values():
+            render_plot(job)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(render_plot, to_render.values()))
+
+    for digest, path in to_copy:
+        source = to_render[digest].path if digest in to_render else existing[digest]
+        path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(source, path)
+        reused += 1
+    for directory, cache in caches.items():
+        save_plot_cache(directory, cache)
+    return len(to_render), reused
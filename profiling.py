@@ -0,0 +1,209 @@
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Iterator
+
+# 延迟直方图的桶上界（秒），最后一个桶收集更慢的请求
+LATENCY_BUCKETS = [0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60]
+
+
+def peak_rss_mb() -> float | None:
+    """Peak resident memory of this process so far in MB, where the platform reports it."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 为单位，macOS 以字节为单位
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def latency_histogram(latencies: list[float], buckets: list[float] = LATENCY_BUCKETS) -> dict:
+    """Counts per latency bucket plus percentiles, for a list of seconds."""
+    counts = {f"<={bound}s": 0 for bound in buckets}
+    counts[f">{buckets[-1]}s"] = 0
+    for latency in latencies:
+        for bound in buckets:
+            if latency <= bound:
+                counts[f"<={bound}s"] += 1
+                break
+        else:
+            counts[f">{buckets[-1]}s"] += 1
+    ordered = sorted(latencies)
+
+    def percentile(q: float) -> float | None:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 4) if ordered else None
+
+    return {"buckets": counts, "p50": percentile(0.5), "p90": percentile(0.9), "p99": percentile(0.99)}
+
+
+class Span:
+    """One timed step; set ``rows_out`` (and extra ``metrics``) inside the ``with`` block."""
+
+    def __init__(self, name: str, rows_in: int | None = None) -> None:
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out: int | None = None
+        self.metrics: dict = {}
+
+
+class Tracer:
+    """Collect named, nested step timings of one process.
+
+    Disabled tracers still run the wrapped code but record nothing, so steps
+    can be instrumented unconditionally. Steps whose name is in ``cprofile``
+    (or every step when it contains ``"all"``) also run under cProfile and
+    dump their stats as ``<name>.prof`` into ``cprofile_dir``; a step nested
+    in one already being profiled is covered by the outer dump.
+    """
+
+    def __init__(
+        self, enabled: bool = False, cprofile: list[str] | None = None, cprofile_dir: Path = Path(".")
+    ) -> None:
+        self.enabled = enabled
+        self.cprofile = set(cprofile or [])
+        self.cprofile_dir = cprofile_dir
+        self.events: list[dict] = []
+        self.stack: list[str] = []
+        self.profiling = False
+        self.origin = time.perf_counter()
+
+    @contextlib.contextmanager
+    def span(self, name: str, rows_in: int | None = None) -> Iterator[Span]:
+        span = Span(name, rows_in)
+        if not self.enabled:
+            yield span
+            return
+        profiler = None
+        # 同一时刻只能有一个 cProfile 处于启用状态，嵌套步骤已包含在外层的统计中
+        if not self.profiling and (name in self.cprofile or "all" in self.cprofile):
+            import cProfile
+
+            profiler = cProfile.Profile()
+            self.profiling = True
+        parent = self.stack[-1] if self.stack else None
+        depth = len(self.stack)
+        self.stack.append(name)
+        wall, cpu = time.perf_counter(), time.process_time()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield span
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                self.profiling = False
+            wall_end, cpu_end = time.perf_counter(), time.process_time()
+            self.stack.pop()
+            event = {
+                "name": name,
+                "parent": parent,
+                "depth": depth,
+                "start_s": round(wall - self.origin, 6),
+                "wall_s": round(wall_end - wall, 6),
+                "cpu_s": round(cpu_end - cpu, 6),
+                # ru_maxrss 只增不减，即到该步骤结束为止的进程峰值
+                "peak_rss_mb": peak_rss_mb(),
+                "rows_in": span.rows_in,
+                "rows_out": span.rows_out,
+            }
+            if span.metrics:
+                event["metrics"] = span.metrics
+            self.events.append(event)
+            if profiler is not None:
+                self.cprofile_dir.mkdir(parents=True, exist_ok=True)
+                profiler.dump_stats(self.cprofile_dir / f"{name}.prof")
+
+    def to_json(self) -> dict:
+        return {"pid": os.getpid(), "argv": sys.argv, "steps": self.events}
+
+    def to_chrome_trace(self) -> dict:
+        """The steps as complete ("X") events for chrome://tracing or Perfetto."""
+        events = []
+        for event in self.events:
+            args = {
+                key: value for key, value in event.items() if key not in ("name", "start_s", "wall_s", "depth")
+            }
+            events.append({
+                "name": event["name"],
+                "ph": "X",
+                "ts": event["start_s"] * 1e6,
+                "dur": event["wall_s"] * 1e6,
+                "pid": os.getpid(),
+                "tid": 0,
+                "args": args,
+            })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write(self, path: str | Path, fmt: str = "json") -> Path:
+        path = Path(path)
+        payload = self.to_chrome_trace() if fmt == "chrome" else self.to_json()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+        return path
+
+    def summary(self) -> str:
+        """Steps as an indented table, in start order."""
+        lines = [f"{'step':<36}{'wall s':>9}{'cpu s':>9}{'peak MB':>9}{'rows in':>11}{'rows out':>11}"]
+        # 子步骤先于父步骤结束，按开始时间排序后父步骤排在前面
+        for event in sorted(self.events, key=lambda e: (e["start_s"], e["depth"])):
+            name = "  " * event["depth"] + event["name"]
+            rows_in = "" if event["rows_in"] is None else f"{event['rows_in']:,}"
+            rows_out = "" if event["rows_out"] is None else f"{event['rows_out']:,}"
+            peak = "" if event["peak_rss_mb"] is None else f"{event['peak_rss_mb']:.0f}"
+            lines.append(
+                f"{name:<36}{event['wall_s']:>9.3f}{event['cpu_s']:>9.3f}{peak:>9}{rows_in:>11}{rows_out:>11}"
+            )
+        return "\n".join(lines)
+
+
+# 进程内共享的追踪器；--profile 打开后各阶段的步骤都记录到这里
+TRACER = Tracer()
+
+
+def span(name: str, rows_in: int | None = None):
+    """Time a step on the shared tracer: ``with span("clean.sort", len(df)) as s: ...``."""
+    return TRACER.span(name, rows_in)
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser) -> None:
+    group = parser.add_argument_group("profiling")
+    group.add_argument(
+        "--profile",
+        type=Path,
+        metavar="PATH",
+        help="Write a per-step trace (wall/CPU time, peak RSS, row counts) to PATH.",
+    )
+    group.add_argument(
+        "--profile-format",
+        choices=["json", "chrome"],
+        default="json",
+        help="Trace format: plain JSON or Chrome trace events (default: json).",
+    )
+    group.add_argument(
+        "--cprofile",
+        action="append",
+        metavar="STEP",
+        help="Also run STEP under cProfile and dump STEP.prof next to the trace; 'all' for every step.",
+    )
+
+
+@contextlib.contextmanager
+def profiled(args: argparse.Namespace, name: str) -> Iterator[Tracer]:
+    """Enable the shared tracer for ``--profile`` and write the trace when the stage ends."""
+    global TRACER
+    if not getattr(args, "profile", None):
+        yield TRACER
+        return
+    TRACER = Tracer(enabled=True, cprofile=args.cprofile, cprofile_dir=args.profile.parent)
+    try:
+        with TRACER.span(name):
+            yield TRACER
+    finally:
+        path = TRACER.write(args.profile, args.profile_format)
+        print(TRACER.summary())
+        print(f"Profile written to {path}")
@@ -0,0 +1,414 @@
+import argparse
+import json
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, NamedTuple, Sequence
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from analysis import (
+    clean_transactions,
+    covers_whole_days,
+    filter_transactions_by_period,
+    load_transactions,
+    parse_period,
+    rollup_period,
+    summary_from_rollup,
+)
+from profiling import add_profile_arguments, profiled, span
+from rollup import DIGEST_COLUMNS, build_rollup, day_digests, source_signature
+from storage import table_path
+
+# 查询参数 -> 可筛选的列，多个取值以逗号分隔
+FILTER_COLUMNS = {
+    "flow": "flow",
+    "category": "Category",
+    "sub_category": "sub_category",
+    "payment_method": "Payment_Method",
+}
+TOP_COLUMNS = ["datetime", "Amount", "flow", "Category", "sub_category", "Product_Description", "Payment_Method"]
+# 任何一列变化都会让覆盖当天的缓存结果失效
+SERVED_COLUMNS = DIGEST_COLUMNS + ["Product_Description"]
+MAX_TOP_N = 1000
+
+
+class Query(NamedTuple):
+    """A parsed, normalized query; equal queries share one cache entry."""
+
+    start: pd.Timestamp | None
+    end: pd.Timestamp | None
+    filters: tuple[tuple[str, tuple[str, ...]], ...]
+    by: str | None = None
+    n: int = 10
+
+    def days(self) -> tuple[str, str] | None:
+        """The inclusive ISO day range the result depends on; None for the whole history."""
+        if self.start is None:
+            return None
+        return self.start.strftime("%Y-%m-%d"), self.end.strftime("%Y-%m-%d")
+
+
+def parse_query(params: dict[str, list[str]], default_flow: str | None = None) -> Query:
+    """Build a Query from URL parameters; raises ValueError for invalid input."""
+
+    def single(name: str) -> str | None:
+        values = params.get(name)
+        return values[-1] if values else None
+
+    start, end = single("start"), single("end")
+    if (start is None) != (end is None):
+        raise ValueError("start and end must be given together")
+    start, end = parse_period([start, end] if start is not None else None)
+    by = single("by")
+    if by is not None and by not in FILTER_COLUMNS:
+        raise ValueError(f"by must be one of {', '.join(FILTER_COLUMNS)}")
+    filters = []
+    for name, column in FILTER_COLUMNS.items():
+        values = sorted({v.strip() for raw in params.get(name, []) for v in raw.split(",") if v.strip()})
+        # 按收支分组时不套用默认的收支筛选
+        if name == "flow" and not values and default_flow and by != "flow":
+            values = [default_flow]
+        if values:
+            filters.append((column, tuple(values)))
+    n = single("n")
+    try:
+        n = 10 if n is None else int(n)
+    except ValueError:
+        raise ValueError("n must be an integer") from None
+    if not 1 <= n <= MAX_TOP_N:
+        raise ValueError(f"n must be between 1 and {MAX_TOP_N}")
+    return Query(start, end, tuple(filters), FILTER_COLUMNS.get(by), n)
+
+
+def filter_mask(df: pd.DataFrame, filters: tuple[tuple[str, tuple[str, ...]], ...]) -> np.ndarray:
+    mask = np.ones(len(df), dtype=bool)
+    for column, values in filters:
+        mask &= df[column].isin(values).to_numpy()
+    return mask
+
+
+class Snapshot:
+    """One loaded version of the ledger.
+
+    Besides the cleaned rows it keeps their daily rollup, which answers
+    totals, breakdowns and daily series for whole-day periods without
+    touching the rows, and the expense rows ordered by amount so a top-N
+    query only has to filter and take the first N.
+    """
+
+    def __init__(self, cleaned: pd.DataFrame, signature: list, version: int) -> None:
+        self.cleaned = cleaned
+        self.signature = signature
+        self.version = version
+        self.rollup = build_rollup(cleaned)
+        self.digests = day_digests(cleaned, SERVED_COLUMNS)
+        expense = np.flatnonzero((cleaned["flow"] == "expense").to_numpy())
+        # 稳定排序，金额相同时保持原有顺序，与 select_top_expenses 一致
+        order = np.argsort(-cleaned["Amount"].to_numpy()[expense], kind="stable")
+        self.expenses_by_amount = cleaned.iloc[expense[order]][TOP_COLUMNS]
+
+    def scoped_rollup(self, query: Query) -> pd.DataFrame:
+        """The rollup rows matching the query; periods with partial days are re-aggregated from rows."""
+        if covers_whole_days(query.start, query.end):
+            rollup = rollup_period(self.rollup, query.start, query.end)
+        else:
+            rollup = build_rollup(filter_transactions_by_period(self.cleaned, query.start, query.end))
+        return rollup[filter_mask(rollup, query.filters)]
+
+
+def query_summary(snapshot: Snapshot, query: Query) -> dict:
+    rollup = snapshot.scoped_rollup(query)
+    summary = summary_from_rollup(rollup, snapshot.cleaned.iloc[:0])
+    return {
+        "income": round(summary.income, 2),
+        "expenses": round(summary.expenses, 2),
+        "net": round(summary.net, 2),
+        "investment_total": round(summary.investment_total, 2),
+        "transactions": int(rollup["count"].sum()),
+    }
+
+
+def query_breakdown(snapshot: Snapshot, query: Query) -> dict:
+    by = query.by or "Category"
+    grouped = snapshot.scoped_rollup(query).groupby(by, observed=True)
+    totals = grouped.agg(amount=("amount_sum", "sum"), transactions=("count", "sum"))
+    totals.index = totals.index.astype(object)
+    totals = totals.sort_index().sort_values("amount", ascending=False, kind="stable")
+    return {
+        "by": by,
+        "groups": [
+            {"key": key, "amount": round(float(amount), 2), "transactions": int(count)}
+            for key, amount, count in zip(totals.index, totals["amount"], totals["transactions"])
+        ],
+    }
+
+
+def query_daily(snapshot: Snapshot, query: Query) -> dict:
+    daily = snapshot.scoped_rollup(query).groupby("date")["amount_sum"].sum().sort_index()
+    return {
+        "daily": [
+            {"date": day.strftime("%Y-%m-%d"), "amount": round(float(amount), 2)} for day, amount in daily.items()
+        ]
+    }
+
+
+def query_top(snapshot: Snapshot, query: Query) -> dict:
+    rows = filter_transactions_by_period(snapshot.expenses_by_amount, query.start, query.end)
+    rows = rows.iloc[np.flatnonzero(filter_mask(rows, query.filters))[:query.n]]
+    return {
+        "top": [
+            {
+                "datetime": None if pd.isna(row.datetime) else row.datetime.isoformat(),
+                "amount": round(float(row.Amount), 2),
+                "category": row.Category,
+                "sub_category": row.sub_category,
+                "description": None if pd.isna(row.Product_Description) else row.Product_Description,
+                "payment_method": None if pd.isna(row.Payment_Method) else row.Payment_Method,
+            }
+            for row in rows.itertuples(index=False)
+        ]
+    }
+
+
+# 路径 -> (查询函数, 未指定 flow 时的默认值)；明细类查询与报告一样默认只看支出
+ENDPOINTS: dict[str, tuple[Callable[[Snapshot, Query], dict], str | None]] = {
+    "/summary": (query_summary, None),
+    "/breakdown": (query_breakdown, "expense"),
+    "/daily": (query_daily, "expense"),
+    "/top": (query_top, None),
+}
+
+
+class QueryCache:
+    """LRU cache of encoded query results, each tagged with the days it depends on."""
+
+    def __init__(self, max_entries: int = 1024) -> None:
+        self.max_entries = max_entries
+        self.entries: OrderedDict[tuple, tuple[tuple[str, str] | None, bytes]] = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.invalidated = 0
+
+    def get(self, key: tuple) -> bytes | None:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: tuple, days: tuple[str, str] | None, payload: bytes) -> None:
+        with self.lock:
+            self.entries[key] = (days, payload)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evicted += 1
+
+    def invalidate(self, changed_days: set[str]) -> int:
+        """Drop the results whose period covers a changed day; rows without a date only affect whole-history results."""
+        dated = sorted(day for day in changed_days if day != "NaT")
+
+        def affected(days: tuple[str, str] | None) -> bool:
+            if days is None:
+                return bool(changed_days)
+            # ISO 日期按字符串比较即按时间先后
+            lo = np.searchsorted(dated, days[0], side="left")
+            return lo < len(dated) and dated[lo] <= days[1]
+
+        with self.lock:
+            stale = [key for key, (days, _) in self.entries.items() if affected(days)]
+            for key in stale:
+                del self.entries[key]
+            self.invalidated += len(stale)
+        return len(stale)
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "evicted": self.evicted,
+                "invalidated": self.invalidated,
+            }
+
+
+class Ledger:
+    """The labeled transactions held in memory, reloaded when the table on disk changes.
+
+    A reload compares per-day content digests with the previous version and
+    drops only the cached results whose period covers a changed day, so
+    queries about untouched months stay cached across updates.
+    """
+
+    def __init__(self, path: Path, cache_size: int = 1024) -> None:
+        self.path = path
+        self.cache = QueryCache(cache_size)
+        self.lock = threading.Lock()
+        self.snapshot = self.load(0)
+
+    def load(self, version: int) -> Snapshot:
+        with span("serve.load") as step:
+            signature = source_signature(self.path)
+            snapshot = Snapshot(clean_transactions(load_transactions(self.path)), signature, version)
+            step.rows_out = len(snapshot.cleaned)
+        return snapshot
+
+    def refresh(self) -> int | None:
+        """Reload if the table changed; return the number of changed days, or None when unchanged."""
+        if source_signature(self.path) == self.snapshot.signature:
+            return None
+        old = self.snapshot
+        new = self.load(old.version + 1)
+        changed = {
+            day for day in set(old.digests) | set(new.digests) if old.digests.get(day) != new.digests.get(day)
+        }
+        # 先切换快照再失效缓存，之后写入缓存的只可能是新快照上的结果
+        with self.lock:
+            self.snapshot = new
+            dropped = self.cache.invalidate(changed)
+        print(
+            f"Reloaded {self.path}: {len(new.cleaned)} rows, {len(changed)} day(s) changed, "
+            f"{dropped} cached result(s) dropped."
+        )
+        return len(changed)
+
+    def query(self, endpoint: str, params: dict[str, list[str]]) -> tuple[bytes, bool]:
+        """Answer a query as JSON bytes; the flag tells whether it came from the cache."""
+        function, default_flow = ENDPOINTS[endpoint]
+        query = parse_query(params, default_flow)
+        key = (endpoint, query)
+        payload = self.cache.get(key)
+        if payload is not None:
+            return payload, True
+        snapshot = self.snapshot
+        payload = json.dumps(function(snapshot, query), ensure_ascii=False).encode("utf-8")
+        with self.lock:
+            # 计算期间快照已被替换时不缓存，避免旧结果绕过失效
+            if snapshot is self.snapshot:
+                self.cache.put(key, query.days(), payload)
+        return payload, False
+
+    def status(self) -> dict:
+        snapshot = self.snapshot
+        return {
+            "path": str(self.path),
+            "version": snapshot.version,
+            "rows": len(snapshot.cleaned),
+            "rollup_rows": len(snapshot.rollup),
+            "cache": self.cache.stats(),
+        }
+
+    def watch(self, interval: float) -> None:
+        while True:
+            time.sleep(interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                # 例如文件正在被替换；保留旧快照，下次轮询重试
+                print(f"Reload failed: {e}")
+
+
+def make_handler(ledger: Ledger) -> type[BaseHTTPRequestHandler]:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args) -> None:
+            pass
+
+        def send_payload(self, status: int, payload: bytes, headers: dict | None = None) -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def send_json(self, status: int, body: dict) -> None:
+            self.send_payload(status, json.dumps(body, ensure_ascii=False).encode("utf-8"))
+
+        def do_GET(self) -> None:
+            url = urlsplit(self.path)
+            if url.path == "/status":
+                self.send_json(200, ledger.status())
+                return
+            if url.path not in ENDPOINTS:
+                self.send_json(404, {"error": f"unknown path {url.path}", "paths": [*ENDPOINTS, "/status"]})
+                return
+            started = time.perf_counter()
+            try:
+                payload, hit = ledger.query(url.path, parse_qs(url.query))
+            except ValueError as e:
+                self.send_json(400, {"error": str(e)})
+                return
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.send_payload(
+                200,
+                payload,
+                {"X-Cache": "hit" if hit else "miss", "Server-Timing": f"query;dur={elapsed_ms:.2f}"},
+            )
+
+    return Handler
+
+
+def serve(ledger: Ledger, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Start the query server on a background thread and return it; ``server.shutdown()`` stops it."""
+    server = ThreadingHTTPServer((host, port), make_handler(ledger))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Serve summaries of the labeled transactions over HTTP/JSON.")
+    parser.add_argument(
+        "input_file",
+        nargs="?",
+        type=Path,
+        default=table_path("Data/cleaned_labeled"),
+        help="Path to the labeled transactions table (Parquet, Feather or CSV).",
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1).")
+    parser.add_argument("--port", type=int, default=8766, help="Port to listen on (default: 8766).")
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=1024,
+        help="Query results kept in the LRU cache (default: 1024).",
+    )
+    parser.add_argument(
+        "--refresh",
+        type=float,
+        default=2.0,
+        help="Seconds between checks of the table for new transactions (default: 2).",
+    )
+    add_profile_arguments(parser)
+    args = parser.parse_args(argv)
+
+    with profiled(args, "serve"):
+        ledger = Ledger(args.input_file, args.cache_size)
+        server = serve(ledger, args.host, args.port)
+        print(f"Query server on http://{args.host}:{server.server_port} ({ledger.status()['rows']} rows)")
+        try:
+            ledger.watch(args.refresh)
+        except KeyboardInterrupt:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
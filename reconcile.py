@@ -0,0 +1,256 @@
+import argparse
+import os
+import re
+from pathlib import Path
+from typing import Sequence
+
+import numpy as np
+import pandas as pd
+
+from label_cache import normalize_column
+from profiling import add_profile_arguments, profiled, span
+from storage import KEY_COLUMN, read_table, table_path, write_table
+
+# 两个平台记录同一笔资金往来的最大时间差（秒），设为 0 时不做对账
+MATCH_TOLERANCE = float(os.getenv("PF_MATCH_TOLERANCE", "180"))
+MATCHES_PATH = table_path("Data/update/reconciled")
+MATCH_ID_COLUMN = "Match_ID"
+MATCH_KIND_COLUMN = "Match_Kind"
+# 同一笔支出/收入被两边重复记录：保留支付宝一侧（信息更全），去掉微信一侧
+KEPT, DUPLICATE = "kept", "duplicate"
+# 方向不同（一边转出一边转入，或一边不计收支）：两边都是账户间的资金移动，清洗时记为不计收支
+TRANSFER = "transfer"
+# 只有账户间资金往来的类别才会在两个平台各记一次；两侧的原始类别都须命中，
+# 普通消费即便金额相同、时间相近也是两笔真实支出，不参与配对
+TRANSFER_CATEGORIES = re.compile(r"转账|零钱|账户存取|信用借还|还款|提现|inner_transfer|credit_pay")
+# 多条记录争抢同一对手时，每轮只确定时间最近的一对；轮数有上限，整体仍为 O(n log n)
+MATCH_ROUNDS = 4
+REVIEW_COLUMNS = [
+    KEY_COLUMN, "Date", "Time", "in/out", "Amount", "Category", "Counterparty", "Product_Description",
+    "Payment_Method",
+]
+
+
+def contains(values: np.ndarray, queries: np.ndarray) -> np.ndarray:
+    """Whether each query occurs in ``values``, by binary search in the sorted values."""
+    values = np.sort(values)
+    if not len(values):
+        return np.zeros(queries.shape, dtype=bool)
+    index = np.minimum(np.searchsorted(values, queries), len(values) - 1)
+    return values[index] == queries
+
+
+def match_candidates(df: pd.DataFrame, tolerance: pd.Timedelta) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Alipay and WeChat rows that could pair up, with timestamp, amount in cents, direction and payee.
+
+    Platforms are told apart by the ``Txn_ID`` prefix; legacy ``row:`` keys,
+    timeless detail rows and rows whose category is not a movement between
+    accounts (``TRANSFER_CATEGORIES``) never take part. A row is kept only when the
+    other platform has the same amount within the days its time window
+    spans, so times are parsed for the few plausible rows, not the history.
+    """
+    # 转为定长 7 字符的数组即截取前缀，不必逐行调用字符串方法
+    platform = df[KEY_COLUMN].to_numpy(dtype=object).astype("U7")
+    valid = (df["Date"].notna() & df["Time"].notna() & df["Amount"].notna()).to_numpy()
+    # 每个不同的类别只匹配一次正则；缺失类别的编码为 -1，对应末尾追加的 False
+    codes, uniques = pd.factorize(df["Category"])
+    movable = np.array([bool(TRANSFER_CATEGORIES.search(str(cat))) for cat in uniques] + [False])
+    valid &= movable[codes]
+    day = df["Date"].to_numpy().astype("datetime64[D]").astype(np.int64)
+    cents = np.round(df["Amount"].astype(float).fillna(0).to_numpy() * 100).astype(np.int64)
+    # (日期, 金额) 编为一个整数；时间窗跨越的相邻日期都要检查
+    key = (day << 36) + cents
+    reach = np.arange(-(tolerance.days + 1), tolerance.days + 2, dtype=np.int64) << 36
+    alipay = np.flatnonzero(valid & (platform == "alipay:"))
+    wechat = np.flatnonzero(valid & (platform == "wechat:"))
+    alipay = alipay[contains(key[wechat], key[alipay][:, None] + reach).any(axis=1)]
+    wechat = wechat[contains(key[alipay], key[wechat][:, None] - reach).any(axis=1)]
+
+    def frame(positions: np.ndarray) -> pd.DataFrame:
+        rows = df.iloc[positions]
+        candidates = pd.DataFrame({
+            "row": positions,
+            "ts": rows["Date"].to_numpy() + pd.to_timedelta(rows["Time"].astype(str), errors="coerce").to_numpy(),
+            "cents": cents[positions],
+            "direction": rows["in/out"].astype(float).fillna(0).to_numpy().astype(np.int64),
+            # 归一化后的交易对方，同方向的两条记录只有付给同一人时才算重复
+            "payee": normalize_column(rows["Counterparty"]).to_numpy(dtype=object),
+        })
+        candidates = candidates[candidates["ts"].notna()]
+        return candidates.sort_values("ts", kind="stable", ignore_index=True)
+
+    return frame(alipay), frame(wechat)
+
+
+def nearest_pairs(left: pd.DataFrame, right: pd.DataFrame, by: list[str], tolerance: pd.Timedelta) -> pd.DataFrame:
+    """One-to-one pairs of ``left`` and ``right`` rows with equal ``by`` values, nearest in time.
+
+    ``merge_asof`` finds every left row's nearest right row in one sorted
+    pass; when several left rows pick the same right row only the closest
+    pair is kept and the rest try again against the remaining rows.
+    """
+    right = right.rename(columns={"row": "row_right"})
+    right["ts_right"] = right["ts"]
+    found = []
+    for _ in range(MATCH_ROUNDS):
+        if left.empty or right.empty:
+            break
+        joined = pd.merge_asof(
+            left, right[["ts", "ts_right", "row_right", *by]], on="ts", by=by,
+            direction="nearest", tolerance=tolerance,
+        )
+        joined = joined[joined["row_right"].notna()]
+        if joined.empty:
+            break
+        joined["gap"] = joined["ts_right"] - joined["ts"]
+        joined["distance"] = joined["gap"].abs()
+        joined = joined.sort_values(["distance", "row"], kind="stable").drop_duplicates("row_right")
+        found.append(joined[["row", "row_right", "gap"]])
+        left = left[~left["row"].isin(joined["row"])]
+        right = right[~right["row_right"].isin(joined["row_right"])]
+    if not found:
+        return pd.DataFrame({"row": [], "row_right": [], "gap": pd.to_timedelta([])})
+    pairs = pd.concat(found, ignore_index=True)
+    pairs["row_right"] = pairs["row_right"].astype(np.int64)
+    return pairs
+
+
+def reconcile(df: pd.DataFrame, tolerance: float = MATCH_TOLERANCE) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Pair the Alipay and WeChat rows that record the same money movement.
+
+    Two rows pair up when both are transfers, wallet top-ups/withdrawals or
+    credit repayments, carry the same amount and lie at most ``tolerance``
+    seconds apart; ordinary purchases never pair, however alike. Rows with
+    the same direction and the same normalized counterparty are matched
+    first (the same movement booked twice), then rows of opposite directions
+    (transfers between the two wallets, credit repayments). Two same-direction
+    transfers to different people are both real and never pair. Every pass
+    is a sorted join, so the cost stays O(n log n) over the full history.
+
+    The ``Match_ID`` (the other row's ``Txn_ID``) and ``Match_Kind`` columns
+    of ``df`` are rewritten in place; ``df`` and the pairs for review are returned.
+    """
+    matched_id = np.full(len(df), None, dtype=object)
+    kind = np.full(len(df), None, dtype=object)
+    pairs = pd.DataFrame()
+    if tolerance > 0 and KEY_COLUMN in df.columns and len(df):
+        with span("reconcile.match", len(df)) as step:
+            window = pd.Timedelta(seconds=tolerance)
+            alipay, wechat = match_candidates(df, window)
+            # 同方向的重复记录还要求交易对方相同；缺少交易对方的行无法确认，不参与
+            same = nearest_pairs(
+                alipay[alipay["payee"] != ""], wechat[wechat["payee"] != ""], ["cents", "direction", "payee"], window
+            )
+            alipay = alipay[~alipay["row"].isin(same["row"])]
+            wechat = wechat[~wechat["row"].isin(same["row_right"])]
+            # 其余记录只与方向不同的一侧配对：按支付宝一侧的方向分组，已配对的微信记录不再参与后续分组
+            found = [same]
+            for direction in np.unique(alipay["direction"]):
+                opposite = nearest_pairs(
+                    alipay[alipay["direction"] == direction], wechat[wechat["direction"] != direction], ["cents"], window
+                )
+                wechat = wechat[~wechat["row"].isin(opposite["row_right"])]
+                found.append(opposite)
+            pairs = pd.concat(found, ignore_index=True)
+            left, right = pairs["row"].to_numpy(np.int64), pairs["row_right"].to_numpy(np.int64)
+            keys = df[KEY_COLUMN].to_numpy(dtype=object)
+            directions = df["in/out"].astype(float).fillna(0).to_numpy()
+            transfer = directions[left] != directions[right]
+            matched_id[left], matched_id[right] = keys[right], keys[left]
+            kind[left] = np.where(transfer, TRANSFER, KEPT)
+            kind[right] = np.where(transfer, TRANSFER, DUPLICATE)
+            step.rows_out = len(pairs)
+            step.metrics.update(duplicates=int((~transfer).sum()), transfers=int(transfer.sum()))
+    df[MATCH_ID_COLUMN] = matched_id
+    df[MATCH_KIND_COLUMN] = kind
+    return df, review_pairs(df, pairs)
+
+
+def review_pairs(df: pd.DataFrame, pairs: pd.DataFrame) -> pd.DataFrame:
+    """One row per matched pair with both sides' details side by side, in time order.
+
+    ``gap_s`` is the WeChat time minus the Alipay time in seconds.
+    """
+    columns = [col for col in REVIEW_COLUMNS if col in df.columns]
+    if pairs.empty:
+        return pd.DataFrame(columns=["kind", "gap_s"] + [f"{p}_{c}" for p in ("alipay", "wechat") for c in columns])
+    alipay = df.iloc[pairs["row"].to_numpy()][columns].add_prefix("alipay_").reset_index(drop=True)
+    wechat = df.iloc[pairs["row_right"].to_numpy()][columns].add_prefix("wechat_").reset_index(drop=True)
+    review = pd.concat([
+        pd.DataFrame({
+            "kind": df[MATCH_KIND_COLUMN].iloc[pairs["row"].to_numpy()].replace(KEPT, DUPLICATE).to_numpy(),
+            "gap_s": pairs["gap"].dt.total_seconds().to_numpy(),
+        }),
+        alipay,
+        wechat,
+    ], axis=1)
+    return review.sort_values(["alipay_Date", "alipay_Time"], kind="stable", ignore_index=True)
+
+
+def match_marks(df: pd.DataFrame) -> set[tuple]:
+    """(Txn_ID, Match_ID, Match_Kind) of every matched row, for telling which rows a new run changed."""
+    if MATCH_KIND_COLUMN not in df.columns:
+        return set()
+    matched = df[df[MATCH_KIND_COLUMN].notna()]
+    return set(zip(matched[KEY_COLUMN], matched[MATCH_ID_COLUMN], matched[MATCH_KIND_COLUMN]))
+
+
+def collapse_matches(df: pd.DataFrame) -> pd.DataFrame:
+    """Drop the WeChat side of duplicated rows and book matched transfers as in/out 0 (in place)."""
+    if MATCH_KIND_COLUMN not in df.columns:
+        return df
+    kind = df[MATCH_KIND_COLUMN]
+    df.loc[kind == TRANSFER, "in/out"] = 0
+    df.drop(df.index[kind == DUPLICATE], inplace=True)
+    return df
+
+
+def print_pairs(review: pd.DataFrame, limit: int) -> None:
+    counts = review["kind"].value_counts()
+    print(
+        f"{len(review)} matched pair(s): {counts.get(DUPLICATE, 0)} duplicate(s), "
+        f"{counts.get(TRANSFER, 0)} transfer(s)."
+    )
+    for row in review.head(limit).itertuples(index=False):
+        print(
+            f"  {row.kind:<9} {row.alipay_Amount:>10,.2f}  "
+            f"alipay {row.alipay_Date:%Y-%m-%d} {row.alipay_Time} {row.alipay_Counterparty}  |  "
+            f"wechat {row.wechat_Time} ({row.gap_s:+.0f}s) {row.wechat_Counterparty}"
+        )
+    if len(review) > limit:
+        print(f"  ... {len(review) - limit} more")
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    import update
+
+    parser = argparse.ArgumentParser(
+        description="List the Alipay and WeChat rows of the updated table that record the same payment."
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=MATCH_TOLERANCE,
+        help="Largest time difference in seconds between the two records "
+        "(default: PF_MATCH_TOLERANCE or 180). The updated table itself is not changed.",
+    )
+    parser.add_argument("--limit", type=int, default=20, help="Number of pairs to print (default: 20).")
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=None,
+        help="Also write the pairs to this file (format from the suffix, e.g. .csv or .parquet).",
+    )
+    add_profile_arguments(parser)
+    args = parser.parse_args(argv)
+    with profiled(args, "reconcile"):
+        df = read_table(update.UPDATED_PATH, categories=False)
+        _, review = reconcile(df, args.tolerance)
+        print_pairs(review, args.limit)
+        if args.output is not None:
+            write_table(review, args.output)
+            print(f"Pairs written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import json
+import os
+from pathlib import Path
+from typing import Callable
+
+import pandas as pd
+
+from storage import ROW_GROUP_SIZE
+
+ROLLUP_PATH = Path("Data/cache/rollup.parquet")
+ROLLUP_META_PATH = Path("Data/cache/rollup.json")
+ROLLUP_KEYS = ["date", "flow", "Category", "sub_category", "Payment_Method"]
+# 参与汇总的列，任何一列变化都会让当天的汇总重建
+DIGEST_COLUMNS = ["datetime", "flow", "Category", "sub_category", "Payment_Method", "Amount"]
+
+
+def build_rollup(df: pd.DataFrame) -> pd.DataFrame:
+    """Aggregate cleaned transactions to one row per day × flow × category × sub-category × payment method.
+
+    Each row holds the sum, count and maximum of ``Amount``. Rows without a
+    date are kept under a NaT day so whole-history totals still include them.
+    """
+    keys = [df["datetime"].dt.normalize().rename("date")] + [
+        df[col].astype("category") for col in ROLLUP_KEYS[1:]
+    ]
+    grouped = df["Amount"].groupby(keys, observed=True, dropna=False)
+    rollup = grouped.agg(["sum", "count", "max"]).reset_index()
+    return rollup.rename(columns={"sum": "amount_sum", "count": "count", "max": "amount_max"})
+
+
+def merge_rollups(rollups: list[pd.DataFrame]) -> pd.DataFrame:
+    """Combine rollups of disjoint row sets into one: sums and counts add, maxima take the max."""
+    combined = pd.concat(rollups, ignore_index=True)
+    for col in ROLLUP_KEYS[1:]:
+        combined[col] = combined[col].astype("category")
+    grouped = combined.groupby(ROLLUP_KEYS, observed=True, dropna=False, sort=False)
+    return grouped.agg(
+        amount_sum=("amount_sum", "sum"), count=("count", "sum"), amount_max=("amount_max", "max")
+    ).reset_index()
+
+
+def day_digests(df: pd.DataFrame, columns: list[str] = DIGEST_COLUMNS) -> dict[str, str]:
+    """Order-independent content hash of each day's rows over ``columns``, keyed by ISO date."""
+    hashes = pd.util.hash_pandas_object(df[columns], index=False)
+    days = df["datetime"].dt.normalize()
+    # uint64 求和按 2**64 回绕，与行的顺序无关
+    sums = hashes.groupby(days.to_numpy(), dropna=False).sum()
+    return {
+        ("NaT" if pd.isna(day) else day.strftime("%Y-%m-%d")): f"{value:016x}"
+        for day, value in sums.items()
+    }
+
+
+def source_signature(path: str | Path) -> list[tuple[str, int, int]]:
+    """(path, size, mtime_ns) of a table file, or of every file in a partitioned table."""
+    path = Path(path)
+    files = sorted(p for p in path.rglob("*") if p.is_file()) if path.is_dir() else [path]
+    return [(str(p), p.stat().st_size, p.stat().st_mtime_ns) for p in files if p.exists()]
+
+
+def load_meta(meta_path: Path = ROLLUP_META_PATH) -> dict:
+    if not meta_path.exists():
+        return {}
+    return json.loads(meta_path.read_text(encoding="utf-8"))
+
+
+def update_rollup(
+    df: pd.DataFrame,
+    signature: list | None = None,
+    path: Path = ROLLUP_PATH,
+    meta_path: Path = ROLLUP_META_PATH,
+) -> pd.DataFrame:
+    """Bring the persisted rollup in line with ``df`` and return it.
+
+    Only days whose digest changed (new, relabeled or removed transactions)
+    are re-aggregated; every other day is carried over from the stored cube.
+    """
+    meta = load_meta(meta_path)
+    old_digests = meta.get("days", {}) if path.exists() else {}
+    digests = day_digests(df)
+    changed = {day for day, digest in digests.items() if old_digests.get(day) != digest}
+    removed = set(old_digests) - set(digests)
+
+    if not changed and not removed and path.exists():
+        rollup = pd.read_parquet(path)
+    else:
+        days = df["datetime"].dt.normalize()
+        day_labels = days.dt.strftime("%Y-%m-%d").fillna("NaT")
+        fresh = build_rollup(df[day_labels.isin(changed)])
+        if old_digests:
+            stored = pd.read_parquet(path)
+            stored_labels = stored["date"].dt.strftime("%Y-%m-%d").fillna("NaT")
+            kept = stored[~stored_labels.isin(changed | removed)]
+            rollup = pd.concat([kept, fresh], ignore_index=True)
+        else:
+            rollup = fresh
+        rollup = rollup.sort_values("date", kind="stable", ignore_index=True)
+        for col in ROLLUP_KEYS[1:]:
+            rollup[col] = rollup[col].astype("category")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        rollup.to_parquet(tmp_path, index=False, row_group_size=ROW_GROUP_SIZE)
+        os.replace(tmp_path, path)
+        print(f"[rollup] rebuilt {len(changed)} day(s), dropped {len(removed)}; {len(rollup)} rows.")
+
+    meta = {"source": signature, "days": digests}
+    meta_path.parent.mkdir(parents=True, exist_ok=True)
+    meta_path.write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+    return rollup
+
+
+def ensure_rollup(
+    source: str | Path,
+    load_cleaned: Callable[[], pd.DataFrame],
+    date_range: tuple[pd.Timestamp, pd.Timestamp] | None = None,
+    path: Path = ROLLUP_PATH,
+    meta_path: Path = ROLLUP_META_PATH,
+) -> pd.DataFrame:
+    """Return the rollup for ``source``, touching raw rows only when the table changed.
+
+    ``load_cleaned`` is called (once) when the source file signature differs
+    from the one recorded at the last update. With ``date_range`` only the
+    rollup rows of those days (inclusive) are returned.
+    """
+    signature = [list(entry) for entry in source_signature(source)]
+    meta = load_meta(meta_path)
+    if path.exists() and meta.get("source") == signature:
+        filters = None
+        if date_range is not None:
+            filters = [("date", ">=", date_range[0]), ("date", "<=", date_range[1])]
+        return pd.read_parquet(path, filters=filters)
+    rollup = update_rollup(load_cleaned(), signature, path, meta_path)
+    if date_range is not None:
+        rollup = rollup[rollup["date"].between(*date_range)]
+    return rollup
@@ -0,0 +1,324 @@
+import operator
+import os
+import shutil
+from pathlib import Path
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
+
+# 阶段间交接文件的存储格式：parquet（默认）、feather 或 csv
+STORAGE_FORMAT = os.getenv("PF_STORAGE_FORMAT", "parquet")
+# 设置为 1 时 parquet 文件按年/月分区写入目录
+PARTITION_BY_MONTH = os.getenv("PF_PARTITION_BY_MONTH") == "1"
+
+# 较小的行组让按日期过滤的读取只解码命中的部分（数据按日期排序写出）
+ROW_GROUP_SIZE = 65536
+
+SUFFIXES = {"parquet": ".parquet", "feather": ".feather", "csv": ".csv"}
+
+DATETIME_COLUMNS = ["Date"]
+INT_COLUMNS = ["in/out"]
+FLOAT_COLUMNS = ["Amount"]
+CATEGORICAL_COLUMNS = ["Category", "sub_category", "Payment_Method"]
+PARTITION_COLUMNS = ["year", "month"]
+
+# 每笔交易的稳定主键：平台前缀 + 平台订单号，如 "alipay:2024010522001..."
+KEY_COLUMN = "Txn_ID"
+# 没有订单号的旧数据用这些列的内容哈希作为主键，前缀为 "row:"
+CONTENT_KEY_COLUMNS = ["Date", "Time", "in/out", "Amount", "Counterparty", "Product_Description"]
+LEGACY_KEY_PREFIX = "row:"
+
+
+def table_path(stem: str | Path, fmt: str | None = None) -> Path:
+    """Return the path for a stage table stored in the configured format."""
+    return Path(stem).with_suffix(SUFFIXES[fmt or STORAGE_FORMAT])
+
+
+def apply_schema(df: pd.DataFrame, categories: bool = True, copy: bool = True) -> pd.DataFrame:
+    """Coerce the known transaction columns to their storage dtypes.
+
+    Date becomes datetime64, Time a plain ``HH:MM:SS`` string, in/out Int64,
+    Amount Float64 and, unless ``categories`` is False, Category/sub_category/
+    Payment_Method categoricals. Unknown columns are left untouched. Pass
+    ``copy=False`` for a frame nobody else holds, e.g. one just read from disk.
+    """
+    if copy:
+        df = df.copy()
+    for col in DATETIME_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col], errors="coerce")
+    if "Time" in df.columns:
+        time = df["Time"]
+        df["Time"] = time.where(time.isna(), time.astype(str)).astype(object)
+    for col in INT_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype("Int64")
+    for col in FLOAT_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype("Float64")
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("category" if categories else object)
+    return df
+
+
+def order_keys(df: pd.DataFrame, column: str, platform: str) -> pd.Series:
+    """Primary keys from the order numbers in ``df[column]``.
+
+    Exports pad order numbers with tabs/spaces, which are stripped. Rows
+    without an order number get no key (NaN). Identical rows sharing a number
+    (overlapping exports) keep the same key. When rows with different
+    contents share a number, the earliest keeps the bare key and the others
+    get a ``#`` suffix hashed from their contents, so they never collapse and
+    a row gets the same key whichever import parses it (see
+    :func:`upsert_rows`). ``df`` must already have the storage schema.
+    """
+    numbers = df[column].astype("string").str.strip()
+    numbers = numbers.mask(numbers.isin(["", "/"]))
+    keys = (platform + ":" + numbers).astype(object).where(numbers.notna(), np.nan)
+    shared = keys.duplicated(keep=False) & keys.notna()
+    if shared.any():
+        rows = df.loc[shared]
+        contents = content_keys(rows)
+        order = [col for col in ("Date", "Time") if col in rows.columns]
+        ranked = rows[order].assign(key=keys[shared], content=contents)
+        ranked = ranked.sort_values(order + ["content"], kind="stable")
+        first = ranked.drop_duplicates("key").set_index("key")["content"]
+        other = ranked.index[ranked["content"].to_numpy() != ranked["key"].map(first).to_numpy()]
+        keys[other] = _with_content_suffix(keys[other], contents[other])
+    return keys
+
+
+def _with_content_suffix(keys: pd.Series, contents: pd.Series) -> pd.Series:
+    """``key#hash``: the order-number key told apart by a short hash of the row contents."""
+    start = len(LEGACY_KEY_PREFIX)
+    return keys + "#" + contents.str.slice(start, start + 8)
+
+
+def content_keys(df: pd.DataFrame) -> pd.Series:
+    """Legacy keys hashed from the row contents, for rows without an order number."""
+    columns = [col for col in CONTENT_KEY_COLUMNS if col in df.columns]
+    # 统一转为文本再哈希，结果与列的存储类型（Float64/float64、category/object）无关
+    text = df[columns].astype("string").fillna("")
+    hashes = pd.util.hash_pandas_object(text, index=False).to_numpy()
+    return pd.Series([f"{LEGACY_KEY_PREFIX}{value:016x}" for value in hashes], index=df.index, dtype=object)
+
+
+def ensure_keys(df: pd.DataFrame) -> pd.DataFrame:
+    """Give every row a ``Txn_ID``, filling missing ones with content keys (in place)."""
+    if KEY_COLUMN not in df.columns:
+        df[KEY_COLUMN] = np.nan
+    missing = df[KEY_COLUMN].isna()
+    if missing.any():
+        df[KEY_COLUMN] = df[KEY_COLUMN].astype(object)
+        df.loc[missing, KEY_COLUMN] = content_keys(df.loc[missing])
+    return df
+
+
+def upsert_rows(base: pd.DataFrame, new: pd.DataFrame) -> pd.DataFrame:
+    """Insert ``new`` into ``base``, replacing rows that carry the same ``Txn_ID``.
+
+    Keys of ``base`` are looked up through a hash index, so the matching work
+    grows with the number of new rows instead of hashing every column of the
+    whole history. A new row with the same key as a ``base`` row replaces it
+    only when their contents agree (a status or note update); different
+    contents under one order number get a content-hash suffix instead, as in
+    :func:`order_keys`. Legacy ``row:`` keys in ``base`` are also replaced by
+    a new row with the same contents, so re-importing an old export after
+    the switch to order-number keys does not duplicate it.
+    """
+    new = ensure_keys(new.copy())
+    new = new.drop_duplicates(subset=[KEY_COLUMN], keep="last")
+    base = ensure_keys(base.copy())
+    # 订单号与已有行相同、内容却不同的新行（如之后导出的退款）是另一笔交易：
+    # 与 order_keys 一样按内容加后缀，不覆盖已有行
+    bare = new[KEY_COLUMN].isin(base[KEY_COLUMN]) & ~new[KEY_COLUMN].str.contains("#", regex=False)
+    bare &= ~new[KEY_COLUMN].str.startswith(LEGACY_KEY_PREFIX)
+    if bare.any():
+        hits = new.loc[bare]
+        old = base[base[KEY_COLUMN].isin(hits[KEY_COLUMN])]
+        old_contents = pd.Series(content_keys(old).to_numpy(), index=old[KEY_COLUMN].to_numpy())
+        old_contents = old_contents[~old_contents.index.duplicated()]
+        contents = content_keys(hits)
+        differs = hits.index[contents.to_numpy() != hits[KEY_COLUMN].map(old_contents).to_numpy()]
+        if len(differs):
+            new.loc[differs, KEY_COLUMN] = _with_content_suffix(new.loc[differs, KEY_COLUMN], contents[differs])
+            new = new.drop_duplicates(subset=[KEY_COLUMN], keep="last")
+    index = pd.Index(base[KEY_COLUMN])
+    if index.is_unique:
+        positions = index.get_indexer(new[KEY_COLUMN])
+        replaced = positions[positions >= 0]
+    else:
+        replaced = np.flatnonzero(base[KEY_COLUMN].isin(new[KEY_COLUMN]))
+    keep = np.ones(len(base), dtype=bool)
+    keep[replaced] = False
+    legacy = base[KEY_COLUMN].str.startswith(LEGACY_KEY_PREFIX, na=False).to_numpy()
+    if legacy.any():
+        legacy_rows = base[legacy]
+        keep[np.flatnonzero(legacy)[legacy_rows[KEY_COLUMN].isin(content_keys(new)).to_numpy()]] = False
+    return pd.concat([base[keep], new], ignore_index=True)
+
+
+def _existing_path(path: Path) -> Path | None:
+    """Find the table on disk, falling back to the same stem in another format."""
+    if path.exists():
+        return path
+    for suffix in SUFFIXES.values():
+        candidate = path.with_suffix(suffix)
+        if candidate.exists():
+            return candidate
+    return None
+
+
+def table_exists(path: str | Path) -> bool:
+    return _existing_path(Path(path)) is not None
+
+
+FILTER_OPS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+
+def read_table(
+    path: str | Path,
+    categories: bool = True,
+    filters: list[tuple[str, str, object]] | None = None,
+    columns: list[str] | None = None,
+) -> pd.DataFrame:
+    """Read a stage table written by :func:`write_table` and apply the schema.
+
+    If ``path`` does not exist, a table with the same stem in another format is
+    read instead, so CSV files from earlier runs keep working. ``filters`` is a
+    list of ``(column, op, value)`` conditions that must all hold; for Parquet
+    they are pushed down so row groups that cannot match are never read.
+    ``columns`` limits the columns that are read.
+    """
+    found = _existing_path(Path(path))
+    if found is None:
+        raise FileNotFoundError(path)
+    if found.suffix == ".parquet" and found.is_dir():
+        df = _dataset(found).to_table(columns=columns, filter=_expression(filters)).to_pandas()
+        df = df.drop(columns=[c for c in PARTITION_COLUMNS if c in df.columns])
+    elif found.suffix == ".parquet":
+        df = pd.read_parquet(found, columns=columns, filters=filters or None)
+        df = df.drop(columns=[c for c in PARTITION_COLUMNS if c in df.columns])
+    elif found.suffix == ".feather":
+        df = pd.read_feather(found, columns=columns)
+    else:
+        df = pd.read_csv(found, usecols=columns)
+    df = apply_schema(df, categories=categories, copy=False)
+    if filters and found.suffix != ".parquet":
+        df = df[_filter_mask(df, filters)]
+    return df
+
+
+def iter_table(
+    path: str | Path,
+    chunk_rows: int,
+    categories: bool = True,
+    filters: list[tuple[str, str, object]] | None = None,
+    columns: list[str] | None = None,
+) -> Iterator[pd.DataFrame]:
+    """Yield a stage table in chunks of at most ``chunk_rows`` rows.
+
+    Only one chunk is held in memory at a time. Arguments have the same
+    meaning as in :func:`read_table`; each chunk has the schema applied.
+    """
+    found = _existing_path(Path(path))
+    if found is None:
+        raise FileNotFoundError(path)
+    if found.suffix in (".parquet", ".feather"):
+        batches = _dataset(found).to_batches(columns=columns, filter=_expression(filters), batch_size=chunk_rows)
+        chunks = (batch.to_pandas() for batch in batches if batch.num_rows)
+        pushed_down = True
+    else:
+        chunks = pd.read_csv(found, usecols=columns, chunksize=chunk_rows)
+        pushed_down = False
+    for chunk in chunks:
+        chunk = chunk.drop(columns=[c for c in PARTITION_COLUMNS if c in chunk.columns])
+        chunk = apply_schema(chunk, categories=categories, copy=False)
+        if filters and not pushed_down:
+            chunk = chunk[_filter_mask(chunk, filters)]
+        yield chunk
+
+
+def _partition_values(path: Path) -> tuple[int, ...]:
+    """Numeric partition values of a file's ``key=value`` directories, e.g. ``(2024, 3)``."""
+    return tuple(int(part.partition("=")[2]) for part in path.parts[:-1])
+
+
+def _dataset(found: Path):
+    """A pyarrow dataset over a table file or a year/month partitioned directory.
+
+    Partition directories are listed by their numeric values, not by name
+    (where ``month=10`` precedes ``month=2``), so rows come back in the date
+    order they were written in.
+    """
+    import pyarrow.dataset as ds
+
+    fmt = "parquet" if found.suffix == ".parquet" else "feather"
+    if not found.is_dir():
+        return ds.dataset(found, format=fmt)
+    files = sorted(
+        (p for p in found.rglob("*") if p.is_file() and not p.name.startswith(".")),
+        key=lambda p: (_partition_values(p.relative_to(found)), p.name),
+    )
+    return ds.dataset([str(p) for p in files], format=fmt, partitioning="hive", partition_base_dir=str(found))
+
+
+def _expression(filters: list[tuple[str, str, object]] | None):
+    """``(column, op, value)`` conditions as one pyarrow filter expression (None for no filter)."""
+    import pyarrow.dataset as ds
+
+    expression = None
+    for column, op, value in filters or []:
+        condition = FILTER_OPS[op](ds.field(column), value)
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def _filter_mask(df: pd.DataFrame, filters: list[tuple[str, str, object]]) -> pd.Series:
+    mask = pd.Series(True, index=df.index)
+    for column, op, value in filters:
+        mask &= FILTER_OPS[op](df[column], value).fillna(False).astype(bool)
+    return mask
+
+
+def write_table(df: pd.DataFrame, path: str | Path, partition: bool | None = None) -> Path:
+    """Write ``df`` with the fixed schema; the format follows the path suffix.
+
+    Parquet tables are split into year/month partitions when ``partition`` (or
+    ``PF_PARTITION_BY_MONTH``) is set. Single-file tables are written to a
+    temporary file and moved into place, so an interrupted write never leaves
+    a truncated table behind.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    df = apply_schema(df)
+    if partition is None:
+        partition = PARTITION_BY_MONTH
+    if path.suffix == ".parquet" and partition and "Date" in df.columns:
+        if path.is_dir():
+            shutil.rmtree(path)
+        elif path.exists():
+            path.unlink()
+        df = df.assign(year=df["Date"].dt.year, month=df["Date"].dt.month)
+        df.to_parquet(path, index=False, partition_cols=PARTITION_COLUMNS)
+        return path
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    if path.suffix == ".parquet":
+        df.to_parquet(tmp_path, index=False, row_group_size=ROW_GROUP_SIZE)
+    elif path.suffix == ".feather":
+        df.reset_index(drop=True).to_feather(tmp_path)
+    else:
+        df.to_csv(tmp_path, index=False)
+    if path.is_dir():
+        shutil.rmtree(path)
+    os.replace(tmp_path, path)
+    return path
@@ -0,0 +1,135 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from analysis import clean_transactions, select_top_expenses, summarize, summary_from_rollup
+from rollup import build_rollup, merge_rollups
+
+
+# 以下是改为单次分组汇总之前的实现，作为 summarize() 与 summary_from_rollup() 的参照
+def clean_transactions_reference(df: pd.DataFrame) -> pd.DataFrame:
+    cleaned = df.copy()
+    time_of_day = pd.to_timedelta(cleaned["Time"], errors="coerce").fillna(pd.Timedelta(0))
+    cleaned["datetime"] = cleaned["Date"] + time_of_day
+    cleaned["Amount"] = cleaned["Amount"].astype(float).fillna(0.0)
+    flow_map = {1: "expense", 0: "transfer", -1: "income"}
+    cleaned["flow"] = cleaned["in/out"].astype(float).map(flow_map).fillna("unknown")
+    cleaned["Category"] = (
+        cleaned["Category"].astype(object).fillna("uncategorized").astype(str).str.strip()
+    )
+    cleaned["sub_category"] = (
+        cleaned["sub_category"].astype(object).fillna("uncategorized").astype(str).str.strip()
+    )
+    return cleaned
+
+
+def summarize_cash_flow(df: pd.DataFrame) -> tuple[float, float, float]:
+    expenses = df[df["flow"] == "expense"]["Amount"].sum()
+    income = df[df["flow"] == "income"]["Amount"].sum()
+    return income, expenses, income - expenses
+
+
+def spending_by_category_sub_category(df: pd.DataFrame) -> tuple[pd.Series, pd.Series]:
+    expenses = df[df["flow"] == "expense"]
+    by_cat = expenses.groupby("Category", dropna=False)["Amount"].sum().sort_values(ascending=False)
+    by_sub = expenses.groupby("sub_category", dropna=False)["Amount"].sum().sort_values(ascending=False)
+    return by_cat, by_sub
+
+
+def daily_spending_summary(df: pd.DataFrame) -> pd.Series:
+    expenses = df[df["flow"] == "expense"].copy()
+    expenses["date"] = expenses["datetime"].dt.date
+    return expenses.groupby("date")["Amount"].sum().sort_index()
+
+
+def top_expenses(df: pd.DataFrame, top_n: int = 10) -> pd.DataFrame:
+    expense = df[df["flow"] == "expense"]
+    return expense.sort_values("Amount", ascending=False).head(top_n)
+
+
+def investment_inflows(df: pd.DataFrame) -> tuple[float, pd.Series]:
+    investment = df[df["Category"].str.lower() == "investment"]
+    total = investment["Amount"].sum()
+    by_sub = investment.groupby("sub_category", dropna=False)["Amount"].sum().sort_values(ascending=False)
+    return total, by_sub
+
+
+def random_transactions(rng: np.random.Generator, n: int) -> pd.DataFrame:
+    """Labeled rows as read_table returns them, with missing values in every column summaries touch."""
+    def pick(values, missing=0.1):
+        chosen = rng.choice(np.array(values, dtype=object), n)
+        chosen[rng.random(n) < missing] = None
+        return chosen
+
+    times = [f"{h:02d}:{m:02d}:00" for h, m in zip(rng.integers(0, 24, n), rng.integers(0, 60, n))]
+    return pd.DataFrame({
+        "Date": pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 40, n), unit="D"),
+        "Time": pick(times, 0.05),
+        "in/out": pd.array(pick([1, 1, 1, 0, -1], 0.05), dtype="Int64"),
+        # 以分为单位的金额，各种求和顺序下都精确可比
+        "Amount": pd.array(np.where(rng.random(n) < 0.03, None, rng.integers(1, 500_00, n) / 4), dtype="Float64"),
+        "Category": pick(["food", "shopping", " food ", "investment", "Investment", "transport"]),
+        "sub_category": pick(["餐饮食品", "购物消费", "投资理财", "交通出行", ""]),
+        "Payment_Method": pick(["余额", "花呗", "零钱"]),
+    })
+
+
+class SummaryEquivalenceTest(unittest.TestCase):
+    def assert_matches_reference(self, summary, raw: pd.DataFrame, top_n: int = 10):
+        reference = clean_transactions_reference(raw)
+        income, expenses, net = summarize_cash_flow(reference)
+        self.assertEqual((summary.income, summary.expenses, summary.net), (income, expenses, net))
+        by_cat, by_sub = spending_by_category_sub_category(reference)
+        # 金额相同的类别在旧实现中的先后取决于不稳定排序，因此按 (金额降序, 名称) 比较
+        for actual, expected in [(summary.by_category, by_cat), (summary.by_sub_category, by_sub)]:
+            self.assertEqual(
+                sorted(actual.items(), key=lambda item: (-item[1], item[0])),
+                sorted(expected.items(), key=lambda item: (-item[1], item[0])),
+            )
+            self.assertTrue(actual.is_monotonic_decreasing)
+        pd.testing.assert_series_equal(summary.daily, daily_spending_summary(reference), check_index_type=False)
+        total, by_investment = investment_inflows(reference)
+        self.assertEqual(summary.investment_total, total)
+        pd.testing.assert_series_equal(
+            summary.investment_by_sub.sort_index(), by_investment.sort_index(), check_index_type=False
+        )
+        # 最大的 N 笔支出：金额序列与旧实现一致；金额相同的行按原有顺序排列
+        expected_top = top_expenses(reference, top_n)
+        self.assertEqual(summary.top_expenses["Amount"].tolist(), expected_top["Amount"].tolist())
+        stable = reference[reference["flow"] == "expense"].sort_values("Amount", ascending=False, kind="stable")
+        self.assertEqual(summary.top_expenses.index.tolist(), stable.index[:top_n].tolist())
+
+    def test_summarize_matches_reference(self):
+        for seed in range(30):
+            rng = np.random.default_rng(seed)
+            raw = random_transactions(rng, int(rng.integers(1, 400)))
+            with self.subTest(seed=seed):
+                self.assert_matches_reference(summarize(clean_transactions(raw)), raw)
+
+    def test_merged_rollups_match_reference(self):
+        # 分块汇总（stream_summary）的路径：各块的汇总表合并后再计算
+        for seed in range(30):
+            rng = np.random.default_rng(seed)
+            raw = random_transactions(rng, int(rng.integers(2, 400)))
+            cleaned = clean_transactions(raw)
+            cut = int(rng.integers(1, len(raw)))
+            first, second = cleaned.iloc[:cut], cleaned.iloc[cut:]
+            rollup = merge_rollups([build_rollup(first), build_rollup(second)])
+            top = select_top_expenses(
+                pd.concat([select_top_expenses(first), select_top_expenses(second)])
+            )
+            with self.subTest(seed=seed):
+                self.assert_matches_reference(summary_from_rollup(rollup, top), raw)
+
+    def test_ties_keep_original_order(self):
+        rng = np.random.default_rng(0)
+        raw = random_transactions(rng, 200)
+        raw["Amount"] = pd.array(np.full(200, 10.0), dtype="Float64")
+        top = summarize(clean_transactions(raw), 5).top_expenses
+        expense = raw.index[raw["in/out"].astype(float).eq(1).to_numpy()]
+        self.assertEqual(top.index.tolist(), expense[:5].tolist())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+
+import pandas as pd
+
+from classifier import NearestNeighbourClassifier
+
+
+def transactions(rows: list[tuple[str, str]]) -> pd.DataFrame:
+    """Rows from (counterparty, product) pairs, all expenses in the same category."""
+    return pd.DataFrame({
+        "Counterparty": [counterparty for counterparty, _ in rows],
+        "Product_Description": [product for _, product in rows],
+        "Category": "shopping",
+        "in/out": pd.array([1] * len(rows), dtype="Int64"),
+    })
+
+
+class NearestNeighbourClassifierTest(unittest.TestCase):
+    def setUp(self):
+        train = transactions([
+            ("瑞幸咖啡", "生椰拿铁"),
+            ("瑞幸咖啡", "美式咖啡"),
+            ("星巴克", "拿铁"),
+            ("滴滴出行", "快车"),
+            ("滴滴出行", "特惠快车"),
+            ("中国石化", "92号汽油"),
+        ])
+        labels = ["coffee", "coffee", "coffee", "taxi", "taxi", "fuel"]
+        self.model = NearestNeighbourClassifier(k=3, max_df=0.5).fit(train, pd.Series(labels))
+
+    def test_predicts_nearest_label(self):
+        predicted, confidence = self.model.predict(transactions([("瑞幸咖啡", "拿铁"), ("滴滴出行", "拼车")]))
+        self.assertEqual(predicted.tolist(), ["coffee", "taxi"])
+        self.assertTrue(((confidence > 0) & (confidence <= 1)).all())
+
+    def test_unknown_text_has_no_label(self):
+        predicted, confidence = self.model.predict(transactions([("xyz", "qqq")]))
+        self.assertEqual(predicted.tolist(), [""])
+        self.assertEqual(confidence.tolist(), [0.0])
+
+
+if __name__ == "__main__":
+    unittest.main()
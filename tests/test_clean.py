@@ -0,0 +1,81 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from clean import merge_detail_rows
+
+
+def merge_detail_rows_apply(df):
+    """原先逐行 apply 的实现，作为 merge_detail_rows 的参照"""
+    condition1 = df['Time'].isna() & df.apply(
+        lambda row: (
+            ((df['Date'] == row['Date']) &
+             (df['Amount'] == row['Amount']) &
+             df['Time'].notna()).any()
+        ) if pd.isna(row['Time']) else False,
+        axis=1
+    )
+    condition2 = df['Time'].notna() & df.apply(
+        lambda row: (
+            ((df['Date'] == row['Date']) &
+             (df['Amount'] == row['Amount']) &
+             df['Time'].isna()).any()
+        ) if pd.notna(row['Time']) else False,
+        axis=1
+    )
+    mask = condition1 | condition2
+    df_pair = df.loc[mask].copy()
+    df_nan = df_pair[df_pair['Time'].isna()]
+    df_notna = df_pair[df_pair['Time'].notna()]
+    df_merged = df_notna.reset_index().merge(
+        df_nan[['Date', 'Amount', 'Category', 'Product_Description']],
+        on=['Date', 'Amount'],
+        suffixes=('', '_from_nan')
+    )
+    df.loc[df_merged['index'], 'Category'] = df_merged['Category_from_nan'].values
+    df.loc[df_merged['index'], 'Note'] = df_merged['Product_Description_from_nan'].values
+    df.drop(df[df['Time'].isna()].index, inplace=True)
+    return df
+
+
+def random_frame(rng, n):
+    """日期、金额取值很少，使同一 (Date, Amount) 常有多条明细行与多条交易行"""
+    times = [f'{hour:02d}:00:00' for hour in rng.integers(0, 24, n)]
+    df = pd.DataFrame({
+        'Date': pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 3, n), unit='D'),
+        'Time': np.where(rng.random(n) < 0.4, None, times),
+        'Amount': rng.integers(1, 4, n).astype(float),
+        'Category': [f'category{i}' for i in range(n)],
+        'Product_Description': [f'product{i}' for i in range(n)],
+        'Note': '',
+    })
+    return df.sort_values(['Date', 'Time', 'Amount'])
+
+
+class MergeDetailRowsTest(unittest.TestCase):
+    def test_matches_apply_implementation(self):
+        for seed in range(200):
+            rng = np.random.default_rng(seed)
+            df = random_frame(rng, int(rng.integers(2, 40)))
+            with self.subTest(seed=seed):
+                pd.testing.assert_frame_equal(
+                    merge_detail_rows(df.copy()), merge_detail_rows_apply(df.copy())
+                )
+
+    def test_last_detail_row_wins(self):
+        df = pd.DataFrame({
+            'Date': pd.to_datetime(['2024-01-01'] * 3),
+            'Time': ['09:00:00', None, None],
+            'Amount': [5.0, 5.0, 5.0],
+            'Category': ['shopping', 'first', 'last'],
+            'Product_Description': ['order', 'detail1', 'detail2'],
+            'Note': '',
+        })
+        result = merge_detail_rows(df)
+        self.assertEqual(result['Category'].tolist(), ['last'])
+        self.assertEqual(result['Note'].tolist(), ['detail2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
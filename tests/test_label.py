@@ -0,0 +1,93 @@
+import asyncio
+import tempfile
+import unittest
+from pathlib import Path
+
+import pandas as pd
+
+from label import LABELS, apply_cached_labels, parse_row_label, process_batch, process_row
+from label_cache import LabelCache, merchant_keys
+
+
+class ScriptedClient:
+    """Stands in for LabelClient and answers every request with the next scripted reply."""
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.prompts = []
+
+    async def chat(self, prompt, json_output=False):
+        self.prompts.append(prompt)
+        return self.replies.pop(0)
+
+
+def transactions(n):
+    return pd.DataFrame({
+        'Date': '2024-03-01', 'Time': '12:00:00', 'Category': '餐饮美食', 'in/out': 1, 'Amount': 20.0,
+        'Product_Description': [f'商品{i}' for i in range(n)], 'Status': '交易成功', 'Note': '',
+        'Counterparty': '食堂', 'Counterparty_Account': '', 'Payment_Method': '余额',
+    })
+
+
+class ParseRowLabelTest(unittest.TestCase):
+    def test_strips_whitespace_quotes_and_full_stop(self):
+        self.assertEqual(parse_row_label(' “餐饮食品”。\n'), '餐饮食品')
+
+    def test_rejects_chatty_or_unknown_answers(self):
+        for reply in ['这笔流水属于餐饮食品', '夜宵', '']:
+            with self.subTest(reply=reply), self.assertRaises(ValueError):
+                parse_row_label(reply)
+
+
+class ProcessRowTest(unittest.TestCase):
+    def test_retries_an_invalid_answer(self):
+        client = ScriptedClient(['我认为是餐饮', '餐饮食品'])
+        labels, error = asyncio.run(process_row(client, transactions(1), 0))
+        self.assertEqual(labels, {0: '餐饮食品'})
+        self.assertIsNone(error)
+        self.assertEqual(len(client.prompts), 2)
+
+    def test_keeps_row_unlabeled_when_every_answer_is_invalid(self):
+        client = ScriptedClient(['不知道', '无法判断'])
+        labels, error = asyncio.run(process_row(client, transactions(1), 0))
+        self.assertEqual(labels, {})
+        self.assertIsInstance(error, ValueError)
+
+    def test_malformed_batch_falls_back_to_validated_rows(self):
+        # 批量回答格式错误 → 拆成两个单行请求，其中一行两次都答非所问
+        client = ScriptedClient(['{"labels": [', '交通出行', '随便', '还是随便'])
+        labels, error = asyncio.run(process_batch(client, transactions(2), [0, 1]))
+        self.assertEqual(labels, {0: '交通出行'})
+        self.assertIsInstance(error, ValueError)
+        self.assertTrue(set(labels.values()) <= set(LABELS))
+
+
+class ApplyCachedLabelsTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.cache = LabelCache(Path(tmp.name) / 'labels.sqlite')
+        self.addCleanup(self.cache.close)
+
+    def test_existing_labels_do_not_seed_an_empty_cache(self):
+        # 第 0 行的标签可能是分类器的猜测，同商户的第 1 行仍应请求 API
+        df = transactions(2)
+        df['Product_Description'] = '商品'
+        df['sub_category'] = ['餐饮食品', '']
+        groups = apply_cached_labels(df, self.cache, merchant_keys(df))
+        self.assertEqual([list(rows) for rows in groups.values()], [[1]])
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(df['sub_category'].tolist(), ['餐饮食品', ''])
+
+    def test_cached_merchants_are_filled_in(self):
+        df = transactions(2)
+        df['sub_category'] = ''
+        keys = merchant_keys(df)
+        self.cache.put_many({keys[0]: '交通出行'})
+        groups = apply_cached_labels(df, self.cache, keys)
+        self.assertEqual(df['sub_category'].tolist(), ['交通出行', ''])
+        self.assertEqual([list(rows) for rows in groups.values()], [[1]])
+
+
+if __name__ == '__main__':
+    unittest.main()
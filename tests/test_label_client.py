@@ -0,0 +1,115 @@
+import asyncio
+import unittest
+
+import httpx
+import pandas as pd
+
+from label import LABELS, UsageStats, run_batches
+from label_client import AdaptiveConcurrency, LabelClient, RateBudget
+from mock_deepseek import MockOptions, serve
+
+# 测试中的退避时间缩短到毫秒级
+FAST_RETRIES = {"max_retries": 20, "backoff_base": 0.005, "backoff_cap": 0.02, "initial_concurrency": 8}
+
+
+def transactions(n: int) -> pd.DataFrame:
+    return pd.DataFrame({
+        "Txn_ID": [f"alipay:{i}" for i in range(n)],
+        "Date": "2024-03-01", "Time": "12:00:00", "Category": "餐饮美食", "in/out": 1, "Amount": 20.0,
+        "Product_Description": [f"商品{i}" for i in range(n)], "Status": "交易成功", "Note": "",
+        "Counterparty": [f"商户{i}" for i in range(n)], "Counterparty_Account": "", "Payment_Method": "余额",
+        "sub_category": "",
+    })
+
+
+class MockServerTestCase(unittest.TestCase):
+    options = MockOptions()
+
+    def setUp(self):
+        self.server = serve(0, self.options)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/v1/chat/completions"
+
+
+class LabelAgainstFlakyEndpointTest(MockServerTestCase):
+    options = MockOptions(
+        latency=0.005, jitter=0.0, max_in_flight=3, error_rate=0.3, malformed_rate=0.3, retry_after=0.01
+    )
+
+    def test_every_row_gets_a_valid_label_and_retries_are_counted(self):
+        # 30 个批次：每种故障都几乎必然出现（全部避开的概率约为 0.7^30）
+        df = transactions(120)
+        batches = [list(range(start, start + 4)) for start in range(0, 120, 4)]
+        stats = UsageStats()
+        errors = []
+
+        def on_result(i, batch, labels, error):
+            df.loc[list(labels), "sub_category"] = list(labels.values())
+            errors.append(error)
+
+        options = {"api_key": "test", "url": self.url, "stats": stats, **FAST_RETRIES}
+        asyncio.run(run_batches(df, batches, options, on_result))
+        self.assertEqual(errors, [None] * len(batches))
+        self.assertEqual(len(df), 120)
+        self.assertTrue(df["sub_category"].isin(LABELS).all(), df["sub_category"].tolist())
+        counts = self.options.counts
+        # 每个 429 与 500 响应都重试且计数一次
+        self.assertGreater(counts["throttled"], 0)
+        self.assertGreater(counts["errors"], 0)
+        self.assertEqual(stats.retries, counts["throttled"] + counts["errors"])
+        # 格式错误的批量回答被拆分重试，最终每行都有合法标签
+        self.assertGreater(stats.requests, len(batches))
+
+
+class RetryExhaustionTest(MockServerTestCase):
+    options = MockOptions(latency=0.0, jitter=0.0, error_rate=1.0)
+
+    def test_gives_up_after_max_retries(self):
+        stats = UsageStats()
+
+        async def run():
+            async with LabelClient("test", self.url, max_retries=3, backoff_base=0.001, stats=stats) as client:
+                await client.chat("你好")
+
+        with self.assertRaises(httpx.HTTPStatusError):
+            asyncio.run(run())
+        self.assertEqual(stats.retries, 3)
+        self.assertEqual(self.options.counts["errors"], 4)
+
+
+class ClientPartsTest(unittest.TestCase):
+    def test_backoff_honours_retry_after(self):
+        client = LabelClient("test", "http://unused", backoff_base=0.001, backoff_cap=0.002)
+        self.assertEqual(client.backoff(0, "1.5"), 1.5)
+        self.assertLessEqual(client.backoff(3, "not a number"), 0.002)
+
+    def test_aimd_limit(self):
+        concurrency = AdaptiveConcurrency(initial=8, maximum=10, target_latency=1.0)
+        concurrency.on_throttle()
+        self.assertEqual(concurrency.limit, 4.0)
+        concurrency.on_success(0.1)
+        self.assertAlmostEqual(concurrency.limit, 4.25)
+        concurrency.on_success(5.0)
+        self.assertAlmostEqual(concurrency.limit, 4.25 * 0.9)
+        for _ in range(200):
+            concurrency.on_success(0.1)
+        self.assertEqual(concurrency.limit, 10)
+        for _ in range(10):
+            concurrency.on_throttle()
+        self.assertEqual(concurrency.limit, 1.0)
+
+    def test_rate_budget_waits_for_refill(self):
+        async def run():
+            budget = RateBudget(per_minute=1200)  # 每 50 ms 补充一个
+            budget.available = 0
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            await budget.acquire()
+            return loop.time() - started
+
+        self.assertGreaterEqual(asyncio.run(run()), 0.04)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,20 @@
+import unittest
+
+import pandas as pd
+
+from pipeline import label_complete
+
+
+class LabelCompleteTest(unittest.TestCase):
+    def test_empty_and_missing_labels_are_incomplete(self):
+        self.assertFalse(label_complete(pd.DataFrame({"sub_category": ["food", ""]})))
+        self.assertFalse(label_complete(pd.DataFrame({"sub_category": ["food", None]})))
+        # 从 Parquet 读回的类别列中，缺失的标签是 NaN 而不是空字符串
+        self.assertFalse(label_complete(pd.DataFrame({"sub_category": pd.Categorical(["food", None])})))
+
+    def test_all_labeled(self):
+        self.assertTrue(label_complete(pd.DataFrame({"sub_category": ["food", "transport"]})))
+
+
+if __name__ == "__main__":
+    unittest.main()
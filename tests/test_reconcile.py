@@ -0,0 +1,81 @@
+import unittest
+
+import pandas as pd
+
+from reconcile import DUPLICATE, KEPT, MATCH_ID_COLUMN, MATCH_KIND_COLUMN, TRANSFER, collapse_matches, reconcile
+
+
+def statement(rows: list[tuple]) -> pd.DataFrame:
+    """An updated table from (Txn_ID, time, in/out, amount, category, counterparty) tuples on one day."""
+    df = pd.DataFrame(rows, columns=["Txn_ID", "Time", "in/out", "Amount", "Category", "Counterparty"])
+    df.insert(1, "Date", pd.Timestamp("2024-03-01"))
+    df["in/out"] = df["in/out"].astype("Int64")
+    df["Amount"] = df["Amount"].astype("Float64")
+    return df
+
+
+class ReconcileTest(unittest.TestCase):
+    def test_transfer_between_wallets_pairs(self):
+        df = statement([
+            ("alipay:1", "10:00:00", 1, 200.0, "转账红包", "张三"),
+            ("wechat:1", "10:01:30", -1, 200.0, "转账", "张三"),
+        ])
+        df, review = reconcile(df, 180)
+        self.assertEqual(df[MATCH_KIND_COLUMN].tolist(), [TRANSFER, TRANSFER])
+        self.assertEqual(df[MATCH_ID_COLUMN].tolist(), ["wechat:1", "alipay:1"])
+        self.assertEqual(review["gap_s"].tolist(), [90.0])
+        collapsed = collapse_matches(df)
+        self.assertEqual(collapsed["in/out"].tolist(), [0, 0])
+
+    def test_same_movement_booked_twice_keeps_alipay_side(self):
+        df = statement([
+            ("alipay:1", "08:00:00", 1, 3000.0, "信用借还", "花呗"),
+            ("wechat:1", "08:00:40", 1, 3000.0, "信用卡还款", "花呗"),
+        ])
+        df, _ = reconcile(df, 180)
+        self.assertEqual(df[MATCH_KIND_COLUMN].tolist(), [KEPT, DUPLICATE])
+        self.assertEqual(collapse_matches(df)["Txn_ID"].tolist(), ["alipay:1"])
+
+    def test_transfers_to_different_payees_stay_apart(self):
+        # 一分钟内分别用支付宝和微信各转给不同的人 100 元：两笔都是真实支出
+        df = statement([
+            ("alipay:1", "09:00:00", 1, 100.0, "转账红包", "张三"),
+            ("wechat:1", "09:01:00", 1, 100.0, "转账", "李四"),
+        ])
+        df, review = reconcile(df, 180)
+        self.assertTrue(df[MATCH_KIND_COLUMN].isna().all())
+        self.assertTrue(review.empty)
+        self.assertEqual(len(collapse_matches(df)), 2)
+
+    def test_same_payee_is_compared_after_normalizing(self):
+        df = statement([
+            ("alipay:1", "09:00:00", 1, 100.0, "转账红包", "Ｚhang San"),
+            ("wechat:1", "09:01:00", 1, 100.0, "转账", "zhang  san"),
+        ])
+        df, _ = reconcile(df, 180)
+        self.assertEqual(df[MATCH_KIND_COLUMN].tolist(), [KEPT, DUPLICATE])
+
+    def test_repeated_purchases_on_both_platforms_stay_apart(self):
+        # 两个平台各买了一杯同价咖啡：金额、方向相同，时间相近，但都是真实支出
+        df = statement([
+            ("alipay:1", "12:00:00", 1, 25.0, "餐饮美食", "咖啡店"),
+            ("wechat:1", "12:02:00", 1, 25.0, "商户消费", "咖啡店"),
+        ])
+        df, review = reconcile(df, 180)
+        self.assertTrue(df[MATCH_KIND_COLUMN].isna().all())
+        self.assertTrue(review.empty)
+        collapsed = collapse_matches(df)
+        self.assertEqual(len(collapsed), 2)
+        self.assertEqual(collapsed["in/out"].tolist(), [1, 1])
+
+    def test_transfer_outside_tolerance_stays_apart(self):
+        df = statement([
+            ("alipay:1", "10:00:00", 1, 200.0, "转账红包", "张三"),
+            ("wechat:1", "10:10:00", -1, 200.0, "转账", "张三"),
+        ])
+        df, _ = reconcile(df, 180)
+        self.assertTrue(df[MATCH_KIND_COLUMN].isna().all())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from storage import (
+    KEY_COLUMN, apply_schema, content_keys, iter_table, order_keys, read_table, upsert_rows, write_table,
+)
+
+
+def statement(rows: list[tuple]) -> pd.DataFrame:
+    """Parsed statement rows from (order number, date, time, in/out, amount, counterparty, status) tuples."""
+    df = pd.DataFrame(
+        rows, columns=["Order_No", "Date", "Time", "in/out", "Amount", "Counterparty", "Status"]
+    )
+    df["Product_Description"] = "商品"
+    return apply_schema(df, categories=False)
+
+
+def keyed(rows: list[tuple]) -> pd.DataFrame:
+    df = statement(rows)
+    df[KEY_COLUMN] = order_keys(df, "Order_No", "alipay")
+    return df.drop(columns=["Order_No"])
+
+
+PAYMENT = ("\t2024001\t", "2024-03-01", "10:00:00", 1, 50.0, "商店", "交易成功")
+REFUND = ("2024001", "2024-03-05", "09:00:00", -1, 50.0, "商店", "退款成功")
+
+
+class PartitionedTableTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        # 跨越 10–12 月，按名称排序的分区目录会把 month=10 排在 month=2 之前
+        dates = pd.date_range("2023-01-01", periods=500, freq="D").repeat(2)
+        self.df = pd.DataFrame({
+            "Date": dates,
+            "Time": ["08:00:00", "20:00:00"] * 500,
+            "Amount": np.arange(1000, dtype=float),
+        })
+        self.path = write_table(self.df, Path(self.tmp.name) / "updated.parquet", partition=True)
+
+    def test_read_keeps_date_order(self):
+        df = read_table(self.path, categories=False)
+        self.assertTrue(df["Date"].is_monotonic_increasing)
+        self.assertEqual(df["Amount"].tolist(), self.df["Amount"].tolist())
+        self.assertNotIn("month", df.columns)
+
+    def test_filtered_read_keeps_date_order(self):
+        filters = [("Date", ">=", pd.Timestamp("2023-09-20")), ("Date", "<", pd.Timestamp("2024-02-10"))]
+        df = read_table(self.path, categories=False, filters=filters)
+        expected = self.df[(self.df["Date"] >= "2023-09-20") & (self.df["Date"] < "2024-02-10")]
+        self.assertEqual(df["Amount"].tolist(), expected["Amount"].tolist())
+
+    def test_chunks_keep_date_order(self):
+        df = pd.concat(iter_table(self.path, 64, categories=False), ignore_index=True)
+        self.assertEqual(df["Amount"].tolist(), self.df["Amount"].tolist())
+
+
+class OrderKeysTest(unittest.TestCase):
+    def test_keys_from_order_numbers(self):
+        df = statement([PAYMENT, ("/", "2024-03-01", "11:00:00", 1, 8.0, "食堂", "交易成功")])
+        keys = order_keys(df, "Order_No", "alipay")
+        self.assertEqual(keys.iloc[0], "alipay:2024001")
+        self.assertTrue(pd.isna(keys.iloc[1]))
+
+    def test_identical_rows_share_a_key(self):
+        keys = order_keys(statement([PAYMENT, PAYMENT]), "Order_No", "alipay")
+        self.assertEqual(keys.tolist(), ["alipay:2024001", "alipay:2024001"])
+
+    def test_different_rows_with_one_number_are_told_apart_by_content(self):
+        # 退款排在前面也不影响：最早的一条保留原订单号
+        df = statement([REFUND, PAYMENT])
+        keys = order_keys(df, "Order_No", "alipay")
+        suffix = content_keys(df.iloc[[0]]).iloc[0][len("row:"):][:8]
+        self.assertEqual(keys.tolist(), [f"alipay:2024001#{suffix}", "alipay:2024001"])
+
+
+class UpsertRowsTest(unittest.TestCase):
+    def test_same_contents_replace_the_old_row(self):
+        updated = PAYMENT[:-1] + ("退款成功",)
+        df = upsert_rows(keyed([PAYMENT]), keyed([updated]))
+        self.assertEqual(df["Status"].tolist(), ["退款成功"])
+
+    def test_later_refund_does_not_overwrite_the_payment(self):
+        df = upsert_rows(keyed([PAYMENT]), keyed([REFUND]))
+        self.assertEqual(sorted(df["in/out"].tolist()), [-1, 1])
+
+    def test_incremental_and_full_imports_agree_on_keys(self):
+        full = upsert_rows(keyed([PAYMENT]).iloc[:0], keyed([PAYMENT, REFUND]))
+        incremental = upsert_rows(keyed([PAYMENT]), keyed([REFUND]))
+        again = upsert_rows(incremental, keyed([PAYMENT, REFUND]))
+        self.assertEqual(sorted(full[KEY_COLUMN]), sorted(incremental[KEY_COLUMN]))
+        self.assertEqual(sorted(again[KEY_COLUMN]), sorted(full[KEY_COLUMN]))
+
+    def test_legacy_row_is_replaced_by_keyed_row(self):
+        base = keyed([PAYMENT])
+        base[KEY_COLUMN] = content_keys(base)
+        df = upsert_rows(base, keyed([PAYMENT]))
+        self.assertEqual(df[KEY_COLUMN].tolist(), ["alipay:2024001"])
+
+
+if __name__ == "__main__":
+    unittest.main()
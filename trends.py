@@ -0,0 +1,166 @@
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+ROLLING_WINDOWS = (7, 30)
+# 日度 z 分数以前 30 天（不含当天）为基准，至少有 7 天历史才计算
+BASELINE_DAYS = 30
+MIN_BASELINE_DAYS = 7
+Z_THRESHOLD = 3.0
+# 基于中位数绝对偏差（MAD）的稳健 z 分数阈值，取 Iglewicz–Hoaglin 建议的 3.5
+MAD_THRESHOLD = 3.5
+# 交易笔数少于该值的商户不做异常判断
+MIN_MERCHANT_ROWS = 5
+# 正态分布下 MAD、平均绝对偏差与标准差的换算系数
+MAD_SCALE = 1.4826
+MEAN_AD_SCALE = 1.2533
+
+DAILY_COLUMNS = ["amount", "mean_7d", "mean_30d", "zscore", "robust_z", "anomaly"]
+MONTHLY_COLUMNS = ["amount", "previous", "mom_delta", "mom_pct", "last_year", "yoy_delta", "yoy_pct"]
+MERCHANT_COLUMNS = ["date", "merchant", "amount", "median", "transactions", "zscore", "robust_z"]
+
+
+class Trends(NamedTuple):
+    """Expense trends over the whole history, sliced to a report period with ``trends_for_period``."""
+
+    daily: pd.DataFrame
+    monthly: pd.DataFrame
+    merchants: pd.DataFrame | None = None
+
+
+def robust_z(deviation, mad, mean_ad) -> np.ndarray:
+    """``deviation`` from the median in units of the scaled MAD.
+
+    Where the MAD is zero (more than half the values identical) the mean
+    absolute deviation is used instead; where both are zero the score is NaN.
+    """
+    scale = np.where(np.asarray(mad) > 0, MAD_SCALE * np.asarray(mad), MEAN_AD_SCALE * np.asarray(mean_ad))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(scale > 0, np.asarray(deviation) / scale, np.nan)
+
+
+def daily_trends(daily: pd.Series) -> pd.DataFrame:
+    """Rolling means and anomaly scores of a per-day expense series.
+
+    Days without spending are filled with 0 so the windows cover calendar
+    days. ``zscore`` compares a day with the previous ``BASELINE_DAYS``;
+    ``robust_z`` compares it with the median day of the whole series.
+    """
+    if daily.empty:
+        return pd.DataFrame(columns=DAILY_COLUMNS, index=pd.DatetimeIndex([], name="date"))
+    calendar = pd.date_range(daily.index.min(), daily.index.max(), freq="D", name="date")
+    amount = daily.reindex(calendar, fill_value=0.0).astype(float)
+    frame = pd.DataFrame({"amount": amount})
+    for window in ROLLING_WINDOWS:
+        frame[f"mean_{window}d"] = amount.rolling(window, min_periods=1).mean()
+    baseline = amount.shift(1).rolling(BASELINE_DAYS, min_periods=MIN_BASELINE_DAYS)
+    mean, std = baseline.mean(), baseline.std()
+    frame["zscore"] = (amount - mean) / std.where(std > 0)
+    deviation = amount - amount.median()
+    frame["robust_z"] = robust_z(deviation, deviation.abs().median(), deviation.abs().mean())
+    frame["anomaly"] = (frame["zscore"] >= Z_THRESHOLD) | (frame["robust_z"] >= MAD_THRESHOLD)
+    return frame
+
+
+def monthly_deltas(expense: pd.DataFrame) -> pd.DataFrame:
+    """Month-over-month and year-over-year changes of every sub-category at once.
+
+    ``expense`` holds expense rollup rows (``date``, ``sub_category``,
+    ``amount_sum``). The totals are pivoted to a month × sub-category grid
+    over the full month range, and both deltas are shifts of that grid.
+    Deltas before the first month of data are NaN; percentages are NaN when
+    the earlier month had no spending.
+    """
+    expense = expense[expense["date"].notna()]
+    index = pd.MultiIndex.from_arrays([[], []], names=["month", "sub_category"])
+    if expense.empty:
+        return pd.DataFrame(columns=MONTHLY_COLUMNS, index=index)
+    month = expense["date"].dt.to_period("M").rename("month")
+    grid = expense.groupby([month, expense["sub_category"]], observed=True)["amount_sum"].sum().unstack(fill_value=0.0)
+    grid.columns = grid.columns.astype(object)
+    grid = grid.reindex(pd.period_range(grid.index.min(), grid.index.max(), freq="M"), fill_value=0.0)
+    previous, last_year = grid.shift(1), grid.shift(12)
+    values = {
+        "amount": grid,
+        "previous": previous,
+        "mom_delta": grid - previous,
+        "mom_pct": (grid - previous) / previous.where(previous > 0),
+        "last_year": last_year,
+        "yoy_delta": grid - last_year,
+        "yoy_pct": (grid - last_year) / last_year.where(last_year > 0),
+    }
+    # 网格按行展开：月份在外层、子类在内层，与 from_product 的顺序一致
+    index = pd.MultiIndex.from_product([grid.index, grid.columns], names=["month", "sub_category"])
+    frame = pd.DataFrame({name: table.to_numpy().ravel() for name, table in values.items()}, index=index)
+    active = (frame[["amount", "previous", "last_year"]].fillna(0) > 0).any(axis=1)
+    return frame[active]
+
+
+def merchant_anomalies(rows: pd.DataFrame) -> pd.DataFrame:
+    """Expense transactions far above their merchant's usual amount.
+
+    ``rows`` has one expense per row with ``date``, ``merchant`` and
+    ``amount``. Medians, MADs and moments are computed for all merchants in
+    one grouped pass; a row is flagged when its robust z-score reaches
+    ``MAD_THRESHOLD`` and the merchant has at least ``MIN_MERCHANT_ROWS``
+    transactions. Flagged rows are returned, most unusual first.
+    """
+    merchant = rows["merchant"].astype(object)
+    rows = rows[merchant.notna() & (merchant.str.strip() != "")]
+    amount = rows["amount"].astype(float)
+    by_merchant = amount.groupby(rows["merchant"], observed=True)
+    median = by_merchant.transform("median")
+    deviation = amount - median
+    by_deviation = deviation.abs().groupby(rows["merchant"], observed=True)
+    std = by_merchant.transform("std")
+    frame = pd.DataFrame({
+        "date": rows["date"],
+        "merchant": rows["merchant"].astype(object),
+        "amount": amount,
+        "median": median,
+        "transactions": by_merchant.transform("size"),
+        "zscore": (amount - by_merchant.transform("mean")) / std.where(std > 0),
+        "robust_z": robust_z(deviation, by_deviation.transform("median"), by_deviation.transform("mean")),
+    })
+    flagged = (frame["transactions"] >= MIN_MERCHANT_ROWS) & (frame["robust_z"] >= MAD_THRESHOLD)
+    return frame[flagged].sort_values("robust_z", ascending=False, kind="stable", ignore_index=True)
+
+
+def expense_merchants(cleaned: pd.DataFrame) -> pd.DataFrame:
+    """The ``merchant_anomalies`` input from a cleaned transactions frame."""
+    expense = cleaned["flow"] == "expense"
+    return pd.DataFrame({
+        "date": cleaned.loc[expense, "datetime"].dt.normalize(),
+        "merchant": cleaned.loc[expense, "Counterparty"],
+        "amount": cleaned.loc[expense, "Amount"],
+    })
+
+
+def compute_trends(rollup: pd.DataFrame, merchants: pd.DataFrame | None = None) -> Trends:
+    """Daily trends and sub-category deltas from a daily rollup, plus merchant anomalies when rows are given."""
+    expense = rollup[rollup["flow"] == "expense"]
+    daily = expense.groupby("date")["amount_sum"].sum()
+    return Trends(
+        daily=daily_trends(daily),
+        monthly=monthly_deltas(expense),
+        merchants=None if merchants is None else merchant_anomalies(merchants),
+    )
+
+
+def trends_for_period(trends: Trends, start: pd.Timestamp | None, end: pd.Timestamp | None) -> Trends:
+    """Keep the days, months and flagged transactions inside START..END.
+
+    Scores and deltas stay those computed over the whole history, so the
+    first month of a period is still compared with the month before it.
+    """
+    if start is None or end is None:
+        return trends
+    first, last = start.normalize(), end.normalize()
+    daily = trends.daily[(trends.daily.index >= first) & (trends.daily.index <= last)]
+    months = trends.monthly.index.get_level_values("month")
+    monthly = trends.monthly[(months >= first.to_period("M")) & (months <= last.to_period("M"))]
+    merchants = trends.merchants
+    if merchants is not None:
+        merchants = merchants[(merchants["date"] >= first) & (merchants["date"] <= last)]
+    return Trends(daily, monthly, merchants)
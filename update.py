@@ -1,17 +1,116 @@
 import pandas as pd
+import numpy as np
+import argparse
+import concurrent.futures
+import hashlib
+import importlib.util
+import json
 import os
+from functools import partial
+from profiling import add_profile_arguments, profiled, span
+from reconcile import MATCHES_PATH, match_marks, reconcile
+from storage import (
+    KEY_COLUMN, apply_schema, order_keys, read_table, table_exists, table_path, upsert_rows, write_table
+)
 
-def load_and_concat_csv(dir_path, skiprows, encoding=None):
-    csv_files = [f for f in os.listdir(dir_path) if f.endswith('.csv')]
-    df_list = [
-        pd.read_csv(os.path.join(dir_path, f), skiprows=skiprows, encoding=encoding)
-        for f in csv_files
-    ]
+ALIPAY_DIR = 'Data/Alipay/'
+WECHAT_DIR = 'Data/Wechat/'
+ALIPAY_UPTODATE_PATH = table_path('Data/Alipay/alipay_uptodate')
+WECHAT_UPTODATE_PATH = table_path('Data/Wechat/wechat_uptodate')
+UPDATED_PATH = table_path('Data/update/updated')
+MANIFEST_PATH = 'Data/update/manifest.json'
+# 安装了 pyarrow 时使用多线程的 pyarrow 解析器，否则退回 pandas 默认的 C 解析器
+CSV_ENGINE = 'pyarrow' if importlib.util.find_spec('pyarrow') else 'c'
+
+def list_statement_files(dir_path):
+    """列出目录下的账单 CSV，排除本脚本生成的 *_uptodate.csv"""
+    return sorted(
+        os.path.join(dir_path, f) for f in os.listdir(dir_path)
+        if f.endswith('.csv') and not f.endswith('_uptodate.csv')
+    )
+
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def load_manifest(manifest_path=MANIFEST_PATH):
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, encoding='utf-8') as f:
+        return json.load(f)
+
+def save_manifest(manifest, manifest_path=MANIFEST_PATH):
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+def scan_changes(paths, manifest):
+    """返回 (新增或变更的文件列表, 更新后的 manifest 条目)
+
+    size 与 mtime 均未变的文件直接视为未变更；否则计算内容哈希，
+    哈希一致（仅被 touch）的文件同样跳过。
+    """
+    changed, entries = [], {}
+    for path in paths:
+        stat = os.stat(path)
+        entry = {'size': stat.st_size, 'mtime': stat.st_mtime}
+        old = manifest.get(path)
+        if old and old['size'] == entry['size'] and old['mtime'] == entry['mtime']:
+            entries[path] = old
+            continue
+        entry['sha256'] = file_sha256(path)
+        if not old or old.get('sha256') != entry['sha256']:
+            changed.append(path)
+        entries[path] = entry
+    return changed, entries
+
+def read_statement(path, skiprows, encoding=None, usecols=None, dtype=None):
+    if CSV_ENGINE == 'pyarrow':
+        # 直接使用 pyarrow.csv 并显式指定列类型：pandas 的 pyarrow 引擎先推断类型再转换，
+        # 纯数字的订单号会先被读成浮点数而丢失精度。字符串列的空值还原为 NaN
+        import pyarrow as pa
+        import pyarrow.csv as pacsv
+
+        dtype = dtype or {}
+        str_cols = [col for col, t in dtype.items() if t is str]
+        column_types = {
+            col: pa.string() if t is str else pa.from_numpy_dtype(np.dtype(t)) for col, t in dtype.items()
+        }
+        table = pacsv.read_csv(
+            path,
+            read_options=pacsv.ReadOptions(skip_rows=skiprows, encoding=encoding or 'utf8'),
+            convert_options=pacsv.ConvertOptions(
+                include_columns=usecols, column_types=column_types, strings_can_be_null=True
+            ),
+        )
+        df = table.to_pandas()
+        df[str_cols] = df[str_cols].astype(object).where(df[str_cols].notna(), np.nan)
+        return df
+    return pd.read_csv(path, skiprows=skiprows, encoding=encoding, usecols=usecols, dtype=dtype)
+
+def load_and_concat_csv(
+    dir_path, skiprows, encoding=None, files=None,
+    usecols=None, dtype=None, max_workers=None
+):
+    """读取并合并账单文件；多个文件时分发到进程池并行解析
+
+    usecols 限定只读取需要的列，dtype 显式指定列类型以跳过类型推断。
+    """
+    csv_files = list_statement_files(dir_path) if files is None else files
+    reader = partial(read_statement, skiprows=skiprows, encoding=encoding, usecols=usecols, dtype=dtype)
+    if max_workers == 1 or len(csv_files) <= 1:
+        df_list = [reader(f) for f in csv_files]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+            df_list = list(executor.map(reader, csv_files))
     return pd.concat(df_list, ignore_index=True)
 
-def clean_and_export(
+def clean_statement(
     all_data, rename_dict, drop_cols, column_order,
-    output_path, inout_map, amount_clean=False, add_account=False
+    inout_map, amount_clean=False, add_account=False, platform=None
 ):
     all_data = all_data.rename(columns=rename_dict)
     if add_account and 'Counterparty_Account' not in all_data.columns:
@@ -20,16 +119,31 @@ def clean_and_export(
     all_data['Date'] = all_data['DateTime'].dt.date
     all_data['Time'] = all_data['DateTime'].dt.time
     all_data = all_data.sort_values(['Date', 'Time'], ascending=[True, True])
-    for col in drop_cols + ['DateTime']:
-        if col in all_data.columns:
-            all_data = all_data.drop(columns=[col])
     if amount_clean and 'Amount' in all_data.columns:
         all_data['Amount'] = all_data['Amount'].astype(str).str.replace('¥', '', regex=False).astype(float)
     all_data['in/out'] = all_data['in/out'].map(inout_map)
-    all_data = all_data[[col for col in column_order if col in all_data.columns]]
-    all_data.to_csv(output_path, index=False)
+    all_data = apply_schema(all_data, categories=False)
+    if platform and 'Order_No' in all_data.columns:
+        # 平台订单号作为交易主键；同号的不同交易按存储类型下的内容区分，与 upsert_rows 对已有数据的比较一致
+        all_data[KEY_COLUMN] = order_keys(all_data, 'Order_No', platform)
+    for col in drop_cols + ['DateTime']:
+        if col in all_data.columns:
+            all_data = all_data.drop(columns=[col])
+    return all_data[[col for col in column_order if col in all_data.columns]].copy()
 
-def process_alipay():
+def clean_and_export(
+    all_data, rename_dict, drop_cols, column_order,
+    output_path, inout_map, amount_clean=False, add_account=False, platform=None
+):
+    all_data = clean_statement(
+        all_data, rename_dict, drop_cols, column_order,
+        inout_map, amount_clean=amount_clean, add_account=add_account, platform=platform
+    )
+    write_table(all_data, output_path)
+    return all_data
+
+def process_alipay(files=None, max_workers=None, export=True):
+    """解析支付宝账单并返回统一格式的数据；export=False 时不写出中间文件"""
     rename_dict = {
         '交易时间': 'Date',
         '交易分类': 'Category',
@@ -40,22 +154,44 @@ def process_alipay():
         '交易对方': 'Counterparty',
         '对方账号': 'Counterparty_Account',
         '商品说明': 'Product_Description',
-        '收/付款方式': 'Payment_Method'
+        '收/付款方式': 'Payment_Method',
+        '交易订单号': 'Order_No',
     }
-    drop_cols = ['交易订单号', '商家订单号', 'Unnamed: 12']
+    drop_cols = ['Order_No', '商家订单号', 'Unnamed: 12']
     column_order = [
         'Date', 'Time', 'Category', 'in/out', 'Amount', 'Product_Description', 'Status', 'Note',
-        'Counterparty', 'Counterparty_Account', 'Payment_Method'
+        'Counterparty', 'Counterparty_Account', 'Payment_Method', KEY_COLUMN
     ]
     inout_map = {'不计收支': 0, '收入': -1, '支出': 1}
-    all_data = load_and_concat_csv('Data/Alipay/', skiprows=24, encoding='gb18030')
-    clean_and_export(
-        all_data, rename_dict, drop_cols, column_order,
-        'Data/Alipay/alipay_uptodate.csv', inout_map
-    )
+    if files is not None and not files:
+        print("No new Alipay statements.")
+        return None
+    dtype = {col: str for col in rename_dict}
+    dtype['金额'] = float
+    # 读取步骤包含 gb18030 解码
+    with span('update.read_alipay') as step:
+        all_data = load_and_concat_csv(
+            ALIPAY_DIR, skiprows=24, encoding='gb18030', files=files,
+            usecols=list(rename_dict), dtype=dtype, max_workers=max_workers
+        )
+        step.rows_out = len(all_data)
+    with span('update.clean_alipay', len(all_data)) as step:
+        if not export:
+            all_data = clean_statement(
+                all_data, rename_dict, drop_cols, column_order, inout_map, platform='alipay'
+            )
+            step.rows_out = len(all_data)
+            return all_data
+        all_data = clean_and_export(
+            all_data, rename_dict, drop_cols, column_order,
+            ALIPAY_UPTODATE_PATH, inout_map, platform='alipay'
+        )
+        step.rows_out = len(all_data)
     print("Alipay data processed and saved.")
+    return all_data
 
-def process_wechat():
+def process_wechat(files=None, max_workers=None, export=True):
+    """解析微信账单并返回统一格式的数据；export=False 时不写出中间文件"""
     rename_dict = {
         '交易时间': 'Date',
         '交易类型': 'Category',
@@ -66,44 +202,129 @@ def process_wechat():
         '商品': 'Product_Description',
         '支付方式': 'Payment_Method',
         '当前状态': 'Status',
+        '交易单号': 'Order_No',
     }
-    drop_cols = ['交易单号', '商户单号']
+    drop_cols = ['Order_No', '商户单号']
     column_order = [
         'Date', 'Time', 'Category', 'in/out', 'Amount', 'Product_Description', 'Status', 'Note',
-        'Counterparty', 'Counterparty_Account', 'Payment_Method'
+        'Counterparty', 'Counterparty_Account', 'Payment_Method', KEY_COLUMN
     ]
     inout_map = {'/': 0, '收入': -1, '支出': 1}
-    all_data = load_and_concat_csv('Data/Wechat/', skiprows=16)
-    clean_and_export(
-        all_data, rename_dict, drop_cols, column_order,
-        'Data/Wechat/wechat_uptodate.csv', inout_map,
-        amount_clean=True, add_account=True
-    )
+    if files is not None and not files:
+        print("No new Wechat statements.")
+        return None
+    with span('update.read_wechat') as step:
+        all_data = load_and_concat_csv(
+            WECHAT_DIR, skiprows=16, files=files,
+            usecols=list(rename_dict), dtype={col: str for col in rename_dict},
+            max_workers=max_workers
+        )
+        step.rows_out = len(all_data)
+    with span('update.clean_wechat', len(all_data)) as step:
+        if not export:
+            all_data = clean_statement(
+                all_data, rename_dict, drop_cols, column_order, inout_map,
+                amount_clean=True, add_account=True, platform='wechat'
+            )
+            step.rows_out = len(all_data)
+            return all_data
+        all_data = clean_and_export(
+            all_data, rename_dict, drop_cols, column_order,
+            WECHAT_UPTODATE_PATH, inout_map,
+            amount_clean=True, add_account=True, platform='wechat'
+        )
+        step.rows_out = len(all_data)
     print("Wechat data processed and saved.")
+    return all_data
 
-def concat_and_sort():
-    alipay_path = 'Data/Alipay/alipay_uptodate.csv'
-    wechat_path = 'Data/Wechat/wechat_uptodate.csv'
-    df_alipay = pd.read_csv(alipay_path)
-    df_wechat = pd.read_csv(wechat_path)
-    df = pd.concat([df_alipay, df_wechat], ignore_index=True)
-    # 确保Date和Time为正确类型
-    # df['Date'] = pd.to_datetime(df['Date'], errors='coerce').dt.date
-    # df['Time'] = pd.to_datetime(df['Time'], errors='coerce').dt.time
-    df = df.sort_values(['Date', 'Time'], ascending=[True, True])
-    df.drop_duplicates(inplace=True)
-    df['in/out'] = pd.to_numeric(df['in/out'], errors='coerce').astype('Int64')
-    df['Amount'] = pd.to_numeric(df['Amount'], errors='coerce').astype('Float64')
-    df.to_csv('Data/update/updated.csv', index=False)
+def concat_and_sort(base_path=None, frames=None):
+    """合并两平台数据并返回；传入 base_path 时与已有的汇总数据合并（增量模式）
+
+    frames 为内存中已解析好的各平台数据，未传入时读取 *_uptodate 中间文件。
+    每行以 Txn_ID（平台订单号）为主键，新数据中的行替换已有数据中同主键的行。
+    合并后在全部历史上对账，标出两个平台重复记录的同一笔资金往来（见 reconcile.py）。
+    """
+    if frames is None:
+        sources = [p for p in (ALIPAY_UPTODATE_PATH, WECHAT_UPTODATE_PATH) if table_exists(p)]
+        frames = [read_table(p, categories=False) for p in sources]
+    frames = [f for f in frames if f is not None]
+    new = pd.concat(frames, ignore_index=True)
+    if base_path and table_exists(base_path):
+        # read_table 已按固定 schema 还原 Date/in/out/Amount 等列的类型
+        base = read_table(base_path, categories=False)
+    else:
+        base = new.iloc[:0]
+    # 按交易主键 upsert：新行替换同主键的旧行，不再对全部历史做整行去重
+    with span('update.concat_and_sort', len(base) + len(new)) as step:
+        df = upsert_rows(base, new)
+        df = df.sort_values(['Date', 'Time'], ascending=[True, True])
+        step.rows_out = len(df)
+        step.metrics['new_rows'] = len(df) - len(base)
+    df, matches = reconcile(df)
+    with span('update.write', len(df)):
+        write_table(df, UPDATED_PATH)
+        write_table(matches, MATCHES_PATH)
     print("Alipay & Wechat data merged and saved.")
+    return df
+
+def reconcile_updated():
+    """在已有的 updated 数据上重新对账（例如修改了 PF_MATCH_TOLERANCE），标记有变化时写回并返回数据"""
+    df = read_table(UPDATED_PATH, categories=False)
+    marks = match_marks(df)
+    df, matches = reconcile(df)
+    if match_marks(df) != marks:
+        with span('update.write', len(df)):
+            write_table(df, UPDATED_PATH)
+            write_table(matches, MATCHES_PATH)
+    return df
+
+def update(full=False, max_workers=None):
+    """解析账单、更新 updated 汇总表并返回合并后的数据
+
+    各平台数据在内存中直接合并，不再写出 *_uptodate 中间文件。
+
+    默认增量模式：只解析 manifest 中没有记录或内容已变化的账单文件，
+    并按交易主键 upsert 到已有的汇总表 UPDATED_PATH；full=True 时重新解析全部文件。
+    max_workers 为并行解析账单的进程数，默认使用全部 CPU 核心。
+    已变更文件中被修改的行按主键替换旧行；被删除的旧行不会从汇总数据中移除，需要时请使用 --full。
+    """
+    manifest = {} if full else load_manifest()
+    with span('update.scan') as step:
+        alipay_files, alipay_entries = scan_changes(list_statement_files(ALIPAY_DIR), manifest)
+        wechat_files, wechat_entries = scan_changes(list_statement_files(WECHAT_DIR), manifest)
+        step.metrics['changed_files'] = len(alipay_files) + len(wechat_files)
+    incremental = not full and table_exists(UPDATED_PATH)
+    if incremental and not alipay_files and not wechat_files:
+        print("No new statement files, nothing to update.")
+        return None
+    if not incremental:
+        alipay_files, wechat_files = None, None
+    frames = [
+        process_alipay(alipay_files, max_workers, export=False),
+        process_wechat(wechat_files, max_workers, export=False),
+    ]
+    df = concat_and_sort(UPDATED_PATH if incremental else None, frames=frames)
+    save_manifest({**alipay_entries, **wechat_entries})
+    return df
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=f"Merge Alipay & Wechat statements into {UPDATED_PATH}.")
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help=f"Ignore the manifest and rebuild {UPDATED_PATH} from every statement file.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of processes used to parse statement files (default: all CPU cores).",
+    )
+    add_profile_arguments(parser)
+    args = parser.parse_args(argv)
+    with profiled(args, 'update'):
+        update(full=args.full, max_workers=args.workers)
+
 
 if __name__ == "__main__":
-    process_alipay()
-    process_wechat()
-    concat_and_sort()
-    try:
-        os.remove("Data/Alipay/alipay_uptodate.csv")
-        os.remove("Data/Wechat/wechat_uptodate.csv")
-        print("Temporary per-platform CSV files removed.")
-    except FileNotFoundError:
-        pass
+    main()
@@ -0,0 +1,316 @@
+import argparse
+import os
+import signal
+import time
+from pathlib import Path
+from typing import Sequence
+
+import pandas as pd
+
+import analysis
+import clean
+import label
+import pipeline
+import reconcile
+import update
+from classifier import CONFIDENCE_THRESHOLD, train_classifier
+from label_cache import LabelCache, instruction_version
+from label_journal import LABEL_JOURNAL_PATH, LabelJournal, replay_journal
+from plots import PLOT_FORMATS
+from profiling import add_profile_arguments, profiled, span
+from storage import KEY_COLUMN, ensure_keys, read_table, upsert_rows, write_table
+
+
+def statement_signature() -> dict[str, tuple[int, int]]:
+    """(size, mtime_ns) of every statement file; files removed while listing are left out."""
+    signature = {}
+    for path in pipeline.statement_files():
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        signature[path] = (stat.st_size, stat.st_mtime_ns)
+    return signature
+
+
+def replace_dates(table: pd.DataFrame, dates: pd.Series, rows: pd.DataFrame) -> pd.DataFrame:
+    """Swap the rows of ``table`` dated on ``dates`` for ``rows``.
+
+    Both must already be in the table's order within each day; a stable sort
+    on Date alone then slots the new days in without re-sorting by time.
+    """
+    kept = table[~table["Date"].isin(dates)]
+    merged = pd.concat([kept, rows], ignore_index=True)
+    return merged.sort_values("Date", kind="stable", ignore_index=True)
+
+
+class Watcher:
+    """Hold the updated, cleaned and labeled tables in memory and fold new statements into them.
+
+    Only the days touched by a new statement are re-cleaned and re-labeled:
+    ``clean_frame`` merges detail rows within a (Date, Amount) pair and maps
+    every other column row by row, so cleaning those days again gives the
+    same rows a full ``clean.py`` run would. The report is then rebuilt from
+    the in-memory labeled table; charts whose data is unchanged are reused.
+    """
+
+    def __init__(
+        self,
+        period: Sequence[str] | None = None,
+        every: str | None = None,
+        plots_dir: Path = Path("Analysis/plots"),
+        report_options: dict | None = None,
+        use_cache: bool = True,
+        use_classifier: bool = True,
+        classifier_threshold: float = CONFIDENCE_THRESHOLD,
+    ) -> None:
+        self.start, self.end = analysis.parse_period(period)
+        self.every = every
+        self.plots_dir = plots_dir
+        self.report_options = report_options or {}
+        self.classifier_threshold = classifier_threshold
+        with span("watch.load") as step:
+            self.updated = ensure_keys(read_table(update.UPDATED_PATH, categories=False))
+            self.cleaned = ensure_keys(read_table(clean.OUTPUT_PATH, categories=False))
+            self.labeled = ensure_keys(read_table(label.LABELED_PATH, categories=False))
+            step.rows_out = len(self.labeled)
+        # 分类器只在启动时用已标注历史训练一次，之后各批新行共用
+        with span("watch.train_classifier", len(self.labeled)):
+            self.classifier = train_classifier(self.labeled) if use_classifier else None
+        self.cache = LabelCache(version=instruction_version(label.LABEL_INSTRUCTION)) if use_cache else None
+        self.ingested = False
+
+    def close(self) -> None:
+        if self.cache is not None:
+            self.cache.close()
+        if self.ingested:
+            self.save_pipeline_cache()
+
+    def save_pipeline_cache(self) -> None:
+        """Record the in-memory tables as the pipeline's stage outputs so the next start skips them."""
+        cache = pipeline.load_cache()
+        updated_fp = pipeline.frame_fingerprint(self.updated)
+        cleaned_fp = pipeline.frame_fingerprint(self.cleaned)
+        cache["update"] = {"key": pipeline.update_key(), "fingerprint": updated_fp}
+        cache["clean"] = {"key": pipeline.clean_key(updated_fp), "fingerprint": cleaned_fp}
+        if pipeline.label_complete(self.labeled):
+            cache["label"] = {
+                "key": pipeline.label_key(cleaned_fp),
+                "fingerprint": pipeline.frame_fingerprint(self.labeled),
+            }
+        else:
+            cache.pop("label", None)
+        cache.pop("analysis", None)
+        pipeline.save_cache(cache)
+
+    def scan(self) -> tuple[list[str], list[str], dict]:
+        """New or changed Alipay and WeChat files, and the manifest entries after ingesting them."""
+        manifest = update.load_manifest()
+        alipay_files, alipay_entries = update.scan_changes(update.list_statement_files(update.ALIPAY_DIR), manifest)
+        wechat_files, wechat_entries = update.scan_changes(update.list_statement_files(update.WECHAT_DIR), manifest)
+        return alipay_files, wechat_files, {**alipay_entries, **wechat_entries}
+
+    def ingest(self) -> int:
+        """Parse, clean, label and report the statements that changed; return the number of new rows."""
+        with span("watch.scan") as step:
+            alipay_files, wechat_files, entries = self.scan()
+            step.metrics["changed_files"] = len(alipay_files) + len(wechat_files)
+        if not alipay_files and not wechat_files:
+            return 0
+        started = time.perf_counter()
+        with span("watch.ingest") as step:
+            # 只有一两个新文件，在当前进程解析比启动进程池更快
+            frames = [
+                update.process_alipay(alipay_files, max_workers=1, export=False),
+                update.process_wechat(wechat_files, max_workers=1, export=False),
+            ]
+            new = ensure_keys(pd.concat([f for f in frames if f is not None], ignore_index=True))
+            step.rows_in = len(new)
+            # 受影响的日期包括新行的日期，以及被替换的旧行原来的日期
+            replaced = self.updated[KEY_COLUMN].isin(new[KEY_COLUMN])
+            dates = pd.concat([new["Date"], self.updated.loc[replaced, "Date"]]).drop_duplicates()
+            # 新行只会替换这些日期上的旧行，upsert 与排序都只在这几天的数据上进行
+            on_days = self.updated["Date"].isin(dates)
+            days = upsert_rows(self.updated[on_days], new).sort_values(
+                ["Date", "Time"], kind="stable", ignore_index=True
+            )
+            added = len(days) - int(on_days.sum())
+            marks = reconcile.match_marks(self.updated)
+            self.updated, self.matches = reconcile.reconcile(replace_dates(self.updated, dates, days))
+            # 新行可能与其他日期上另一平台的记录配对（或解除配对），这些日期也要重新清洗
+            changed = {key for key, *_ in marks ^ reconcile.match_marks(self.updated)}
+            dates = pd.concat([
+                dates, self.updated.loc[self.updated[KEY_COLUMN].isin(changed), "Date"]
+            ]).drop_duplicates()
+            days = self.updated[self.updated["Date"].isin(dates)]
+
+            cleaned = clean.clean_frame(days)
+            self.cleaned = replace_dates(self.cleaned, dates, cleaned)
+            self.labeled = replace_dates(self.labeled, dates, self.label(cleaned))
+            step.rows_out = len(cleaned)
+            step.metrics.update(days=len(dates), new_rows=added)
+
+        # 报告只依赖内存中的数据，先于写出各阶段文件刷新
+        self.report()
+        reported = time.perf_counter() - started
+        with span("watch.write", len(self.labeled)):
+            write_table(self.updated, update.UPDATED_PATH)
+            write_table(self.matches, reconcile.MATCHES_PATH)
+            write_table(self.cleaned, clean.OUTPUT_PATH)
+            write_table(self.labeled, label.LABELED_PATH)
+            # 标签已写入数据集后才清空日志；manifest 最后保存，中途退出时下次启动会重新导入这些文件
+            LabelJournal(LABEL_JOURNAL_PATH).clear()
+            update.save_manifest(entries)
+        self.ingested = True
+        print(
+            f"Ingested {len(alipay_files) + len(wechat_files)} file(s): {added} new rows, "
+            f"{len(dates)} day(s) refreshed; report ready in {reported:.2f}s, "
+            f"tables saved in {time.perf_counter() - started:.2f}s."
+        )
+        return added
+
+    def label(self, rows: pd.DataFrame) -> pd.DataFrame:
+        """Label re-cleaned rows, reusing labels from the in-memory table and the journal."""
+        known = self.labeled[self.labeled[KEY_COLUMN].isin(rows[KEY_COLUMN])]
+        rows = label.merge_labeled(rows.copy(), known)
+        rows = label.merge_labeled(rows, replay_journal(LABEL_JOURNAL_PATH))
+        return label.label_transactions(
+            rows,
+            output_path=None,
+            cache=self.cache,
+            classifier=self.classifier,
+            classifier_threshold=self.classifier_threshold,
+        )
+
+    def report(self) -> Path:
+        """Rebuild the report (or the per-period reports and index) from the labeled table."""
+        frame = analysis.compact_transactions(self.labeled[analysis.ANALYSIS_COLUMNS].copy())
+        cleaned = analysis.clean_transactions(frame)
+        if self.every:
+            return analysis.run_batch_analysis(
+                cleaned, self.every, self.plots_dir, start=self.start, end=self.end, **self.report_options
+            )
+        return analysis.run_analysis(cleaned, self.start, self.end, self.plots_dir, **self.report_options)
+
+    def watch(self, interval: float = 1.0, debounce: float = 2.0) -> None:
+        """Poll the statement directories until interrupted.
+
+        A change is ingested once the files have stopped changing for
+        ``debounce`` seconds, so a burst of exports (or a file still being
+        copied) is handled in one pass.
+        """
+        seen = statement_signature()
+        settle_at = None
+        print(f"Watching {update.ALIPAY_DIR} and {update.WECHAT_DIR} (Ctrl-C to stop).")
+        while True:
+            time.sleep(interval)
+            signature = statement_signature()
+            now = time.monotonic()
+            if signature != seen:
+                seen = signature
+                settle_at = now + debounce
+            elif settle_at is not None and now >= settle_at:
+                settle_at = None
+                try:
+                    self.ingest()
+                except Exception as e:
+                    # 例如文件尚未写完整；不保存 manifest，文件再次变化时重试
+                    print(f"Ingest failed: {e}")
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Watch the statement folders and keep the tables and report up to date."
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=1.0,
+        help="Seconds between polls of the statement folders (default: 1).",
+    )
+    parser.add_argument(
+        "--debounce",
+        type=float,
+        default=2.0,
+        help="Seconds the folders must stay unchanged before new files are ingested (default: 2).",
+    )
+    parser.add_argument(
+        "--period",
+        nargs=2,
+        metavar=("START", "END"),
+        help="Optional inclusive date range (YYYY-MM-DD) to limit the report.",
+    )
+    parser.add_argument(
+        "--every",
+        choices=list(analysis.PERIOD_FREQUENCIES),
+        help="Keep one report per month, quarter or year and an index page up to date.",
+    )
+    parser.add_argument(
+        "--plots-dir",
+        type=Path,
+        default=Path("Analysis/plots"),
+        help="Directory to store generated visuals.",
+    )
+    parser.add_argument(
+        "--no-plots",
+        action="store_true",
+        help="Write only the markdown summary without rendering charts.",
+    )
+    parser.add_argument(
+        "--plot-format",
+        choices=PLOT_FORMATS,
+        default="png",
+        help="Chart file format (default: png).",
+    )
+    parser.add_argument(
+        "--plot-workers",
+        type=int,
+        default=1,
+        help="Processes used to render charts (default: 1, in-process; only changed charts are drawn).",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Do not resolve or store labels in the merchant-level label cache.",
+    )
+    parser.add_argument(
+        "--no-classifier",
+        action="store_true",
+        help="Send every unlabeled row to the API instead of pre-labeling confident rows locally.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Processes used to parse statements in the start-up catch-up run (default: all CPU cores).",
+    )
+    add_profile_arguments(parser)
+    args = parser.parse_args(argv)
+    # 以服务方式运行时通常用 SIGTERM 停止，与 Ctrl-C 一样正常退出并写出 --profile 追踪
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    with profiled(args, "watch"):
+        # 启动时先运行一次完整流程，补上未运行期间放入的账单并确保各阶段文件存在
+        pipeline.run_pipeline(max_workers=args.workers, period=args.period, plots_dir=args.plots_dir)
+        watcher = Watcher(
+            period=args.period,
+            every=args.every,
+            plots_dir=args.plots_dir,
+            report_options={
+                "plots": not args.no_plots,
+                "plot_format": args.plot_format,
+                "plot_workers": args.plot_workers,
+            },
+            use_cache=not args.no_cache,
+            use_classifier=not args.no_classifier,
+        )
+        try:
+            watcher.watch(interval=args.interval, debounce=args.debounce)
+        except KeyboardInterrupt:
+            print("Stopped watching.")
+        finally:
+            watcher.close()
+
+
+if __name__ == "__main__":
+    main()